@@ -0,0 +1,12 @@
+"""
+Benchmarks for the blueliv package. They run against a local stub of the
+Blueliv API (see stub_server.py), so no token or network access is needed.
+
+Run any of them as a module from the repository root, for example:
+
+    python -m benchmarks.bench_transport
+
+bench_suite runs every route family against api_stub.py, the stub of the
+whole API, and saves its results to compare them between versions.
+
+"""
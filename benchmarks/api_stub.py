@@ -0,0 +1,239 @@
+"""
+An in-process stub of the Blueliv API serving the sparks, iocs, tags, users,
+malwares, crawl and search routes set in blueliv.configuration, with
+synthetic payloads of a configurable size and an injected latency:
+
+    with ApiStubServer(items=500, latency=0.02) as server:
+        sparks = SparksRequest(token='bench-token')
+        sparks._url = server.api_url
+        sparks.timeline(as_json=True)  # 500 sparks, after 20 ms
+
+Pages are encoded once per kind and kept, so the server does little work
+per request. It counts the requests, the body bytes sent and the CPU time
+of its handlers, to tell the cost of the client apart.
+
+"""
+import json
+import re
+import threading
+import time
+import typing
+
+from blueliv.configuration import (  # pylint: disable=E0401
+    VERSION, BASE_SPARKS_URL, BASE_SPARKS_TIMELINE_URL,
+    BASE_SPARKS_DISCOVER_URL, BASE_SPARKS_IOCS_URL, BASE_IOCS_URL,
+    BASE_IOCS_TYPES_URL, BASE_IOCS_TIMELINE_URL, BASE_IOCS_DISCOVER_URL,
+    BASE_TAGS_URL, BASE_TAGS_SPARKS_URL, BASE_TAGS_IOCS_URL, BASE_USERS_URL,
+    BASE_USERS_SPARKS_URL, BASE_USERS_IOCS_URL, BASE_CRAWL_URL,
+    BASE_MALWARES_URL, BASE_MALWARES_UPLOAD_URL, BASE_SEARCH_URL
+)
+
+from .payloads import (ioc_item, malware_item, spark_item, tag_item,
+                       user_item)
+from .stub_server import StubHandler, StubServer
+
+# (method, path, payload kind): '<id>' matches one path segment. The first
+# matching route wins, so fixed paths go before the '<id>' ones.
+ROUTES = (
+    ('GET', BASE_SPARKS_URL + BASE_SPARKS_TIMELINE_URL, 'sparks'),
+    ('GET', BASE_SPARKS_URL + BASE_SPARKS_DISCOVER_URL, 'sparks'),
+    ('GET', BASE_SPARKS_URL + '/<id>' + BASE_SPARKS_IOCS_URL, 'iocs'),
+    ('GET', BASE_SPARKS_URL + '/<id>', 'spark'),
+    ('POST', BASE_SPARKS_URL, 'spark'),
+    ('GET', BASE_IOCS_TYPES_URL, 'types'),
+    ('GET', BASE_IOCS_URL + BASE_IOCS_TIMELINE_URL, 'iocs'),
+    ('GET', BASE_IOCS_URL + BASE_IOCS_DISCOVER_URL, 'iocs'),
+    ('GET', BASE_TAGS_URL, 'tags'),
+    ('GET', BASE_TAGS_URL + '/<id>' + BASE_TAGS_SPARKS_URL, 'sparks'),
+    ('GET', BASE_TAGS_URL + '/<id>' + BASE_TAGS_IOCS_URL, 'iocs'),
+    ('GET', BASE_USERS_URL + '/<id>' + BASE_USERS_SPARKS_URL, 'sparks'),
+    ('GET', BASE_USERS_URL + '/<id>' + BASE_USERS_IOCS_URL, 'iocs'),
+    ('GET', BASE_USERS_URL + '/<id>', 'user'),
+    ('GET', BASE_MALWARES_URL, 'malwares'),
+    ('POST', BASE_MALWARES_URL + BASE_MALWARES_UPLOAD_URL, 'malware'),
+    ('GET', BASE_MALWARES_URL + '/<id>', 'malware'),
+    ('POST', BASE_CRAWL_URL, 'crawl'),
+    ('GET', BASE_SEARCH_URL + '/<id>', 'sparks'),
+)
+
+
+def compile_routes(routes: typing.Iterable = ROUTES,
+                   version: str = VERSION):
+    """
+    Compile the routes to regular expressions on the full request path.
+
+    :param routes: iterable of (method, path, kind) tuples.
+    :param version: the API version in the path prefix.
+    :return: list of (method, pattern, kind) tuples.
+    """
+    prefix = re.escape('/api/%s' % version)
+    compiled = []
+    for method, path, kind in routes:
+        pattern = re.escape(path).replace(re.escape('<id>'), '[^/]+')
+        compiled.append((method, re.compile('%s%s$' % (prefix, pattern)),
+                         kind))
+    return compiled
+
+
+def build_payload(kind: str, items: int):
+    """
+    The decoded payload of a kind: a list of items for the lists, a dict
+    for the single resources.
+
+    :param kind: the payload kind (a ROUTES kind).
+    :param items: the number of items in the lists.
+    :return: list or dict.
+    """
+    ids = range(1, items + 1)
+    if kind == 'sparks':
+        return [spark_item(item_id) for item_id in ids]
+    if kind == 'iocs':
+        return [ioc_item(item_id) for item_id in ids]
+    if kind == 'tags':
+        return [tag_item(item_id) for item_id in ids]
+    if kind == 'malwares':
+        return {'data': [malware_item(item_id) for item_id in ids],
+                'page': 1, 'pageSize': items}
+    if kind == 'crawl':
+        return {'data': [ioc_item(item_id) for item_id in ids]}
+    if kind == 'types':
+        return ['DOMAIN', 'FILE_HASH', 'IPv4', 'URL']
+    if kind == 'spark':
+        return spark_item(1)
+    if kind == 'user':
+        return user_item(1)
+    if kind == 'malware':
+        return malware_item(1)
+    raise Exception('Unknown payload kind: %s' % kind)
+
+
+class ApiStub:
+    """ApiStub holds the settings, the encoded payloads and the counters of
+    an ApiStubServer (shared by its handler threads).
+
+    Attributes:
+        items: the number of items in every list.
+
+        latency: the seconds waited before answering each request.
+
+    """
+
+    items: int = 100
+    latency: float = 0.0
+
+    def __init__(self, items: int = 100, latency: float = 0.0):
+        self.items = items
+        self.latency = latency
+        self.routes = compile_routes()
+        self._lock = threading.Lock()
+        self._payloads = {}
+        self._stats = {}
+        self.reset()
+
+    def route(self, method: str, path: str):
+        """
+        :param method: GET or POST.
+        :param path: the request path (without the query string).
+        :return: the payload kind, or None if no route matches.
+        """
+        for route_method, pattern, kind in self.routes:
+            if route_method == method and pattern.match(path):
+                return kind
+        return None
+
+    def payload(self, kind: str):
+        """
+        :param kind: the payload kind.
+        :return: bytes with the encoded payload.
+        """
+        body = self._payloads.get(kind, None)
+        if body is None:
+            body = json.dumps(build_payload(kind, self.items)).encode('utf-8')
+            self._payloads[kind] = body
+        return body
+
+    def record(self, size: int, cpu: float):
+        """
+        Count a request answered.
+
+        :param size: the body bytes sent.
+        :param cpu: the CPU seconds of the handler.
+        :return: nothing.
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['bytes'] += size
+            self._stats['cpu'] += cpu
+
+    def stats(self):
+        """
+        :return: dict with the requests, bytes and cpu (seconds) counted
+        since the last reset.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self):
+        """
+        Reset the counters.
+
+        :return: nothing.
+        """
+        with self._lock:
+            self._stats = {'requests': 0, 'bytes': 0, 'cpu': 0.0}
+
+
+class ApiStubHandler(StubHandler):
+    """
+    Answer the API routes with the payloads of the server ApiStub, after
+    its latency (404 for any other path).
+
+    """
+
+    def _answer(self, method: str):
+        api = self.server.api
+        if api.latency:
+            time.sleep(api.latency)
+        start = time.thread_time()
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length', 0) or 0)
+            if length:
+                self.rfile.read(length)
+
+        kind = api.route(method, self.path.split('?', 1)[0])
+        body = b'{"error": "Not found"}' if kind is None else api.payload(kind)
+        self.send_response(404 if kind is None else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        api.record(len(body), time.thread_time() - start)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a GET request."""
+        self._answer('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a POST request (the body is read and discarded)."""
+        self._answer('POST')
+
+
+class ApiStubServer(StubServer):
+    """
+    A StubServer answering the API routes (see ApiStub):
+
+        with ApiStubServer(items=100, latency=0.005) as server:
+            print(server.api_url, server.api.stats())
+
+    """
+
+    def __init__(self, items: int = 100, latency: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0):
+        super().__init__(handler=ApiStubHandler, host=host, port=port)
+        self.api = ApiStub(items=items, latency=latency)
+        self.httpd.api = self.api
+
+    @property
+    def api_url(self):
+        """The API url of the running server, as BASE_API_URL."""
+        return '%s/api/%s' % (self.base_url, VERSION)
@@ -0,0 +1,66 @@
+"""
+Measure the cost per megabyte of response of the available JSON codecs, and
+of the decode and encode round trip previous versions did for every response
+when as_json was False (now the body is returned as received).
+
+    python -m benchmarks.bench_codec [megabytes]
+
+"""
+import json
+import sys
+import time
+
+from blueliv.codec import CODECS, load_codec
+
+from .payloads import timeline_page
+
+
+def measure(function, data, repeat: int = 5):
+    """
+    The best time of several runs of function(data).
+
+    :param function: the callable to measure.
+    :param data: its argument.
+    :param repeat: the number of runs.
+    :return: seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(megabytes: float = 4):
+    """
+    Run the benchmark and print the milliseconds per megabyte.
+
+    :param megabytes: the approximate size of the test document.
+    :return: dict with the milliseconds per megabyte per scenario.
+    """
+    body = timeline_page(int(megabytes * 7200)).encode('utf-8')
+    size = len(body) / (1024 * 1024)
+    results = {}
+
+    for name in CODECS:
+        try:
+            codec = load_codec(name)
+        except ImportError:
+            continue
+        results['decode[%s]' % name] = measure(codec.loads, body) / size
+
+    results['round_trip[json]'] = measure(
+        lambda data: json.dumps(json.loads(data)), body) / size
+    results['passthrough'] = measure(
+        lambda data: data.decode('utf-8'), body) / size
+
+    print('document: %.2f MB' % size)
+    for name, seconds in results.items():
+        print('%-18s %8.2f ms/MB' % (name, seconds * 1000))
+    return results
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 4)
@@ -0,0 +1,100 @@
+"""
+Measure the cost of the structured logging: the time of a disabled event
+(the usual case) and the request rate against the local stub server with
+logging off, and on at DEBUG level (text and JSON lines, written to a null
+stream).
+
+    python -m benchmarks.bench_logging [requests]
+
+"""
+import io
+import logging
+import sys
+import time
+import timeit
+
+from blueliv.logs import configure_logging, log
+from blueliv.sparks import SparksRequest
+from blueliv.transport import BluelivTransport
+
+from .stub_server import StubServer
+
+
+class NullStream(io.TextIOBase):
+    """A text stream discarding everything written to it."""
+
+    def write(self, text):
+        return len(text)
+
+
+def event_cost(number: int = 1000000):
+    """
+    Nanoseconds per disabled log.debug call, and per call of an empty
+    function with the same arguments (the floor).
+
+    :return: tuple (log ns, floor ns).
+    """
+    def noop(event, **fields):  # pylint: disable=unused-argument
+        return None
+
+    url = 'https://community.blueliv.com/api/v1/sparks/timeline'
+    params = {'limit': 100}
+    cost = timeit.timeit(lambda: log.debug('request.prepared', method='GET',
+                                           url=url, params=params),
+                         number=number)
+    floor = timeit.timeit(lambda: noop('request.prepared', method='GET',
+                                       url=url, params=params),
+                          number=number)
+    return cost / number * 1e9, floor / number * 1e9
+
+
+def request_rate(server, requests: int):
+    """
+    Requests per second of SparksRequest.get against the stub server.
+
+    :return: float with the rate.
+    """
+    transport = BluelivTransport(coalesce=False, metrics=None)
+    sparks = SparksRequest(token='bench-token', transport=transport)
+    sparks._url = '%s/api/v1' % server.base_url  # pylint: disable=W0212
+    sparks.get('1')  # warm up: open the connection.
+    start = time.perf_counter()
+    for _ in range(requests):
+        sparks.get('1')
+    elapsed = time.perf_counter() - start
+    transport.close()
+    return requests / elapsed
+
+
+def run(requests: int = 2000):
+    """
+    Run every measure and print the results.
+
+    :param requests: the number of requests per scenario.
+    :return: dict with the results.
+    """
+    logger = logging.getLogger('blueliv')
+    results = {}
+
+    logger.setLevel(logging.WARNING)
+    cost, floor = event_cost()
+    results['disabled_event_ns'] = cost
+    print('disabled event: %.0f ns (empty call: %.0f ns)' % (cost, floor))
+
+    with StubServer() as server:
+        for scenario, log_format in (('off', None), ('text', 'text'),
+                                     ('json', 'json')):
+            if log_format is None:
+                logger.setLevel(logging.WARNING)
+            else:
+                configure_logging(logging.DEBUG, log_format, NullStream())
+            rate = request_rate(server, requests)
+            results[scenario] = rate
+            print('logging %-4s: %8.0f requests/s' % (scenario, rate))
+
+    configure_logging(logging.WARNING, 'text', sys.stderr)
+    return results
+
+
+if __name__ == '__main__':
+    run(*(int(argument) for argument in sys.argv[1:2]))
@@ -0,0 +1,72 @@
+"""
+Compare the memory used to hold IoCs as decoded dicts against BluelivIOC
+models (with __slots__) and a columnar IocBatch, and the time to build them
+with from_list.
+
+    python -m benchmarks.bench_models [items]
+
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from blueliv.iocs import BluelivIOC, IocBatch
+
+from .payloads import ioc_item, timeline_page
+
+
+def held_memory(function):
+    """
+    Measure the memory still held by the result of function.
+
+    :param function: the callable to measure.
+    :return: bytes.
+    """
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def elapsed(function):
+    """
+    Measure the time to run function.
+
+    :param function: the callable to measure.
+    :return: seconds.
+    """
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run(items: int = 200000):
+    """
+    Run both scenarios and print the bytes per IoC.
+
+    :param items: the number of IoCs.
+    :return: dict with the bytes per IoC per scenario.
+    """
+    body = timeline_page(items, ioc_item)
+    scenarios = {
+        'dicts': lambda: json.loads(body),
+        'models': lambda: BluelivIOC.from_list(json.loads(body)),
+        'batch': lambda: IocBatch.from_list(json.loads(body))
+    }
+
+    results = {}
+    for name, scenario in scenarios.items():
+        results[name] = held_memory(scenario) / items
+        print('%-7s %8.1f bytes/IoC, built in %7.1f ms' % (
+            name, results[name], elapsed(scenario) * 1000))
+    for name in ('models', 'batch'):
+        print('%s use %.0f%% of the dicts memory'
+              % (name, 100 * results[name] / results['dicts']))
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,74 @@
+"""
+Measure the throughput (MB/s) of the IocScanner over synthetic proxy logs,
+for growing numbers of IoC patterns.
+
+    python -m benchmarks.bench_scanner [megabytes]
+
+"""
+import random
+import sys
+import time
+
+from blueliv.scanner import IocScanner
+
+
+def proxy_log(megabytes: float, domains: list, seed: int = 7):
+    """
+    Synthetic proxy log lines, a few of them with known domains.
+
+    :param megabytes: the approximate size.
+    :param domains: the known domains.
+    :param seed: the random seed.
+    :return: bytes with the log.
+    """
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        if rng.random() < 0.01:
+            host = 'www.%s' % rng.choice(domains)
+        else:
+            host = 'cdn%d.example-%d.org' % (rng.randrange(100),
+                                             rng.randrange(10000))
+        line = ('1604484000.%03d 10.0.%d.%d TCP_MISS/200 %d GET '
+                'http://%s/static/app.js?v=%d - DIRECT/203.0.113.5 '
+                'application/javascript\n'
+                % (rng.randrange(1000), rng.randrange(256), rng.randrange(256),
+                   rng.randrange(100000), host, rng.randrange(1000)))
+        lines.append(line)
+        size += len(line)
+    return ''.join(lines).encode('ascii')
+
+
+def run(megabytes: float = 4, sizes=(100, 10000, 100000)):
+    """
+    Scan the log with scanners of several sizes and print the MB/s.
+
+    :param megabytes: the log size.
+    :param sizes: the numbers of DOMAIN patterns.
+    :return: dict with the MB/s per number of patterns.
+    """
+    results = {}
+    for patterns in sizes:
+        domains = ['malicious-%d.example.com' % index
+                   for index in range(patterns)]
+        log = proxy_log(megabytes, domains)
+
+        start = time.perf_counter()
+        scanner = IocScanner({'type': 'DOMAIN', 'content': domain}
+                             for domain in domains)
+        scanner.scan(b'')
+        built = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matches = scanner.scan(log)
+        elapsed = time.perf_counter() - start
+
+        results[patterns] = len(log) / (1024 * 1024) / elapsed
+        print('%7d patterns: %6.2f MB/s, %6d matches (built in %.2f s)'
+              % (patterns, results[patterns], len(matches), built))
+    return results
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 4)
@@ -0,0 +1,102 @@
+"""
+Compare time to first item and peak memory of buffered pages (the whole body
+is read and decoded at once) against streamed ones (items decoded while the
+body is received), for growing page sizes.
+
+    python -m benchmarks.bench_streaming [items ...]
+
+"""
+import sys
+import time
+import tracemalloc
+
+from blueliv import codec
+from blueliv.pagination import extract_items
+from blueliv.streaming import iter_response_items
+from blueliv.transport import BluelivTransport
+
+from .payloads import spark_item, timeline_page
+from .stub_server import StubHandler, StubServer
+
+
+class PageHandler(StubHandler):
+    """
+    Answer GET requests with a timeline page of ?limit= sparks.
+
+    """
+
+    pages: dict = {}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a GET request with a pre-built page."""
+        limit = int(self.path.rsplit('=', 1)[-1])
+        if limit not in self.pages:
+            self.pages[limit] = timeline_page(limit, spark_item).encode()
+        body = self.pages[limit]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def buffered(transport, url):
+    """Read and decode the whole page, then walk its items."""
+    return iter(extract_items(codec.loads(transport.get(url).content)))
+
+
+def streamed(transport, url):
+    """Decode the items while the page is received."""
+    return iter_response_items(transport.get(url, stream=True))
+
+
+def measure(scenario, transport, url):
+    """
+    Time to first item and total time of a scenario, and its peak memory
+    (in a second, traced, run).
+
+    :return: tuple (first item seconds, total seconds, peak bytes).
+    """
+    start = time.perf_counter()
+    items = scenario(transport, url)
+    next(items)
+    first = time.perf_counter() - start
+    for _ in items:
+        pass
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in scenario(transport, url):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def run(sizes=(1000, 10000, 50000)):
+    """
+    Run both scenarios for every page size and print the results.
+
+    :param sizes: the page sizes (items).
+    :return: dict with the results per (scenario, size).
+    """
+    results = {}
+    with StubServer(handler=PageHandler) as server:
+        transport = BluelivTransport()
+        for size in sizes:
+            url = '%s/api/v1/sparks/timeline?limit=%d' % (server.base_url,
+                                                          size)
+            transport.get(url)  # warm up: build the page.
+            for scenario in (buffered, streamed):
+                first, total, peak = measure(scenario, transport, url)
+                results[(scenario.__name__, size)] = (first, total, peak)
+                print('%-9s %6d items: first item %8.2f ms, total %8.2f ms,'
+                      ' peak %8.2f MB' % (scenario.__name__, size,
+                                          first * 1000, total * 1000,
+                                          peak / (1024 * 1024)))
+        transport.close()
+    return results
+
+
+if __name__ == '__main__':
+    run(tuple(int(size) for size in sys.argv[1:]) or (1000, 10000, 50000))
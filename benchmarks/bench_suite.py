@@ -0,0 +1,338 @@
+"""
+Benchmark suite of the request classes against the in-process API stub
+(api_stub.py): one scenario per route family (sparks, iocs, tags, users,
+malwares, crawl and search), each run one call at a time (sync) and with
+bounded concurrency (concurrent, blueliv.fanout.bounded_map).
+
+For every scenario and path it measures the calls per second, the p50/p99
+latency, the peak memory per decoded item and the client CPU time per MB
+received (the CPU time of the stub handlers is subtracted). The results
+are saved as JSON, and a previous file can be given to report regressions:
+
+    python -m benchmarks.bench_suite --items 500 --latency 20
+    python -m benchmarks.bench_suite --output before.json
+    python -m benchmarks.bench_suite --compare before.json
+
+It exits with status 1 if any metric regressed more than --threshold.
+
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from blueliv.crawl import CrawlerRequest
+from blueliv.fanout import bounded_map
+from blueliv.iocs import IocsRequest
+from blueliv.malwares import MalwaresRequest
+from blueliv.pagination import extract_items
+from blueliv.sparks import SparksRequest
+from blueliv.tags import TagsRequest
+from blueliv.transport import BluelivTransport
+from blueliv.users import UsersRequest
+
+from .api_stub import ApiStubServer
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), 'results')
+
+# (scenario, request class, call): every call decodes the whole page.
+SCENARIOS = (
+    ('sparks.timeline', SparksRequest,
+     lambda client, items: client.timeline(limit=items, as_json=True)),
+    ('iocs.timeline', IocsRequest,
+     lambda client, items: client.timeline(limit=items, as_json=True)),
+    ('tags.list_sparks', TagsRequest,
+     lambda client, items: client.list_sparks('mafia', limit=items,
+                                              as_json=True)),
+    ('users.list_iocs', UsersRequest,
+     lambda client, items: client.list_iocs('analyst', limit=items,
+                                            as_json=True)),
+    ('malwares.list', MalwaresRequest,
+     lambda client, items: client.list(page=1, page_size=items,
+                                       as_json=True)),
+    ('crawl.crawl', CrawlerRequest,
+     lambda client, items: client.crawl('https://example.com/',
+                                        as_json=True)),
+    ('sparks.search', SparksRequest,
+     lambda client, items: client.search('emotet', limit=items)),
+)
+
+# Metric: True if a higher value is better.
+METRICS = (('calls_per_sec', True), ('p50_ms', False), ('p99_ms', False),
+           ('cpu_ms_per_mb', False), ('memory_per_item', False))
+
+
+def percentile(values: list, fraction: float):
+    """
+    :param values: the measured values.
+    :param fraction: the percentile, between 0 and 1.
+    :return: the nearest rank percentile (0.0 if there are no values).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def timed(call):
+    """
+    :param call: the callable to run.
+    :return: tuple (seconds, result).
+    """
+    start = time.perf_counter()
+    result = call()
+    return time.perf_counter() - start, result
+
+
+def memory_per_item(call):
+    """
+    The peak memory traced during one call, per item decoded.
+
+    :param call: the callable returning the decoded page.
+    :return: float with the bytes per item.
+    """
+    tracemalloc.start()
+    try:
+        result = call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak / max(1, len(extract_items(result)))
+
+
+def measure(server, call, calls: int, workers: int = 0):
+    """
+    Run calls requests, one at a time (workers=0) or with up to workers in
+    flight.
+
+    :return: dict with the metrics of the path.
+    """
+    server.api.reset()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    if workers:
+        latencies = []
+        for _, (latency, _), error in bounded_map(lambda _: timed(call),
+                                                  range(calls),
+                                                  workers=workers,
+                                                  ordered=False):
+            if error is not None:
+                raise error
+            latencies.append(latency)
+    else:
+        latencies = [timed(call)[0] for _ in range(calls)]
+    elapsed = time.perf_counter() - start
+    stats = server.api.stats()
+    cpu = time.process_time() - cpu_start - stats['cpu']
+    megabytes = stats['bytes'] / 1e6
+    return {'calls_per_sec': calls / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1e3,
+            'p99_ms': percentile(latencies, 0.99) * 1e3,
+            'cpu_ms_per_mb': cpu * 1e3 / megabytes if megabytes else 0.0,
+            'megabytes': megabytes}
+
+
+def run_scenario(server, request_class, call, options):
+    """
+    Measure one scenario in both paths.
+
+    :return: dict with the items per page, the memory per item and the
+    metrics of the sync and concurrent paths.
+    """
+    transport = BluelivTransport(coalesce=False)
+    client = request_class(token='bench-token', transport=transport)
+    client._url = server.api_url  # pylint: disable=protected-access
+
+    def once():
+        return call(client, options.items)
+
+    once()  # warm up: open the connection and encode the payload.
+    results = {'items': options.items,
+               'memory_per_item': memory_per_item(once),
+               'sync': measure(server, once, options.calls),
+               'concurrent': measure(server, once, options.calls,
+                                     workers=options.workers)}
+    transport.close()
+    return results
+
+
+def describe_version():
+    """
+    :return: dict with the package version and the git revision (if any).
+    """
+    version = 'unknown'
+    try:
+        from importlib import metadata  # pylint: disable=C0415
+        version = metadata.version('blueliv-api')
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+    revision = None
+    try:
+        revision = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:  # pylint: disable=broad-except
+        pass
+    return {'version': version, 'revision': revision}
+
+
+def run(options):
+    """
+    Run the scenarios and print their metrics.
+
+    :param options: the parsed command line options.
+    :return: dict with the metadata and the results per scenario.
+    """
+    report = {'meta': dict(describe_version(),
+                           python=platform.python_version(),
+                           platform=platform.platform(),
+                           cpus=os.cpu_count(),
+                           date=datetime.datetime.now().isoformat(),
+                           items=options.items,
+                           latency_ms=options.latency,
+                           calls=options.calls,
+                           workers=options.workers),
+              'results': {}}
+
+    print('%-18s %-10s %10s %8s %8s %10s %10s' % (
+        'scenario', 'path', 'calls/s', 'p50 ms', 'p99 ms', 'cpu ms/MB',
+        'B/item'))
+    with ApiStubServer(items=options.items,
+                       latency=options.latency / 1e3) as server:
+        for name, request_class, call in SCENARIOS:
+            if options.only and not name.startswith(tuple(options.only)):
+                continue
+            results = run_scenario(server, request_class, call, options)
+            report['results'][name] = results
+            for path in ('sync', 'concurrent'):
+                metrics = results[path]
+                print('%-18s %-10s %10.1f %8.2f %8.2f %10.1f %10.0f' % (
+                    name, path, metrics['calls_per_sec'], metrics['p50_ms'],
+                    metrics['p99_ms'], metrics['cpu_ms_per_mb'],
+                    results['memory_per_item']))
+    return report
+
+
+def flatten(report: dict):
+    """
+    :param report: a saved report.
+    :return: dict with the value of every (scenario, path, metric).
+    """
+    values = {}
+    for name, results in report['results'].items():
+        values[(name, '', 'memory_per_item')] = results['memory_per_item']
+        for path in ('sync', 'concurrent'):
+            for metric, _ in METRICS:
+                if metric in results[path]:
+                    values[(name, path, metric)] = results[path][metric]
+    return values
+
+
+def compare(report: dict, baseline: dict, threshold: float):
+    """
+    Print the change of every metric against a baseline report.
+
+    :param report: the current report.
+    :param baseline: the previous report.
+    :param threshold: the relative change considered a regression (0.1 is
+    10% worse).
+    :return: list of (scenario, path, metric, change) regressions.
+    """
+    higher_is_better = dict(METRICS)
+    current = flatten(report)
+    previous = flatten(baseline)
+    regressions = []
+    meta = baseline['meta']
+    reference = meta.get('revision', None) or meta.get('version', None)
+    print('\nagainst %s (%s):' % (reference, meta.get('date', '')))
+    for option in ('items', 'latency_ms', 'calls', 'workers'):
+        if baseline['meta'].get(option, None) != report['meta'][option]:
+            print('warning: %s was %s (now %s)' % (
+                option, baseline['meta'].get(option, None),
+                report['meta'][option]))
+    for key in sorted(set(current) & set(previous)):
+        old, new = previous[key], current[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better[key[2]] else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions.append(key + (change,))
+        print('%-18s %-10s %-16s %12.2f %12.2f %+8.1f%%%s' % (
+            key + (old, new, change * 100, flag)))
+    return regressions
+
+
+def save(report: dict, path: str):
+    """
+    Write the report as JSON (creating the directory).
+
+    :return: the path written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+    return path
+
+
+def parse_arguments(arguments=None):
+    """
+    :param arguments: the command line arguments (sys.argv by default).
+    :return: the parsed options.
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_suite',
+                                     description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=100,
+                        help='items per page served by the stub')
+    parser.add_argument('--latency', type=float, default=5.0,
+                        help='latency injected per request (ms)')
+    parser.add_argument('--calls', type=int, default=200,
+                        help='calls per scenario and path')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='requests in flight in the concurrent path')
+    parser.add_argument('--only', action='append',
+                        help='run the scenarios starting with this name')
+    parser.add_argument('--output',
+                        help='where to save the results (default: '
+                             'benchmarks/results/<revision>.json)')
+    parser.add_argument('--compare',
+                        help='a previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change reported as a regression')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    """
+    Run the suite, save the results and compare them with a baseline.
+
+    :return: the exit status (1 if there are regressions).
+    """
+    options = parse_arguments(arguments)
+    report = run(options)
+
+    meta = report['meta']
+    output = options.output or os.path.join(
+        RESULTS_DIRECTORY, '%s.json' % (meta['revision'] or meta['version']))
+    print('\nsaved to %s' % save(report, output))
+
+    if options.compare:
+        with open(options.compare, 'r', encoding='utf-8') as handle:
+            baseline = json.load(handle)
+        if compare(report, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Compare the per call latency of module level requests.get (a new connection
+for each call) against the pooled keep-alive BluelivTransport.
+
+    python -m benchmarks.bench_transport [calls]
+
+"""
+import sys
+import time
+
+import requests
+
+from blueliv.transport import BluelivTransport
+
+from .stub_server import StubServer
+
+
+def run(calls: int = 500):
+    """
+    Run both scenarios and print the mean latency per call.
+
+    :param calls: the number of calls for each scenario.
+    :return: dict with the mean latency (seconds) per scenario.
+    """
+    results = {}
+    with StubServer() as server:
+        url = '%s/api/v1/sparks/timeline' % server.base_url
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            requests.get(url, headers={'Connection': 'close'})
+        results['new_connection'] = (time.perf_counter() - start) / calls
+
+        transport = BluelivTransport()
+        transport.get(url)  # warm up: open the pooled connection.
+        start = time.perf_counter()
+        for _ in range(calls):
+            transport.get(url)
+        results['pooled_transport'] = (time.perf_counter() - start) / calls
+        transport.close()
+
+    for name, latency in results.items():
+        print('%-18s %8.1f us/call' % (name, latency * 1e6))
+    gain = results['new_connection'] - results['pooled_transport']
+    print('%-18s %8.1f us/call' % ('gain', gain * 1e6))
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
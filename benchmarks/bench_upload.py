@@ -0,0 +1,97 @@
+"""
+Compare peak memory and time of a buffered multipart upload (the whole body
+is built in memory by requests) against a streamed one (blueliv.multipart),
+for growing sample sizes.
+
+    python -m benchmarks.bench_upload [megabytes ...]
+
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from blueliv.multipart import MultipartFile
+from blueliv.transport import BluelivTransport
+
+from .stub_server import StubHandler, StubServer
+
+
+class UploadHandler(StubHandler):
+    """
+    Answer POST requests with the number of bytes received, reading the body
+    in chunks.
+
+    """
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Read the body in chunks and answer with its size."""
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        received = 0
+        while received < length:
+            chunk = self.rfile.read(min(65536, length - received))
+            if not chunk:
+                break
+            received += len(chunk)
+        self._reply(200, {'received': received})
+
+
+def buffered(transport, url, path):
+    """Upload the sample as requests files (built in memory)."""
+    with open(path, 'rb') as sample:
+        return transport.post(url, files={'file': (path, sample)})
+
+
+def streamed(transport, url, path):
+    """Upload the sample as a streamed MultipartFile."""
+    with MultipartFile(path) as body:
+        return transport.post(url, data=body, headers=body.headers())
+
+
+def measure(scenario, transport, url, path):
+    """
+    Time and peak memory of an upload.
+
+    :return: tuple (seconds, peak bytes).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = scenario(transport, url, path)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if response.status_code != 200:
+        raise Exception('Upload failed [%d]' % response.status_code)
+    return elapsed, peak
+
+
+def run(sizes=(1, 16, 64)):
+    """
+    Upload samples of every size with both scenarios and print the results.
+
+    :param sizes: the sample sizes (MB).
+    :return: dict with the results per (scenario, size).
+    """
+    results = {}
+    with StubServer(handler=UploadHandler) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        transport = BluelivTransport()
+        url = '%s/api/v1/malwares/upload' % server.base_url
+        for size in sizes:
+            path = os.path.join(directory, 'sample-%d.bin' % size)
+            with open(path, 'wb') as sample:
+                for _ in range(size):
+                    sample.write(os.urandom(1024 * 1024))
+            for scenario in (buffered, streamed):
+                elapsed, peak = measure(scenario, transport, url, path)
+                results[(scenario.__name__, size)] = (elapsed, peak)
+                print('%-8s %4d MB: %8.2f ms, peak %8.2f MB'
+                      % (scenario.__name__, size, elapsed * 1000,
+                         peak / (1024 * 1024)))
+        transport.close()
+    return results
+
+
+if __name__ == '__main__':
+    run(tuple(int(size) for size in sys.argv[1:]) or (1, 16, 64))
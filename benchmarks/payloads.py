@@ -0,0 +1,106 @@
+"""
+Synthetic API payloads (sparks, IoCs, tags, users and malwares) for the
+benchmarks.
+
+"""
+import json
+
+
+def ioc_item(item_id: int):
+    """
+    A synthetic IoC as returned by the API.
+
+    :param item_id: the IoC id.
+    :return: dict with the IoC.
+    """
+    return {
+        'id': item_id,
+        'spark_id': item_id // 10,
+        'content': 'malicious-%d.example.com' % item_id,
+        'type': 'DOMAIN',
+        'subtype': None,
+        'created_at': '2020-11-04T10:%02d:%02dZ' % (item_id // 60 % 60,
+                                                    item_id % 60)
+    }
+
+
+def spark_item(item_id: int):
+    """
+    A synthetic spark as returned by the API.
+
+    :param item_id: the spark id.
+    :return: dict with the spark.
+    """
+    return {
+        'id': item_id,
+        'title': 'Spark number %d' % item_id,
+        'description': 'Campaign details for spark %d. ' % item_id * 3,
+        'tlp': 'green',
+        'created_at': '2020-11-04T10:00:00Z',
+        'likes_count': item_id % 7,
+        'source_url': ['https://example.com/report/%d' % item_id],
+        'tags': [{'slug': 'mafia'}, {'slug': 'phishing'}],
+        'iocs_counters': {'DOMAIN': 3, 'IPv4': 1},
+        'user': {'username': 'analyst'}
+    }
+
+
+def tag_item(item_id: int):
+    """
+    A synthetic tag as returned by the API.
+
+    :param item_id: the tag id.
+    :return: dict with the tag.
+    """
+    return {
+        'id': item_id,
+        'name': 'Tag %d' % item_id,
+        'slug': 'tag-%d' % item_id,
+        'sparks_count': item_id % 50
+    }
+
+
+def user_item(item_id: int):
+    """
+    A synthetic user as returned by the API.
+
+    :param item_id: the user id.
+    :return: dict with the user.
+    """
+    return {
+        'id': item_id,
+        'username': 'analyst%d' % item_id,
+        'first_name': 'Analyst',
+        'last_name': str(item_id),
+        'sparks_count': item_id % 30,
+        'badges': [{'name': 'hunter'}]
+    }
+
+
+def malware_item(item_id: int):
+    """
+    A synthetic malware sample as returned by the API.
+
+    :param item_id: the sample id.
+    :return: dict with the sample.
+    """
+    return {
+        'id': item_id,
+        'sha256': '%064x' % item_id,
+        'file_type': 'PE32',
+        'file_size': 1024 * (item_id % 512 + 1),
+        'status': 'ANALYZED',
+        'malicious': item_id % 3 == 0,
+        'upload_date': '2020-11-04T10:00:00Z'
+    }
+
+
+def timeline_page(items: int, item=ioc_item):
+    """
+    A JSON encoded page with items.
+
+    :param items: the number of items.
+    :param item: the callable building each item.
+    :return: str with the JSON document.
+    """
+    return json.dumps([item(item_id) for item_id in range(1, items + 1)])
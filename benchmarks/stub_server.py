@@ -0,0 +1,84 @@
+"""
+A minimal, in-process HTTP/1.1 stub of the Blueliv API to run benchmarks
+without touching the real endpoint.
+
+The server keeps connections alive (HTTP/1.1), so it can be used to measure
+the cost of opening new connections against reusing pooled ones.
+
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Request handler answering every GET or POST with a small JSON document.
+
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately: without TCP_NODELAY, keep-alive
+    # connections stall on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silence the default stderr logging."""
+
+    def _reply(self, status: int, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a GET request."""
+        self._reply(200, {'path': self.path, 'data': [{'id': 1}]})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a POST request (the body is read and discarded)."""
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        if length:
+            self.rfile.read(length)
+        self._reply(200, {'path': self.path, 'data': []})
+
+
+class StubServer:
+    """
+    Run a StubHandler based server in a background thread. Use it as a
+    context manager:
+
+        with StubServer() as server:
+            print(server.base_url)
+
+    """
+
+    def __init__(self, handler=StubHandler, host: str = '127.0.0.1',
+                 port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+
+    @property
+    def base_url(self):
+        """The base url (scheme, host and port) of the running server."""
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        """Start serving in the background thread."""
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and release the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -2,6 +2,15 @@
 API classes and invocation methods are defined withing this package files.
 
 Modules:
+    aio.py: asyncio versions of every request class, sharing one connection
+    pool with a bounded number of requests in flight.
+
+    cache.py: opt-in response caches for the GET requests, in memory or
+    persistent (revalidated with conditional requests).
+
+    codec.py: the pluggable JSON codec used to decode responses (orjson,
+    ujson or the standard json).
+
     configuration.py: where we set configuration variables (settings). All
     values will have a default, configured for the project, and a value that
     will be extracted from the environment, if the environment variable does
@@ -13,13 +22,59 @@ Modules:
     crawl.py: module to use Blueliv API capabilities to crawl information on
     IoCs, Sparks and any interesting information related.
 
+    fanout.py: helpers to run many independent requests with a bounded number
+    of them in flight.
+
+    hooks.py: request lifecycle hooks (pre_request, post_response and
+    on_error) for tracing and profiling.
+
+    ingest.py: bulk upload of a directory of samples, hashed in a process pool
+    and de-duplicated against a local ledger and the server.
+
     iocs.py: module to search, discover and get details about IoCs.
 
     malwares.py: module to search, discover and get details on malware samples
 
+    logs.py: structured, levelled logging of the request events on the
+    standard logging module (text or JSON lines).
+
+    matching.py: a local index to match hashes, IPs, domains and urls
+    against the IoCs without a request per value.
+
+    metrics.py: per endpoint family metrics of the requests (latency
+    percentiles, bytes, status codes), exported as a snapshot or for
+    Prometheus.
+
+    mirror.py: a local SQLite mirror of sparks, IoCs, tags and malwares, with
+    indexed queries and offline search.
+
+    multipart.py: streamed multipart/form-data bodies, to upload samples of
+    any size with constant memory.
+
+    pagination.py: helpers to walk the since_id/limit feeds lazily, item by
+    item, prefetching the next page.
+
+    ratelimit.py: token bucket rate limiters shared by every instance using
+    the same token (and, optionally, by several processes).
+
+    retry.py: the retry policy (backoff, jitter, Retry-After and budget) for
+    the idempotent requests.
+
+    scanner.py: a multi-pattern (Aho-Corasick) scanner to find URL and domain
+    IoCs in raw text.
+
     sparks.py: module to search, discover and even publish spark details.
 
+    streaming.py: incremental parsing of feed pages, decoding items while the
+    response is received.
+
+    sync.py: incremental sync of the since_id feeds, resuming each one from a
+    durable checkpoint.
+
     tags.py: module to search by tag.
 
+    transport.py: the pooled HTTP session (keep-alive connections) shared by
+    all the request classes.
+
     users.py: to retrieve user information.
 """
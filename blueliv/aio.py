@@ -0,0 +1,679 @@
+"""
+Asyncio clients for the Blueliv API, to be used next to other asyncio code
+without wrapping the blocking request classes in threads.
+
+Every Async*Request class mirrors its blocking counterpart (same methods and
+parameters), but the methods are coroutines:
+
+    sparks = AsyncSparksRequest(token=token)
+    timeline = await sparks.timeline(limit=10)
+
+All instances share one AsyncBluelivTransport (an aiohttp.ClientSession with a
+pooled connector) that bounds the number of requests in flight with a
+semaphore, so a single event loop can safely keep hundreds of requests going.
+
+aiohttp is an optional dependency (pip install blueliv-api[async]).
+
+"""
+import asyncio
+import collections
+import time
+import typing
+
+try:
+    import aiohttp
+except ModuleNotFoundError:
+    aiohttp = None  # pylint: disable=C0103
+
+from . import codec, hooks
+from .cache import SQLiteHTTPCache, cache_key
+from .configuration import (ASYNC_CONCURRENCY, COALESCE, FANOUT_WORKERS,
+                            HTTP_CACHE_PATH)
+from .core import BluelivRequest
+from .crawl import CrawlerRequest, CrawlResult, unique_terms
+from .fanout import abounded_map
+from .iocs import IocsRequest
+from .logs import log
+from .malwares import MalwaresRequest
+from .metrics import get_default_metrics
+from .pagination import aiter_numbered_pages, aiter_pages
+from .retry import RetryPolicy
+from .transport import endpoint_family
+from .sparks import SparkIocs, SparksRequest, unique_ids
+from .tags import TagsRequest
+from .users import UsersRequest
+
+
+class AsyncResponse:  # pylint: disable=too-few-public-methods
+    """
+    A fully read response from the asyncio transport. It exposes the same
+    attributes BluelivRequest uses from requests.Response.
+
+    """
+
+    status_code: int = 0
+    content: bytes = b''
+    headers: typing.Optional[dict] = None
+
+    def __init__(self, status_code: int, content: bytes, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        """
+        Decode the response body.
+
+        :return: the decoded JSON document.
+        """
+        return codec.loads(self.content)
+
+
+class AsyncBluelivTransport:
+    """AsyncBluelivTransport keeps an aiohttp.ClientSession with a pooled
+    connector shared by the asyncio clients.
+
+    Attributes:
+        concurrency: the maximum number of requests in flight at the same
+        time. Other requests wait for a free slot.
+
+        pool_maxsize: the maximum number of connections kept in the pool.
+
+        session: the aiohttp.ClientSession (created on first use, inside the
+        running event loop).
+
+        cache: an optional ResponseCache for the GET requests (see
+        blueliv.cache).
+
+        http_cache: an optional SQLiteHTTPCache, to revalidate GET responses
+        stored in previous runs. If BLUELIV_API_HTTP_CACHE_PATH is set, it is
+        created there by default (as in BluelivTransport).
+
+        retry: the RetryPolicy for failed requests (None disables retries).
+
+        coalesce: if True, concurrent identical GET requests share one
+        request in flight and all receive its response.
+
+        metrics: the MetricsRegistry recording every request (the shared one
+        by default, None records nothing).
+
+    """
+
+    concurrency: int = ASYNC_CONCURRENCY
+    pool_maxsize: int = ASYNC_CONCURRENCY
+    session = None
+    cache = None
+    http_cache = None
+    retry = None
+    coalesce: bool = COALESCE
+    metrics = None
+
+    def __init__(self, **kwargs):
+        if aiohttp is None:
+            raise Exception('aiohttp is required for the asyncio clients '
+                            '(pip install blueliv-api[async])')
+
+        self.concurrency = ASYNC_CONCURRENCY
+        self.session = None
+        self.cache = None
+        self.http_cache = None
+        self.retry = RetryPolicy()
+        self.coalesce = COALESCE
+        self.metrics = get_default_metrics()
+        self._stats = collections.Counter()
+        self._semaphore = None
+        self._loop = None
+        self._session_guard = None
+        self._flights = {}
+
+        if 'concurrency' in kwargs:
+            self.concurrency = kwargs.get('concurrency', ASYNC_CONCURRENCY)
+
+        self.pool_maxsize = self.concurrency
+        if 'pool_maxsize' in kwargs:
+            self.pool_maxsize = kwargs.get('pool_maxsize', self.concurrency)
+
+        if 'cache' in kwargs:
+            self.cache = kwargs.get('cache', None)
+
+        if 'http_cache' in kwargs:
+            self.http_cache = kwargs.get('http_cache', None)
+        elif HTTP_CACHE_PATH:
+            self.http_cache = SQLiteHTTPCache(HTTP_CACHE_PATH)
+
+        if 'retry' in kwargs:
+            self.retry = kwargs.get('retry', None)
+
+        if 'coalesce' in kwargs:
+            self.coalesce = kwargs.get('coalesce', COALESCE)
+
+        if 'metrics' in kwargs:
+            self.metrics = kwargs.get('metrics', None)
+
+    async def _get_session(self):
+        """
+        Retrieve the session, creating it (and the semaphore) if there is
+        none for the running event loop.
+
+        A session only works in the loop it was created in, so each one is
+        closed when its loop shuts down (asyncio.run finalizes the pending
+        asynchronous generators before closing the loop), or right away if
+        its loop is still running in another thread.
+
+        :return: the aiohttp.ClientSession.
+        """
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed \
+                or self._loop is not loop:
+            if self.session is not None and not self.session.closed \
+                    and self._loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.session.close(),
+                                                 self._loop)
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize)
+            self.session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+            self._session_guard = self._close_on_shutdown(self.session)
+            await self._session_guard.asend(None)
+        return self.session
+
+    @staticmethod
+    async def _close_on_shutdown(session):
+        """
+        An asynchronous generator left suspended: the loop closes it when it
+        shuts down, and then the session is closed.
+
+        :param session: the aiohttp.ClientSession.
+        :return: an asynchronous generator.
+        """
+        try:
+            yield
+        finally:
+            if not session.closed:
+                await session.close()
+
+    @staticmethod
+    def _form_data(files: dict):
+        """
+        Convert a requests-like files dict into aiohttp.FormData.
+
+        :param files: dict as {'field': (filename, file_object)}.
+        :return: the aiohttp.FormData.
+        """
+        form = aiohttp.FormData()
+        for field, (filename, file_object) in files.items():
+            form.add_field(field, file_object, filename=filename)
+        return form
+
+    async def request(self, method: str, url: str, **kwargs):
+        """
+        Send a request, waiting for a free slot if the concurrency limit is
+        reached.
+
+        :param method: the HTTP method (GET, POST...).
+        :param url: the full url to connect to.
+        :param kwargs: headers, params, json, data, files or rate_limiter.
+        :return: an AsyncResponse with the body already read.
+        """
+        rate_limiter = kwargs.pop('rate_limiter', None)
+
+        cached = self.cache is not None or self.http_cache is not None
+        key = None
+        if method.upper() == 'GET' and (self.coalesce or cached):
+            key = cache_key(method,
+                            url,
+                            kwargs.get('params', None),
+                            kwargs.get('headers', None))
+
+        if key is not None and self.coalesce:
+            return await self._single_flight(key, method, url, rate_limiter,
+                                             **kwargs)
+        return await self._request(method, url, key, rate_limiter, **kwargs)
+
+    def observe(self, family: str, result, start: float):
+        """
+        Record a request sent to the network in the metrics registry, if
+        there is one (see BluelivTransport.observe).
+
+        :param family: the endpoint family.
+        :param result: the AsyncResponse (None if the request failed).
+        :param start: the time.perf_counter() when it started.
+        :return: nothing.
+        """
+        if self.metrics is None:
+            return
+
+        elapsed = time.perf_counter() - start
+        if result is None:
+            self.metrics.observe(family, None, elapsed)
+        else:
+            self.metrics.observe(family, result.status_code, elapsed,
+                                 len(result.content or b''))
+
+    def count(self, name: str, value: int = 1,
+              family: typing.Optional[str] = None):
+        """
+        Increment a counter in the transport stats (and in the metrics of
+        the family, if it is set).
+
+        :param name: the counter name.
+        :param value: the increment.
+        :param family: the endpoint family of the request.
+        :return: nothing.
+        """
+        self._stats[name] += value
+        if family is not None and self.metrics is not None:
+            self.metrics.increment(name, family, value)
+
+    async def _single_flight(self, key, method: str, url: str,
+                             rate_limiter=None, **kwargs):
+        """
+        Send a request, unless an identical one is already in flight: then
+        wait for it and return its response (or raise its exception).
+
+        The request runs in its own task, shared by every caller: a caller
+        cancelled stops waiting without cancelling the others, and the
+        request is only cancelled when nobody waits for it.
+
+        :return: an AsyncResponse with the body already read.
+        """
+        flight = self._flights.get(key, None)
+        if flight is None:
+            task = asyncio.ensure_future(self._request(method, url, key,
+                                                       rate_limiter, **kwargs))
+            flight = self._flights[key] = {'task': task, 'waiters': 0}
+            task.add_done_callback(
+                lambda done: self._end_flight(key, flight))
+        else:
+            self.count('coalesced', family=endpoint_family(url))
+
+        flight['waiters'] += 1
+        try:
+            return await asyncio.shield(flight['task'])
+        finally:
+            flight['waiters'] -= 1
+            if not flight['waiters'] and not flight['task'].done():
+                self._end_flight(key, flight)
+                flight['task'].cancel()
+
+    def _end_flight(self, key, flight: dict):
+        """
+        Forget a flight, so the next identical request is sent again.
+
+        :param key: the request key (see cache_key).
+        :param flight: the flight (its task and number of waiters).
+        :return: nothing.
+        """
+        if self._flights.get(key, None) is flight:
+            del self._flights[key]
+        task = flight['task']
+        if task.done() and not task.cancelled():
+            # Retrieved, so there is no warning if nobody was waiting.
+            task.exception()
+
+    async def _request(self,  # pylint: disable=too-many-arguments
+                       method: str,
+                       url: str,
+                       key,
+                       rate_limiter=None,
+                       **kwargs):
+        """
+        Serve a request from the caches or send it.
+
+        :return: an AsyncResponse with the body already read.
+        """
+        if key is not None and self.cache is not None:
+            response = self.cache.get(key)
+            if response is not None:
+                self.count('cache_hits', family=endpoint_family(url))
+                return response
+
+        stored = None
+        if key is not None and self.http_cache is not None:
+            stored = self.http_cache.get(key)
+            if stored is not None:
+                headers = dict(kwargs.get('headers', None) or {})
+                headers.update(self.http_cache.conditional_headers(stored))
+                kwargs['headers'] = headers
+
+        if kwargs.get('files'):
+            kwargs['data'] = self._form_data(kwargs.pop('files'))
+
+        if kwargs.get('params'):
+            kwargs['params'] = {key: str(value)
+                                for key, value in kwargs['params'].items()}
+
+        family = endpoint_family(url)
+        start = time.perf_counter()
+        try:
+            result = await self._send(method, url, rate_limiter, **kwargs)
+        except Exception:
+            self.observe(family, None, start)
+            raise
+        self.observe(family, result, start)
+
+        if stored is not None and result.status_code == 304:
+            result = AsyncResponse(200, stored['body'], stored['headers'])
+            self.http_cache.hit()
+            self.count('revalidated', family=family)
+        elif self.http_cache is not None and key is not None \
+                and result.status_code == 200:
+            self.http_cache.set(key, url, result.headers, result.content)
+
+        if self.cache is not None and key is not None \
+                and result.status_code == 200:
+            self.cache.set(key, result)
+        return result
+
+    async def _send(self, method: str, url: str, rate_limiter=None,
+                    **kwargs):
+        """
+        Send a request, waiting for a free slot, and retry it as the retry
+        policy allows (a slot is not held while waiting between attempts).
+
+        :return: an AsyncResponse with the body already read.
+        """
+        session = await self._get_session()
+        self.count('requests')
+        family = endpoint_family(url)
+        retry = 0
+        waited = 0.0
+        while True:
+            if rate_limiter is not None:
+                if rate_limiter.directory:
+                    # File buckets lock and rewrite a file: outside the loop.
+                    delay = await asyncio.get_running_loop().run_in_executor(
+                        None, rate_limiter.reserve, family)
+                else:
+                    delay = rate_limiter.reserve(family)
+                if delay > 0:
+                    self.count('rate_limited', family=family)
+                    await asyncio.sleep(delay)
+
+            self.count('attempts', family=family)
+            try:
+                async with self._semaphore:
+                    async with session.request(method, url,
+                                               **kwargs) as response:
+                        content = await response.read()
+                        result = AsyncResponse(response.status,
+                                               content,
+                                               response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                delay = None
+                if self.retry is not None \
+                        and self.retry.is_retryable(method, None):
+                    delay = self.retry.next_delay(retry, waited)
+                if delay is None:
+                    self.count('errors', family=family)
+                    raise
+            else:
+                if self.retry is None \
+                        or not self.retry.is_retryable(method,
+                                                       result.status_code):
+                    return result
+
+                delay = self.retry.next_delay(
+                    retry, waited, result.headers.get('Retry-After', None))
+                if delay is None:
+                    self.count('retry_giveups', family=family)
+                    return result
+
+            self.count('retries', family=family)
+            log.info('request.retry', method=method, url=url,
+                     attempt=retry + 1, delay=delay)
+            await asyncio.sleep(delay)
+            waited += delay
+            retry += 1
+
+    def stats(self):
+        """
+        The transport counters (see BluelivTransport.stats).
+
+        :return: dict with the counters.
+        """
+        stats = {name: self._stats[name]
+                 for name in ('requests', 'attempts', 'retries',
+                              'retry_giveups', 'errors', 'rate_limited',
+                              'coalesced')}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if self.http_cache is not None:
+            stats['http_cache'] = self.http_cache.stats()
+        return stats
+
+    async def close(self):
+        """
+        Close the session and every pooled connection.
+
+        :return: nothing.
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_DEFAULT_ASYNC_TRANSPORT: typing.Optional[AsyncBluelivTransport] = None
+
+
+def get_default_async_transport():
+    """
+    Retrieve the transport shared by all asyncio clients that did not
+    receive an explicit one. It is created on first use.
+
+    :return: the shared AsyncBluelivTransport.
+    """
+    global _DEFAULT_ASYNC_TRANSPORT  # pylint: disable=global-statement
+
+    if _DEFAULT_ASYNC_TRANSPORT is None:
+        _DEFAULT_ASYNC_TRANSPORT = AsyncBluelivTransport()
+    return _DEFAULT_ASYNC_TRANSPORT
+
+
+def set_default_async_transport(transport: AsyncBluelivTransport):
+    """
+    Replace the transport shared by the asyncio clients (for example, to set
+    a different concurrency).
+
+    :param transport: the new AsyncBluelivTransport to share.
+    :return: the previous shared transport (or None).
+    """
+    global _DEFAULT_ASYNC_TRANSPORT  # pylint: disable=global-statement
+
+    previous = _DEFAULT_ASYNC_TRANSPORT
+    _DEFAULT_ASYNC_TRANSPORT = transport
+    return previous
+
+
+class AsyncRequestMixin:
+    """
+    Mixin that turns a request class into an asyncio one: request (and so
+    every method built on it) returns a coroutine.
+
+    It must be placed before the blocking class in the bases list.
+
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, **kwargs):
+        if kwargs.get('transport', None) is None:
+            kwargs['transport'] = get_default_async_transport()
+        super().__init__(**kwargs)
+
+    async def request(self, **kwargs):  # pylint: disable=W0236
+        """
+        Asyncio version of BluelivRequest.request, with the same parameters.
+
+        :return: dict or JSON (if as_json ==  True) with the results.
+        """
+        method, url, call_kwargs, output = self._prepare_request(**kwargs)
+        if call_kwargs.get('stream', False) is True:
+            raise Exception('stream is not supported by the asyncio clients')
+
+        self.request_count += 1
+        context = self._start_hooks(method, url, call_kwargs)
+        try:
+            res = await self._transport.request(method, url, **call_kwargs)
+            if context is not None:
+                hooks.add_response(context, res)
+            results = self._process_response(url, res, **output)
+        except Exception as exception:
+            if context is not None:
+                hooks.run_hooks(hooks.ON_ERROR,
+                                hooks.add_error(context, exception),
+                                self._hooks)
+            raise
+
+        if context is not None:
+            hooks.run_hooks(hooks.POST_RESPONSE, context, self._hooks)
+        return results
+
+    async def search(self, *args, **kwargs):  # pylint: disable=W0236
+        """
+        Asyncio version of BluelivRequest.search (answered from the mirror,
+        if there is one).
+
+        :return: the results as list or JSON.
+        """
+        results = super().search(*args, **kwargs)
+        if self.mirror is None:
+            results = await results
+        return results
+
+    def _iter_pages(self,  # pylint: disable=too-many-arguments
+                    fetch,
+                    limit=None,
+                    since_id=None,
+                    prefetch: bool = True):
+        """
+        Asyncio version of BluelivRequest._iter_pages, so the iter_* methods
+        return asynchronous generators (use them with async for).
+
+        :return: an asynchronous generator of items.
+        """
+        return aiter_pages(fetch,
+                           limit=limit,
+                           since_id=since_id,
+                           prefetch=prefetch)
+
+    def _iter_numbered_pages(self,  # pylint: disable=too-many-arguments
+                             fetch,
+                             start_page: int = 1,
+                             page_size: typing.Optional[int] = None,
+                             workers: int = FANOUT_WORKERS,
+                             max_pages: typing.Optional[int] = None):
+        """
+        Asyncio version of BluelivRequest._iter_numbered_pages.
+
+        :return: an asynchronous generator of items.
+        """
+        return aiter_numbered_pages(fetch,
+                                    start_page=start_page,
+                                    page_size=page_size,
+                                    workers=workers,
+                                    max_pages=max_pages)
+
+
+class AsyncBluelivRequest(AsyncRequestMixin, BluelivRequest):
+    """
+    Asyncio version of BluelivRequest.
+
+    """
+
+
+class AsyncCrawlerRequest(AsyncRequestMixin, CrawlerRequest):
+    """
+    Asyncio version of CrawlerRequest.
+
+    """
+
+    async def crawl_many(self,  # pylint: disable=too-many-arguments,W0236
+                         terms: typing.Iterable[str],
+                         is_text: bool = False,
+                         workers: int = FANOUT_WORKERS,
+                         ordered: bool = False,
+                         as_json: bool = False):
+        """
+        Asyncio version of CrawlerRequest.crawl_many (use it with async for).
+
+        :return: an asynchronous generator of CrawlResult.
+        """
+        def crawl_one(argument):
+            return self.crawl(term=argument[1],
+                              is_text=is_text,
+                              as_json=as_json)
+
+        async for argument, result, error in abounded_map(
+                crawl_one, unique_terms(terms, is_text),
+                workers=workers, ordered=ordered):
+            yield CrawlResult(argument[0], argument[1], result, error)
+
+
+class AsyncIocsRequest(AsyncRequestMixin, IocsRequest):
+    """
+    Asyncio version of IocsRequest.
+
+    """
+
+
+class AsyncMalwaresRequest(AsyncRequestMixin, MalwaresRequest):
+    """
+    Asyncio version of MalwaresRequest.
+
+    """
+
+    def upload_directory(self, *args, **kwargs):
+        """
+        Not available in the asyncio clients: use
+        MalwaresRequest.upload_directory.
+
+        :return: nothing, it raises an Exception.
+        """
+        raise Exception('upload_directory is not supported by the asyncio '
+                        'clients')
+
+
+class AsyncSparksRequest(AsyncRequestMixin, SparksRequest):
+    """
+    Asyncio version of SparksRequest.
+
+    """
+
+    async def iocs_many(self,  # pylint: disable=too-many-arguments,W0236
+                        spark_ids: typing.Iterable,
+                        limit: typing.Optional[str] = None,
+                        workers: int = FANOUT_WORKERS,
+                        ordered: bool = False,
+                        as_json: bool = False):
+        """
+        Asyncio version of SparksRequest.iocs_many (use it with async for).
+
+        :return: an asynchronous generator of SparkIocs.
+        """
+        def fetch(spark_id):
+            return self.iocs(spark_id, limit=limit, as_json=as_json)
+
+        async for spark_id, result, error in abounded_map(
+                fetch, unique_ids(spark_ids),
+                workers=workers, ordered=ordered):
+            yield SparkIocs(spark_id, result, error)
+
+
+class AsyncTagsRequest(AsyncRequestMixin, TagsRequest):
+    """
+    Asyncio version of TagsRequest.
+
+    """
+
+
+class AsyncUsersRequest(AsyncRequestMixin, UsersRequest):
+    """
+    Asyncio version of UsersRequest.
+
+    """
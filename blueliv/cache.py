@@ -0,0 +1,348 @@
+"""
+Response caches for the idempotent (GET) requests.
+
+Many calls (IoC types, tags list, our own user, a spark or malware by id)
+return mostly static data, so the transports may keep the responses and
+serve repeated lookups without reaching the network. Caching is opt-in:
+
+    cache = ResponseCache(ttl=300, ttls={'/iocs/types': 3600})
+    iocs = IocsRequest(transport=BluelivTransport(cache=cache))
+
+SQLiteHTTPCache is a persistent store that survives restarts. It keeps the
+ETag/Last-Modified validators of each response, so the transports send
+conditional requests and serve the body from disk on 304 (Not Modified):
+
+    transport = BluelivTransport(http_cache=SQLiteHTTPCache('/tmp/bl.db'))
+
+"""
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import typing
+from urllib.parse import urlsplit
+
+from .configuration import BASE_API_URL, CACHE_TTL, CACHE_MAXSIZE
+
+
+def cache_key(method: str, url: str, params=None, headers=None):
+    """
+    Build the key identifying a request: method, url, params and headers
+    (they hold the token, and different tokens may see different data).
+
+    :param method: the HTTP method.
+    :param url: the full url.
+    :param params: the query parameters (dict or None).
+    :param headers: the request headers (dict or None).
+    :return: a hashable tuple.
+    """
+    params = tuple(sorted((str(key), str(value))
+                          for key, value in (params or {}).items()))
+    headers = tuple(sorted((headers or {}).items()))
+    return method.upper(), url, params, headers
+
+
+class ResponseCache:
+    """ResponseCache is a thread-safe, in-process, TTL and LRU bounded store
+    of responses.
+
+    Attributes:
+        ttl: the default time to live (seconds) of the entries.
+
+        ttls: dict with per-endpoint time to live, keyed by resource prefix
+        (relative to base_url), for example {'/iocs/types': 3600}. The
+        longest matching prefix wins. A ttl of 0 disables caching.
+
+        maxsize: the maximum number of entries. When full, the least recently
+        used entry is evicted.
+
+        base_url: the API base url, stripped from urls to match ttls.
+
+        hits, misses, evictions: counters for the cache usage.
+
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    ttl: float = CACHE_TTL
+    ttls: typing.Optional[dict] = None
+    maxsize: int = CACHE_MAXSIZE
+    base_url: str = BASE_API_URL
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def __init__(self, **kwargs):
+        self.ttl = CACHE_TTL
+        self.ttls = {}
+        self.maxsize = CACHE_MAXSIZE
+        self.base_url = BASE_API_URL
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if 'ttl' in kwargs:
+            self.ttl = kwargs.get('ttl', CACHE_TTL)
+
+        if 'ttls' in kwargs:
+            self.ttls = dict(kwargs.get('ttls', None) or {})
+
+        if 'maxsize' in kwargs:
+            self.maxsize = kwargs.get('maxsize', CACHE_MAXSIZE)
+
+        if 'base_url' in kwargs:
+            self.base_url = kwargs.get('base_url', BASE_API_URL)
+
+    def resource(self, url: str):
+        """
+        The resource path of an url, relative to base_url.
+
+        :param url: the full url.
+        :return: the resource (for example '/iocs/types').
+        """
+        if url.startswith(self.base_url):
+            return url[len(self.base_url):]
+        return urlsplit(url).path
+
+    def ttl_for(self, url: str):
+        """
+        The time to live for an url: the longest matching prefix in ttls or
+        the default ttl.
+
+        :param url: the full url.
+        :return: seconds to keep the response.
+        """
+        resource = self.resource(url)
+        for prefix in sorted(self.ttls, key=len, reverse=True):
+            if resource.startswith(prefix):
+                return self.ttls[prefix]
+        return self.ttl
+
+    def get(self, key):
+        """
+        Retrieve a fresh entry, counting a hit or a miss.
+
+        :param key: the key (see cache_key).
+        :return: the cached response or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                expires, response = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, response):
+        """
+        Store a response, evicting the least recently used if full.
+
+        :param key: the key (see cache_key).
+        :param response: the response to store.
+        :return: nothing.
+        """
+        ttl = self.ttl_for(key[1])
+        if not ttl or ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, prefix: typing.Optional[str] = None):
+        """
+        Remove entries. With no prefix, the whole cache is cleared.
+
+        :param prefix: the resource prefix (relative to base_url), for
+        example '/sparks/1234' or '/tags'.
+        :return: the number of entries removed.
+        """
+        with self._lock:
+            if prefix is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+
+            keys = [key for key in self._entries
+                    if self.resource(key[1]).startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self):
+        """
+        The cache counters.
+
+        :return: dict with hits, misses, evictions and size.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries)
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteHTTPCache:
+    """SQLiteHTTPCache stores the GET responses that carry validators (ETag
+    or Last-Modified) in a SQLite database, to revalidate them in later runs.
+
+    Attributes:
+        path: the database file (':memory:' for a volatile one).
+
+        hits: responses served from disk after a 304.
+
+        stores: responses written to disk.
+
+    """
+
+    path: str = ':memory:'
+    hits: int = 0
+    stores: int = 0
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self.hits = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY,'
+                ' url TEXT NOT NULL,'
+                ' etag TEXT,'
+                ' last_modified TEXT,'
+                ' headers TEXT NOT NULL,'
+                ' body BLOB NOT NULL,'
+                ' stored_at REAL NOT NULL)')
+
+    @staticmethod
+    def _digest(key):
+        """
+        A stable text digest of a cache_key tuple.
+
+        :param key: the key (see cache_key).
+        :return: hex sha256 digest.
+        """
+        return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Retrieve a stored response.
+
+        :param key: the key (see cache_key).
+        :return: dict with etag, last_modified, headers and body, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT etag, last_modified, headers, body FROM responses'
+                ' WHERE key = ?', (self._digest(key),)).fetchone()
+        if row is None:
+            return None
+        return {
+            'etag': row[0],
+            'last_modified': row[1],
+            'headers': json.loads(row[2]),
+            'body': bytes(row[3])
+        }
+
+    @staticmethod
+    def conditional_headers(entry: dict):
+        """
+        The headers to revalidate a stored response.
+
+        :param entry: the stored response (see get).
+        :return: dict with If-None-Match and/or If-Modified-Since.
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def set(self, key, url: str, headers, body: bytes):
+        """
+        Store a response if it carries validators.
+
+        :param key: the key (see cache_key).
+        :param url: the full url.
+        :param headers: the response headers.
+        :param body: the response body.
+        :return: True if it was stored.
+        """
+        etag = headers.get('ETag', None)
+        last_modified = headers.get('Last-Modified', None)
+        if not etag and not last_modified:
+            return False
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses'
+                ' (key, url, etag, last_modified, headers, body, stored_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self._digest(key), url, etag, last_modified,
+                 json.dumps(dict(headers)), body, time.time()))
+            self.stores += 1
+        return True
+
+    def hit(self):
+        """
+        Count a response served from disk.
+
+        :return: nothing.
+        """
+        with self._lock:
+            self.hits += 1
+
+    def purge(self, older_than: typing.Optional[float] = None):
+        """
+        Remove stored responses.
+
+        :param older_than: age in seconds; None removes everything.
+        :return: the number of responses removed.
+        """
+        with self._lock, self._connection:
+            if older_than is None:
+                cursor = self._connection.execute('DELETE FROM responses')
+            else:
+                cursor = self._connection.execute(
+                    'DELETE FROM responses WHERE stored_at < ?',
+                    (time.time() - older_than,))
+            return cursor.rowcount
+
+    def stats(self):
+        """
+        The cache counters.
+
+        :return: dict with hits, stores and size.
+        """
+        with self._lock:
+            size = self._connection.execute(
+                'SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'hits': self.hits, 'stores': self.stores, 'size': size}
+
+    def close(self):
+        """
+        Close the database.
+
+        :return: nothing.
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,124 @@
+"""
+The JSON codec used to decode the API responses.
+
+The standard json module is used by default, but a faster decoder is picked
+when installed (orjson, then ujson) unless BLUELIV_API_JSON_CODEC says
+otherwise ('auto', 'json', 'orjson' or 'ujson'). Any other pair of functions
+can be plugged in with set_codec.
+
+"""
+import importlib
+import json
+import typing
+
+from .configuration import JSON_CODEC
+
+CODECS = ('orjson', 'ujson', 'json')
+
+
+class JSONCodec:  # pylint: disable=too-few-public-methods
+    """
+    A pair of loads/dumps functions with a name.
+
+    Attributes:
+        name: the codec name.
+
+        loads: callable decoding bytes or str into Python objects.
+
+        dumps: callable encoding Python objects into str.
+
+    """
+
+    name: str = 'json'
+    loads: typing.Callable = json.loads
+    dumps: typing.Callable = json.dumps
+
+    def __init__(self, name: str, loads: typing.Callable,
+                 dumps: typing.Callable):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def load_codec(name: str):
+    """
+    Build the codec for an installed module.
+
+    :param name: 'json', 'orjson' or 'ujson'.
+    :return: the JSONCodec (ImportError if the module is not installed).
+    """
+    if name == 'json':
+        return JSONCodec('json', json.loads, json.dumps)
+
+    module = importlib.import_module(name)
+    if name == 'orjson':
+        # orjson encodes into bytes.
+        return JSONCodec(name,
+                         module.loads,
+                         lambda obj: module.dumps(obj).decode('utf-8'))
+    return JSONCodec(name, module.loads, module.dumps)
+
+
+def _default_codec(name: str = JSON_CODEC):
+    """
+    The codec configured: the named one or, with 'auto', the fastest one
+    installed.
+
+    :param name: the codec name or 'auto'.
+    :return: the JSONCodec.
+    """
+    names = CODECS if name == 'auto' else (name,)
+    for candidate in names:
+        try:
+            return load_codec(candidate)
+        except ImportError:
+            continue
+    raise Exception('JSON codec [%s] is not installed' % name)
+
+
+_CODEC = _default_codec()
+
+
+def get_codec():
+    """
+    The codec in use.
+
+    :return: the JSONCodec.
+    """
+    return _CODEC
+
+
+def set_codec(codec: typing.Union[str, JSONCodec]):
+    """
+    Replace the codec in use.
+
+    :param codec: a JSONCodec, a codec name or 'auto'.
+    :return: the previous JSONCodec.
+    """
+    global _CODEC  # pylint: disable=global-statement
+
+    previous = _CODEC
+    if isinstance(codec, str):
+        codec = _default_codec(codec)
+    _CODEC = codec
+    return previous
+
+
+def loads(data):
+    """
+    Decode a JSON document with the codec in use.
+
+    :param data: bytes or str.
+    :return: the decoded document.
+    """
+    return _CODEC.loads(data)
+
+
+def dumps(obj):
+    """
+    Encode a JSON document with the codec in use.
+
+    :param obj: the Python object.
+    :return: str with the document.
+    """
+    return _CODEC.dumps(obj)
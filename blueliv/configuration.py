@@ -133,3 +133,112 @@ BASE_SEARCH_URL = '/search'
 BASE_SEARCH_URL = os.getenv('BLUELIV_API_BASE_SEARCH_URL',
                             BASE_SEARCH_URL)
 # ENV: BLUELIV_API_BASE_SEARCH_URL
+
+POOL_CONNECTIONS = 10
+POOL_CONNECTIONS = int(os.getenv('BLUELIV_API_POOL_CONNECTIONS',
+                                 POOL_CONNECTIONS))
+# ENV: BLUELIV_API_POOL_CONNECTIONS
+
+POOL_MAXSIZE = 10
+POOL_MAXSIZE = int(os.getenv('BLUELIV_API_POOL_MAXSIZE',
+                             POOL_MAXSIZE))
+# ENV: BLUELIV_API_POOL_MAXSIZE
+
+POOL_BLOCK = None
+POOL_BLOCK = os.getenv('BLUELIV_API_POOL_BLOCK',
+                       POOL_BLOCK)
+POOL_BLOCK = bool(POOL_BLOCK)
+# ENV: BLUELIV_API_POOL_BLOCK
+
+ASYNC_CONCURRENCY = 100
+ASYNC_CONCURRENCY = int(os.getenv('BLUELIV_API_ASYNC_CONCURRENCY',
+                                  ASYNC_CONCURRENCY))
+# ENV: BLUELIV_API_ASYNC_CONCURRENCY
+
+FANOUT_WORKERS = 8
+FANOUT_WORKERS = int(os.getenv('BLUELIV_API_FANOUT_WORKERS',
+                               FANOUT_WORKERS))
+# ENV: BLUELIV_API_FANOUT_WORKERS
+
+CACHE_TTL = 300
+CACHE_TTL = float(os.getenv('BLUELIV_API_CACHE_TTL',
+                            CACHE_TTL))
+# ENV: BLUELIV_API_CACHE_TTL
+
+CACHE_MAXSIZE = 1024
+CACHE_MAXSIZE = int(os.getenv('BLUELIV_API_CACHE_MAXSIZE',
+                              CACHE_MAXSIZE))
+# ENV: BLUELIV_API_CACHE_MAXSIZE
+
+HTTP_CACHE_PATH = None
+HTTP_CACHE_PATH = os.getenv('BLUELIV_API_HTTP_CACHE_PATH',
+                            HTTP_CACHE_PATH)
+# ENV: BLUELIV_API_HTTP_CACHE_PATH
+
+RETRY_MAX = 3
+RETRY_MAX = int(os.getenv('BLUELIV_API_RETRY_MAX',
+                          RETRY_MAX))
+# ENV: BLUELIV_API_RETRY_MAX
+
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF = float(os.getenv('BLUELIV_API_RETRY_BACKOFF',
+                                RETRY_BACKOFF))
+# ENV: BLUELIV_API_RETRY_BACKOFF
+
+RETRY_BUDGET = 60.0
+RETRY_BUDGET = float(os.getenv('BLUELIV_API_RETRY_BUDGET',
+                               RETRY_BUDGET))
+# ENV: BLUELIV_API_RETRY_BUDGET
+
+RATE_LIMIT = None
+RATE_LIMIT = os.getenv('BLUELIV_API_RATE_LIMIT',
+                       RATE_LIMIT)
+RATE_LIMIT = float(RATE_LIMIT) if RATE_LIMIT else None
+# ENV: BLUELIV_API_RATE_LIMIT
+
+RATE_BURST = None
+RATE_BURST = os.getenv('BLUELIV_API_RATE_BURST',
+                       RATE_BURST)
+RATE_BURST = float(RATE_BURST) if RATE_BURST else None
+# ENV: BLUELIV_API_RATE_BURST
+
+RATE_LIMIT_DIR = None
+RATE_LIMIT_DIR = os.getenv('BLUELIV_API_RATE_LIMIT_DIR',
+                           RATE_LIMIT_DIR)
+# ENV: BLUELIV_API_RATE_LIMIT_DIR
+
+JSON_CODEC = 'auto'
+JSON_CODEC = os.getenv('BLUELIV_API_JSON_CODEC',
+                       JSON_CODEC)
+# ENV: BLUELIV_API_JSON_CODEC
+
+STREAM_CHUNK_SIZE = 65536
+STREAM_CHUNK_SIZE = int(os.getenv('BLUELIV_API_STREAM_CHUNK_SIZE',
+                                  STREAM_CHUNK_SIZE))
+# ENV: BLUELIV_API_STREAM_CHUNK_SIZE
+
+UPLOAD_CHUNK_SIZE = 65536
+UPLOAD_CHUNK_SIZE = int(os.getenv('BLUELIV_API_UPLOAD_CHUNK_SIZE',
+                                  UPLOAD_CHUNK_SIZE))
+# ENV: BLUELIV_API_UPLOAD_CHUNK_SIZE
+
+COALESCE = '1'
+COALESCE = os.getenv('BLUELIV_API_COALESCE',
+                     COALESCE)
+COALESCE = COALESCE.lower() not in ('', '0', 'false', 'no')
+# ENV: BLUELIV_API_COALESCE
+
+LOG_LEVEL = None
+LOG_LEVEL = os.getenv('BLUELIV_API_LOG_LEVEL',
+                      LOG_LEVEL)
+# ENV: BLUELIV_API_LOG_LEVEL
+
+LOG_FORMAT = 'text'
+LOG_FORMAT = os.getenv('BLUELIV_API_LOG_FORMAT',
+                       LOG_FORMAT)
+# ENV: BLUELIV_API_LOG_FORMAT
+
+LOG_SAMPLE_EVERY = 1
+LOG_SAMPLE_EVERY = int(os.getenv('BLUELIV_API_LOG_SAMPLE_EVERY',
+                                 LOG_SAMPLE_EVERY))
+# ENV: BLUELIV_API_LOG_SAMPLE_EVERY
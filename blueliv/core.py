@@ -4,16 +4,71 @@ package.
 
 """
 import typing
-import json
-import requests
 
+from . import codec, hooks
 from .configuration import (
-    DEBUG,
     VERSION,
     BASE_API_URL, BASE_SEARCH_URL,
     TOKEN,
-    AUTHORIZATION, AUTHORIZATION_FORMAT, AUTHORIZATION_HEADER
+    AUTHORIZATION, AUTHORIZATION_FORMAT, AUTHORIZATION_HEADER,
+    FANOUT_WORKERS
 )
+from .logs import log, redact_headers
+from .pagination import ITEMS_KEYS, iter_numbered_pages, iter_pages
+from .ratelimit import get_rate_limiter
+from .streaming import iter_response_items
+from .transport import BluelivTransport, get_default_transport
+
+
+EMPTY_DOCUMENTS = ('', 'null', '[]', '{}', '""', 'false', '0')
+
+
+def is_empty_document(text: str):
+    """
+    Check, without decoding it, if a JSON document is an empty (falsy) value
+    as null, [] or {}. Previous versions returned None for those.
+
+    :param text: the JSON document.
+    :return: True if it is empty.
+    """
+    if len(text) > 32:
+        return False
+    return ''.join(text.split()) in EMPTY_DOCUMENTS
+
+
+def status_error(message: str, status_code: int):
+    """
+    Build the Exception raised for an error response, with the status code
+    in its status_code attribute (to tell a 404 from an auth error).
+
+    :param message: the error message.
+    :param status_code: the response status code.
+    :return: the Exception.
+    """
+    error = Exception(message)
+    error.status_code = status_code
+    return error
+
+
+def to_models(model, document):
+    """
+    Build models from a decoded API document: a list of items, a page with
+    the items under one of the ITEMS_KEYS, or a single item.
+
+    :param model: the BASEModel subclass.
+    :param document: the decoded document.
+    :return: list of models, a model, or None for empty documents.
+    """
+    if isinstance(document, list):
+        return model.from_list(document)
+
+    if isinstance(document, dict):
+        for key in ITEMS_KEYS:
+            if isinstance(document.get(key, None), list):
+                return model.from_list(document[key])
+        return model.from_dict(document) if document else None
+
+    return None
 
 
 class BASEModel:
@@ -23,6 +78,11 @@ class BASEModel:
     To track instances count, we are using an attribute _instance_counter that
     will increment a counter whenever a new instance is created.
 
+    Models declare their attributes in __slots__ (no per instance __dict__),
+    so holding millions of them costs a fraction of what dicts cost. They can
+    be built from API items with from_dict and from_list, using the
+    _api_fields map (API key -> attribute).
+
     Attributes:
         _instance_counter: the counter to track instance count.
 
@@ -37,14 +97,16 @@ class BASEModel:
     # pylint: disable=too-few-public-methods
     # Base model (consider it as an interface)
 
-    _instance_counter = 0
+    __slots__ = ('_instance_counter',)
+
+    _api_fields: typing.ClassVar[tuple] = ()
 
     def __init__(self):
         '''Increment instance counter when constructor is invoked.
 
         This is a potential element to be removed, as it may have no use.
         '''
-        self._instance_counter += 1
+        self._instance_counter = 1
 
     def get_instance_counter(self):
         """
@@ -53,6 +115,37 @@ class BASEModel:
         """
         return self._instance_counter
 
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Build a model from an API item. Unknown keys are ignored.
+
+        :param data: the decoded item.
+        :return: the model instance.
+        """
+        return cls(**{attribute: data[key]
+                      for key, attribute in cls._api_fields if key in data})
+
+    @classmethod
+    def from_list(cls, items: typing.Iterable[dict]):
+        """
+        Build models from a list of API items (other values are skipped).
+
+        :param items: the decoded items.
+        :return: list of model instances.
+        """
+        from_dict = cls.from_dict
+        return [from_dict(item) for item in items if isinstance(item, dict)]
+
+    def to_dict(self):
+        """
+        The model as an API item (the reverse of from_dict).
+
+        :return: dict with the API keys.
+        """
+        return {key: getattr(self, attribute)
+                for key, attribute in self._api_fields}
+
 
 class BASERequestModel:
     """BASERequestModel is the root class for any request based module. This
@@ -133,17 +226,27 @@ class BluelivRequest(BASERequestModel):
         _last_url_invoked: an attribute we can use for debugging purposes. It
         will store the url from the last request.
 
-        request_count: a counter for the request being sent.
+        request_count: a counter for the requests sent by this instance.
 
         limit: a parameter to limit the number of items to be retrieved.
 
         since_id: a reference mark from a previous request or time position,
         so all results retrieved will not be older that this reference.
 
+        _transport: the BluelivTransport (pooled keep-alive session) used to
+        send the requests. If not passed in the constructor, the shared
+        default transport is used, so all instances reuse connections.
+
+        mirror: an optional MirrorStore (see blueliv.mirror). When set, search
+        is answered from it instead of the API.
+
+        _hooks: the lifecycle hooks of this instance (see add_hook and
+        blueliv.hooks).
+
     """
 
     # pylint: disable=too-many-instance-attributes
-    # 13 elements, but are all used.
+    # 16 elements, but are all used.
 
     _category: typing.Optional[str] = None
     _url: typing.Optional[str] = None
@@ -158,6 +261,9 @@ class BluelivRequest(BASERequestModel):
     request_count: int = 0
     limit: typing.Optional[str] = None
     since_id: typing.Optional[str] = None
+    _transport: typing.Optional[BluelivTransport] = None
+    mirror = None
+    _hooks: typing.Optional[dict] = None
 
     def __init__(self, **kwargs):
         self._category = 'core'
@@ -192,9 +298,8 @@ class BluelivRequest(BASERequestModel):
             # We get AUTHORIZATION from the configuration (as the full string
             # is built there.
             self._authorization = AUTHORIZATION
-            if DEBUG is True:
-                print('Token parameter was None. ENV-Token[%s]' % self.token)
-                print('Authorization header [%s]' % self._authorization)
+            log.debug('client.token_from_environment',
+                      category=self._category)
         else:
             self._authorization = AUTHORIZATION_FORMAT % self._custom_token
             self.token = self._custom_token
@@ -208,6 +313,15 @@ class BluelivRequest(BASERequestModel):
         if 'since_id' in kwargs:
             self.since_id = kwargs.get('since_id', None)
 
+        # Every instance shares the pooled default transport unless a
+        # specific one is provided.
+        self._transport = kwargs.get('transport', None)
+        if self._transport is None:
+            self._transport = get_default_transport()
+
+        self.mirror = kwargs.get('mirror', None)
+        self._hooks = {}
+
         self._url = BASE_API_URL
         self._authorization_header = AUTHORIZATION_HEADER
         self._headers = {self._authorization_header: self._authorization}
@@ -222,20 +336,23 @@ class BluelivRequest(BASERequestModel):
         """
         return self._category
 
-    def request(self, **kwargs):  # pylint: disable=R0912, R0915
+    def get_transport(self):
         """
-        Request method is the base method to be able to retrieve from Blueliv
-        endpoint in the API.
+        A getter to retrieve the transport used to send the requests.
 
-        :param resource: the url we are going to connect to.
-        :param search_type: the resource category we search for or retrieve.
-        :param params: search or request params.
-        :param use_post: if POST method will be used (True).
-        :param data: data to be posted (use_post must be True).
-        :param json_format: if data (see data) is in JSON format.
-        :param files: the files we want to include in the request.
-        :param as_json: if we want to receive the response as JSON (True).
-        :return: dict or JSON (if as_json ==  True) with the results.
+        :return: the BluelivTransport (_transport)
+        """
+        return self._transport
+
+    def _prepare_request(self, **kwargs):  # pylint: disable=R0912
+        """
+        Build the method, url and transport parameters for a request. It is
+        shared by the blocking request method and the asyncio clients (see
+        blueliv.aio), so both send exactly the same requests.
+
+        :param kwargs: the same parameters accepted by request.
+        :return: tuple (method, url, call_kwargs, output), where output has
+        the as_json, raw and model options for _process_response.
 
         """
         resource = None
@@ -246,6 +363,10 @@ class BluelivRequest(BASERequestModel):
         json_format = False
         files = None
         as_json = False
+        raw = False
+        stream = False
+        model = None
+        headers = None
 
         if 'resource' in kwargs:
             resource = kwargs.get('resource', None)
@@ -271,8 +392,17 @@ class BluelivRequest(BASERequestModel):
         if 'as_json' in kwargs:
             as_json = kwargs.get('as_json', False)
 
-        if DEBUG is True:
-            print('request called.')
+        if 'raw' in kwargs:
+            raw = kwargs.get('raw', False)
+
+        if 'stream' in kwargs:
+            stream = kwargs.get('stream', False)
+
+        if 'model' in kwargs:
+            model = kwargs.get('model', None)
+
+        if 'headers' in kwargs:
+            headers = kwargs.get('headers', None)
 
         if use_post is True and data is None:
             raise Exception('If use_post=True, must provide data (was None)')
@@ -280,7 +410,6 @@ class BluelivRequest(BASERequestModel):
         if use_post is False and data is True:
             raise Exception('If use_post=False, data must be None (default)')
 
-        res = None
         url = self._url
         if resource:
             url = '%s%s' % (url,
@@ -292,117 +421,284 @@ class BluelivRequest(BASERequestModel):
 
         self._last_url_invoked = url
 
-        if DEBUG is True:
-            print('request for compound url [%s].' % url)
-
         if files:
             use_post = True
             json_format = False
 
-        if DEBUG is True:
-            print('request with Headers [%s].' % self._headers)
+        output = {'as_json': as_json, 'raw': raw, 'model': model}
+        call_kwargs = {'headers': self._headers}
+        if headers:
+            call_kwargs['headers'] = dict(self._headers, **headers)
+        if stream is True:
+            call_kwargs['stream'] = True
+
+        # Instances using the same token share the same rate limiter.
+        rate_limiter = get_rate_limiter(self.token)
+        if rate_limiter is not None:
+            call_kwargs['rate_limiter'] = rate_limiter
+
+        if params:
+            call_kwargs['params'] = params
+
+        if use_post is False:
+            if log.enabled():
+                log.debug('request.prepared', method='GET', url=url,
+                          params=params, stream=stream)
+            return 'GET', url, call_kwargs, output
+
+        if log.enabled():
+            log.debug('request.prepared', method='POST', url=url,
+                      params=params,
+                      body='json' if json_format is True else
+                      'files' if files else 'data',
+                      headers=redact_headers(call_kwargs['headers']))
+
+        if json_format is True:
+            call_kwargs['json'] = data
+        elif files:
+            call_kwargs['files'] = files
+        else:
+            call_kwargs['data'] = data
 
-        if not params:
-            if DEBUG is True:
-                print('request called with no params parameter.')
+        return 'POST', url, call_kwargs, output
 
-            if use_post is False:
-                if DEBUG is True:
-                    print('request use_post is False.')
+    @staticmethod
+    def _process_response(url: str, res,
+                          as_json: bool = False,
+                          raw: bool = False,
+                          model=None):
+        """
+        Check the status of a response and extract the results.
 
-                res = requests.get(url, headers=self._headers)
-            else:
-                if DEBUG is True:
-                    print('request POST is True.')
-
-                if json_format is True:
-                    if DEBUG is True:
-                        print('request use_post is True: [JSON FORMAT]')
-
-                    res = requests.post(url, headers=self._headers, json=data)
-                else:
-                    if files:
-                        res = requests.post(url,
-                                            headers=self._headers,
-                                            files=files)
-                    else:
-                        res = requests.post(url,
-                                            headers=self._headers,
-                                            data=data)
-        else:
-            if DEBUG is True:
-                print('request called with params: [%s].' % str(params))
+        The body is only decoded if as_json is True (with the codec in
+        blueliv.codec). Otherwise it is returned as received (UTF-8 text),
+        without a decode and encode round trip: unlike json.dumps in
+        previous versions, the spacing is the server one and non-ASCII
+        characters are not escaped.
 
-            if use_post is False:
-                if DEBUG is True:
-                    print('request use_post is False.')
+        :param url: the url invoked (used in the error messages).
+        :param res: the response (requests.Response or any object with
+        status_code and content).
+        :param as_json: if we want to receive the response as JSON (True).
+        :param raw: if we want to receive the body bytes untouched (True).
+        :param model: a BASEModel subclass to build from the items.
+        :return: dict or JSON (if as_json ==  True) with the results, bytes
+        (if raw == True) or models (if model is set).
 
-                res = requests.get(url,
-                                   headers=self._headers,
-                                   params=params)
-            else:
-                if DEBUG is True:
-                    print('request POST is False.')
-
-                if json_format is True:
-                    if DEBUG is True:
-                        print('request use_post is True: [JSON FORMAT].')
-
-                    res = requests.post(url,
-                                        headers=self._headers,
-                                        params=params,
-                                        json=data)
-                else:
-                    if files:
-                        res = requests.post(url,
-                                            headers=self._headers,
-                                            params=params,
-                                            files=files)
-                    else:
-                        res = requests.post(url,
-                                            headers=self._headers,
-                                            params=params,
-                                            data=data)
+        """
+        if log.enabled():
+            log.debug('response.received', url=url, status=res.status_code)
 
         if res.status_code == 200:  # pylint: disable=R1705
-            if DEBUG is True:
-                print('request RESULT STATUS [200]. OK.')
-
-            result = res.json()
-            if result:
-                if as_json is True:
-                    return result
-                return json.dumps(result)
-            return None
-        elif res.status_code == 400:
-            if DEBUG is True:
-                print('request RESULT STATUS [400]. ERROR.')
 
-            raise Exception('[%s]: Error request [400]: %s' % (url,
-                                                               res.content))
-        elif res.status_code == 401:
-            if DEBUG is True:
-                print('request RESULT STATUS [401]. ERROR (maybe not properly authenticated).')
+            if raw is True:
+                return res.content
+
+            if model is not None:
+                return to_models(model, codec.loads(res.content))
 
+            if as_json is True:
+                return codec.loads(res.content) or None
+
+            # The API answers JSON, which is always UTF-8: the charset that
+            # requests guesses for text/* without one (ISO-8859-1) is wrong.
+            text = res.content.decode('utf-8')
+            if is_empty_document(text):
+                return None
+            return text
+        elif res.status_code == 400:
+            raise status_error('[%s]: Error request [400]: %s' % (
+                url, res.content), res.status_code)
+        elif res.status_code == 401:
             base_exception = '[%s]: Error request [401]: ' % url
             error_401_authentication = '(authentication/API key?)'
 
-            raise Exception('%s%s %s' % (base_exception,
-                                         error_401_authentication,
-                                         res.content))
+            raise status_error('%s%s %s' % (base_exception,
+                                            error_401_authentication,
+                                            res.content), res.status_code)
         elif res.status_code == 422:
-            if DEBUG is True:
-                print('request RESULT STATUS [422]. ERROR.')
+            raise status_error('[%s]: Error request [422]: %s' % (
+                url, res.content), res.status_code)
 
-            raise Exception('[%s]: Error request [422]: %s' % (url,
-                                                               res.content))
+        # Unhandled exception or error code not managed.
+        raise status_error('[%s]: Exception code [%d]' % (url,
+                                                          res.status_code),
+                           res.status_code)
 
-        if DEBUG is True:
-            print('request STATUS [%d]. UNEXPECTED.' % res.status_code)
+    def get_stats(self):
+        """
+        A getter to retrieve the counters of the transport (requests,
+        retries, cache hits...).
 
-        # Unhandled exception or error code not managed.
-        raise Exception('[%s]: Exception code [%d]' % (url,
-                                                       res.status_code))
+        :return: dict with the transport stats.
+        """
+        return self._transport.stats()
+
+    def get_metrics(self):
+        """
+        A getter to retrieve the metrics (calls, latency percentiles, bytes,
+        status codes...) per endpoint family recorded by the transport.
+
+        :return: dict with the metrics snapshot (empty if the transport
+        records none).
+        """
+        metrics = getattr(self._transport, 'metrics', None)
+        return {} if metrics is None else metrics.snapshot()
+
+    def request(self, **kwargs):
+        """
+        Request method is the base method to be able to retrieve from Blueliv
+        endpoint in the API.
+
+        :param resource: the url we are going to connect to.
+        :param search_type: the resource category we search for or retrieve.
+        :param params: search or request params.
+        :param use_post: if POST method will be used (True).
+        :param data: data to be posted (use_post must be True).
+        :param json_format: if data (see data) is in JSON format.
+        :param files: the files we want to include in the request.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param raw: if we want to receive the body bytes untouched (True).
+        :param stream: if we want to receive a generator of the decoded items,
+        parsed while the response is received (True).
+        :param model: a BASEModel subclass (Spark, BluelivIOC...) to build
+        from the items, instead of dicts.
+        :param headers: extra headers for this request (as the Content-Type
+        of a streamed body).
+        :return: dict or JSON (if as_json ==  True) with the results, bytes
+        (if raw == True), models (if model is set) or a generator of items (if
+        stream == True).
+
+        """
+        method, url, call_kwargs, output = self._prepare_request(**kwargs)
+        self.request_count += 1
+        stream = call_kwargs.get('stream', False) is True
+        context = self._start_hooks(method, url, call_kwargs)
+        try:
+            res = self._transport.request(method, url, **call_kwargs)
+            if context is not None:
+                hooks.add_response(context, res, stream)
+
+            if stream:
+                results = self._stream_response(url, res, output['model'])
+            else:
+                results = self._process_response(url, res, **output)
+        except Exception as exception:
+            if context is not None:
+                hooks.run_hooks(hooks.ON_ERROR,
+                                hooks.add_error(context, exception),
+                                self._hooks)
+            raise
+
+        if context is not None:
+            hooks.run_hooks(hooks.POST_RESPONSE, context, self._hooks)
+        return results
+
+    def _start_hooks(self, method: str, url: str, call_kwargs: dict):
+        """
+        Build the context of a request and call the pre_request hooks, if
+        there are hooks (see blueliv.hooks).
+
+        :return: the context dict, or None if there are no hooks.
+        """
+        if not hooks.has_hooks(self._hooks):
+            return None
+
+        context = hooks.new_context(method, url,
+                                    call_kwargs.get('params', None),
+                                    self._category)
+        return hooks.run_hooks(hooks.PRE_REQUEST, context, self._hooks)
+
+    def add_hook(self, event: str, hook: typing.Callable):
+        """
+        Register a hook for the requests of this instance (see
+        blueliv.hooks.register_hook for every instance).
+
+        :param event: pre_request, post_response or on_error.
+        :param hook: the callable, called as hook(context).
+        :return: nothing.
+        """
+        hooks.add_to(self._hooks, event, hook)
+
+    def remove_hook(self, event: str, hook: typing.Callable):
+        """
+        Unregister a hook of this instance.
+
+        :param event: pre_request, post_response or on_error.
+        :param hook: the callable to remove.
+        :return: True if it was registered.
+        """
+        return hooks.remove_from(self._hooks, event, hook)
+
+    def _stream_response(self, url: str, res, model=None):
+        """
+        Check the status of a streamed response and decode its items while
+        they are received (see blueliv.streaming).
+
+        :param url: the url invoked (used in the error messages).
+        :param res: the requests.Response, sent with stream=True.
+        :param model: a BASEModel subclass to build from the items.
+        :return: a generator of items (or models).
+
+        """
+        if res.status_code != 200:
+            try:
+                self._process_response(url, res)
+            finally:
+                res.close()
+
+        items = iter_response_items(res)
+        if model is not None:
+            return map(model.from_dict, items)
+        return items
+
+    def _iter_pages(self,  # pylint: disable=too-many-arguments
+                    fetch,
+                    limit=None,
+                    since_id=None,
+                    prefetch: bool = True):
+        """
+        Walk a since_id/limit feed lazily (see blueliv.pagination). Request
+        classes build their iter_* methods on it.
+
+        :param fetch: callable as fetch(limit=..., since_id=...) returning
+        the decoded page.
+        :param limit: the page size.
+        :param since_id: the reference id to start from.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of items.
+
+        """
+        return iter_pages(fetch,
+                          limit=limit,
+                          since_id=since_id,
+                          prefetch=prefetch)
+
+    def _iter_numbered_pages(self,  # pylint: disable=too-many-arguments
+                             fetch,
+                             start_page: int = 1,
+                             page_size: typing.Optional[int] = None,
+                             workers: int = FANOUT_WORKERS,
+                             max_pages: typing.Optional[int] = None):
+        """
+        Walk a page/pageSize listing fetching several pages concurrently
+        (see blueliv.pagination). Request classes build their iter_* methods
+        on it.
+
+        :param fetch: callable as fetch(page=..., page_size=...) returning
+        the decoded page.
+        :param start_page: the first page number.
+        :param page_size: the page size.
+        :param workers: the maximum number of pages requested at a time.
+        :param max_pages: the maximum number of pages to walk, if any.
+        :return: a generator of items.
+
+        """
+        return iter_numbered_pages(fetch,
+                                   start_page=start_page,
+                                   page_size=page_size,
+                                   workers=workers,
+                                   max_pages=max_pages)
 
     def search(self,  # pylint: disable=too-many-arguments
                search_term: str,
@@ -412,7 +708,8 @@ class BluelivRequest(BASERequestModel):
                as_json: bool = True):
         """
         This is the search method that will be available for all subclasses
-        that inherit from the core one.
+        that inherit from the core one. With a mirror, the results come from
+        the local store (see MirrorStore.search).
 
         :param search_term: the term we want to search.
         :param tag: if we are searching a tag, the tag we want to searcg.
@@ -428,6 +725,14 @@ class BluelivRequest(BASERequestModel):
         if self._category not in self._allowed_categories:
             raise Exception('Categories for search are: iocs, sparks, tags.')
 
+        if self.mirror is not None:
+            results = self.mirror.search(self._category,
+                                         search_term,
+                                         tag=tag,
+                                         limit=limit,
+                                         since_id=since_id)
+            return results if as_json else codec.dumps(results)
+
         params = {'search': search_term}
         if tag:
             params['tag'] = tag
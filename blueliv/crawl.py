@@ -2,8 +2,49 @@
 Crawl module allows to search and crawl information.
 
 """
-from .configuration import BASE_CRAWL_URL
+import collections
+import typing
+
+from .configuration import BASE_CRAWL_URL, FANOUT_WORKERS
 from .core import BluelivRequest
+from .fanout import bounded_map
+from .matching import normalize_url
+
+CrawlResult = collections.namedtuple('CrawlResult',
+                                     ('term', 'normalized', 'result', 'error'))
+
+
+def normalize_term(term: str, is_text: bool = False):
+    """
+    Normalize a crawl input, so the same url written in different ways is
+    crawled once: urls as in blueliv.matching.normalize_url, texts without
+    surrounding whitespace.
+
+    :param term: the url or text.
+    :param is_text: if the term is a text (otherwise is URL).
+    :return: str with the normalized term ('' if there is nothing to crawl).
+    """
+    term = (term or '').strip()
+    if not term or is_text:
+        return term
+    return normalize_url(term)
+
+
+def unique_terms(terms: typing.Iterable[str], is_text: bool = False):
+    """
+    Normalize the crawl inputs and drop the empty and repeated ones, lazily.
+
+    :param terms: iterable with the urls or texts.
+    :param is_text: if they are texts (otherwise are URLs).
+    :return: a generator of (term, normalized) tuples, with the first
+    occurrence of each input.
+    """
+    seen = set()
+    for term in terms:
+        normalized = normalize_term(term, is_text)
+        if normalized and normalized not in seen:
+            seen.add(normalized)
+            yield term, normalized
 
 
 class CrawlerRequest(BluelivRequest):
@@ -44,14 +85,20 @@ class CrawlerRequest(BluelivRequest):
                          base_url=self._base_url,
                          category=self._category,
                          limit=self.limit,
-                         since_id=self.since_id)
-
-    def crawl(self, term: str = '', is_text: bool = False):
+                         since_id=self.since_id,
+                         transport=kwargs.get('transport', None),
+                         mirror=kwargs.get('mirror', None))
+
+    def crawl(self,
+              term: str = '',
+              is_text: bool = False,
+              as_json: bool = False):
         """
         Crawl method to search for a term (or url).
 
         :param term: the term or url we are looking for.
         :param is_text: if it is text, please set to True (otherwise is URL)
+        :param as_json: if we want the response as a JSON document.
         :return:
         """
 
@@ -70,6 +117,45 @@ class CrawlerRequest(BluelivRequest):
         results = self.request(resource=resource_url,
                                use_post=True,
                                data=data,
-                               json_format=True)
+                               json_format=True,
+                               as_json=as_json)
 
         return results
+
+    def crawl_many(self,  # pylint: disable=too-many-arguments
+                   terms: typing.Iterable[str],
+                   is_text: bool = False,
+                   workers: int = FANOUT_WORKERS,
+                   ordered: bool = False,
+                   as_json: bool = False):
+        """
+        Crawl many urls (or texts), with at most workers requests in flight
+        over the shared transport. The inputs are normalized and each one is
+        crawled once, however many times it appears; empty ones are skipped.
+        They are consumed lazily, so terms may be a generator.
+
+        A failed input does not stop the batch: its error is reported in its
+        result.
+
+        :param terms: iterable with the urls or texts.
+        :param is_text: if they are texts, please set to True (otherwise are
+        URLs).
+        :param workers: the maximum number of requests in flight.
+        :param ordered: yield in the order of the inputs (True) or as soon as
+        each crawl completes (False).
+        :param as_json: if we want the responses as JSON documents.
+        :return: a generator of CrawlResult(term, normalized, result, error),
+        where term is the input as received (its first occurrence) and error
+        is None if the crawl succeeded.
+        """
+        def crawl_one(argument):
+            return self.crawl(term=argument[1],
+                              is_text=is_text,
+                              as_json=as_json)
+
+        for argument, result, error in bounded_map(crawl_one,
+                                                   unique_terms(terms,
+                                                                is_text),
+                                                   workers=workers,
+                                                   ordered=ordered):
+            yield CrawlResult(argument[0], argument[1], result, error)
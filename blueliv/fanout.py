@@ -0,0 +1,125 @@
+"""
+Fan-out helpers to run many independent requests with a bounded number of
+them in flight, streaming the results back as they are available.
+
+"""
+import asyncio
+import collections
+import typing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .configuration import FANOUT_WORKERS
+
+
+def bounded_map(func: typing.Callable,
+                arguments: typing.Iterable,
+                workers: int = FANOUT_WORKERS,
+                ordered: bool = True):
+    """
+    Call func(argument) for every argument in a pool of threads, never
+    having more than workers calls in flight. The arguments are consumed
+    lazily, so it may be an endless iterator.
+
+    A failure in one call does not stop the others: it is reported in the
+    tuple for its argument.
+
+    :param func: the callable to run for each argument.
+    :param arguments: iterable with the arguments.
+    :param workers: the maximum number of calls in flight.
+    :param ordered: yield in the order of the arguments (True) or as soon as
+    each call completes (False).
+    :return: a generator of (argument, result, exception) tuples, where
+    exception is None if the call succeeded.
+    """
+    workers = max(1, int(workers))
+    arguments = iter(arguments)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.OrderedDict()
+
+    def submit_next():
+        for argument in arguments:
+            pending[executor.submit(func, argument)] = argument
+            return True
+        return False
+
+    def outcome(future):
+        try:
+            return future.result(), None
+        except Exception as exception:  # pylint: disable=broad-except
+            return None, exception
+
+    try:
+        for _ in range(workers):
+            if not submit_next():
+                break
+
+        while pending:
+            if ordered:
+                future = next(iter(pending))
+                wait([future])
+                done = [future]
+            else:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                argument = pending.pop(future)
+                submit_next()
+                result, exception = outcome(future)
+                yield argument, result, exception
+    finally:
+        # Stop the calls not started yet and wait for the running ones, so
+        # no request is sent after the consumer stops.
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+async def abounded_map(func: typing.Callable,
+                       arguments: typing.Iterable,
+                       workers: int = FANOUT_WORKERS,
+                       ordered: bool = True):
+    """
+    Asyncio version of bounded_map: func(argument) returns a coroutine and
+    the calls in flight are tasks.
+
+    :return: an asynchronous generator of (argument, result, exception)
+    tuples.
+    """
+    workers = max(1, int(workers))
+    arguments = iter(arguments)
+    pending = collections.OrderedDict()
+
+    def submit_next():
+        for argument in arguments:
+            pending[asyncio.ensure_future(func(argument))] = argument
+            return True
+        return False
+
+    def outcome(task):
+        try:
+            return task.result(), None
+        except Exception as exception:  # pylint: disable=broad-except
+            return None, exception
+
+    try:
+        for _ in range(workers):
+            if not submit_next():
+                break
+
+        while pending:
+            if ordered:
+                task = next(iter(pending))
+                await asyncio.wait([task])
+                done = [task]
+            else:
+                done, _ = await asyncio.wait(
+                    list(pending), return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                argument = pending.pop(task)
+                submit_next()
+                result, exception = outcome(task)
+                yield argument, result, exception
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,210 @@
+"""
+Request lifecycle hooks, to attach tracing spans, profiling or custom timing
+around every API call without subclassing the request classes.
+
+A hook is a callable receiving the context dict of a request. It is called
+at these events:
+
+    pre_request: before sending it, with method, url, params, category,
+    started (epoch seconds) and perf_start (time.perf_counter()).
+
+    post_response: after a successful response, adding status_code, size
+    (body bytes) and timings (total, ttfb, dns and connect, in seconds;
+    None when the transport does not know them).
+
+    on_error: when the request fails, adding error (the exception) and, if
+    a response was received, status_code, size and timings.
+
+The same dict is passed to every event of a request, so a hook can keep its
+own state in it (a span opened in pre_request and closed later):
+
+    def trace(context):
+        if context['event'] == 'pre_request':
+            context['span'] = tracer.start_span(context['url'])
+        else:
+            context['span'].end()
+
+    register_hook('pre_request', trace)       # every request instance
+    register_hook('post_response', trace)
+    sparks.add_hook('on_error', trace)        # only this one
+
+An exception raised by a hook never breaks the request: it is logged (as a
+sampled hook.failed warning) and ignored.
+
+"""
+import threading
+import time
+import typing
+
+from .logs import log
+
+PRE_REQUEST = 'pre_request'
+POST_RESPONSE = 'post_response'
+ON_ERROR = 'on_error'
+EVENTS = (PRE_REQUEST, POST_RESPONSE, ON_ERROR)
+
+_HOOKS: dict = {event: () for event in EVENTS}
+_HOOKS_LOCK = threading.Lock()
+
+
+def _check_event(event: str):
+    if event not in EVENTS:
+        raise Exception('Hook events are: %s.' % ', '.join(EVENTS))
+
+
+def add_to(hooks: dict, event: str, hook: typing.Callable):
+    """
+    Add a hook to a registry (a dict of tuples per event, replaced instead of
+    modified, so it can be read without a lock).
+
+    :param hooks: the registry.
+    :param event: pre_request, post_response or on_error.
+    :param hook: the callable, called as hook(context).
+    :return: nothing.
+    """
+    _check_event(event)
+    hooks[event] = hooks.get(event, ()) + (hook,)
+
+
+def remove_from(hooks: dict, event: str, hook: typing.Callable):
+    """
+    Remove a hook from a registry (see add_to).
+
+    :param hooks: the registry.
+    :param event: pre_request, post_response or on_error.
+    :param hook: the callable to remove.
+    :return: True if it was registered.
+    """
+    _check_event(event)
+    registered = hooks.get(event, ())
+    if hook not in registered:
+        return False
+    hooks[event] = tuple(item for item in registered if item is not hook)
+    return True
+
+
+def register_hook(event: str, hook: typing.Callable):
+    """
+    Register a hook for every request instance.
+
+    :param event: pre_request, post_response or on_error.
+    :param hook: the callable, called as hook(context).
+    :return: nothing.
+    """
+    with _HOOKS_LOCK:
+        add_to(_HOOKS, event, hook)
+
+
+def unregister_hook(event: str, hook: typing.Callable):
+    """
+    Unregister a hook registered with register_hook.
+
+    :param event: pre_request, post_response or on_error.
+    :param hook: the callable to remove.
+    :return: True if it was registered.
+    """
+    with _HOOKS_LOCK:
+        return remove_from(_HOOKS, event, hook)
+
+
+def get_hooks(event: str, instance_hooks: typing.Optional[dict] = None):
+    """
+    The hooks for an event: the global ones and then the instance ones.
+
+    :param event: pre_request, post_response or on_error.
+    :param instance_hooks: the registry of a request instance.
+    :return: tuple of callables.
+    """
+    hooks = _HOOKS[event]
+    if instance_hooks:
+        hooks = hooks + instance_hooks.get(event, ())
+    return hooks
+
+
+def has_hooks(instance_hooks: typing.Optional[dict] = None):
+    """
+    :param instance_hooks: the registry of a request instance.
+    :return: True if any hook is registered (global or for the instance).
+    """
+    return any(get_hooks(event, instance_hooks) for event in EVENTS)
+
+
+def run_hooks(event: str, context: dict,
+              instance_hooks: typing.Optional[dict] = None):
+    """
+    Call the hooks of an event, ignoring their exceptions.
+
+    :param event: pre_request, post_response or on_error.
+    :param context: the context dict of the request.
+    :param instance_hooks: the registry of a request instance.
+    :return: the context.
+    """
+    context['event'] = event
+    for hook in get_hooks(event, instance_hooks):
+        try:
+            hook(context)
+        except Exception as exception:  # pylint: disable=broad-except
+            log.warning('hook.failed', sample=100, hook_event=event,
+                        hook=repr(hook), error=repr(exception))
+    return context
+
+
+def new_context(method: str, url: str, params=None, category=None):
+    """
+    Build the context of a request.
+
+    :return: dict with method, url, params, category and started.
+    """
+    return {'event': None,
+            'method': method,
+            'url': url,
+            'params': params,
+            'category': category,
+            'started': time.time(),
+            'perf_start': time.perf_counter()}
+
+
+def add_response(context: dict, response, stream: bool = False):
+    """
+    Add the status code, size and timings of a response to a context.
+
+    :param context: the context dict of the request.
+    :param response: the requests.Response or AsyncResponse.
+    :param stream: if the body was not read (the size comes from the
+    Content-Length header).
+    :return: the context.
+    """
+    if stream:
+        size = int(response.headers.get('Content-Length', 0) or 0)
+    else:
+        size = len(response.content or b'')
+
+    elapsed = getattr(response, 'elapsed', None)
+    context['status_code'] = response.status_code
+    context['size'] = size
+    context['timings'] = {
+        'total': time.perf_counter() - context['perf_start'],
+        # requests measures from sending until the headers are parsed.
+        'ttfb': elapsed.total_seconds() if elapsed is not None else None,
+        'dns': None,
+        'connect': None}
+    return context
+
+
+def add_error(context: dict, error: BaseException):
+    """
+    Add the exception of a failed request to a context (and the total time,
+    if no response was received).
+
+    :param context: the context dict of the request.
+    :param error: the exception.
+    :return: the context.
+    """
+    context['error'] = error
+    if 'timings' not in context:
+        context['timings'] = {
+            'total': time.perf_counter() - context['perf_start'],
+            'ttfb': None,
+            'dns': None,
+            'connect': None}
+    return context
@@ -0,0 +1,274 @@
+"""
+Bulk ingestion of malware samples: a whole directory is hashed in a process
+pool, the samples already uploaded are skipped and the rest are uploaded
+with a bounded number of requests in flight.
+
+A sample is skipped when its sha256 is in the local ledger (a SQLite
+database with every sample uploaded or found on the server by previous
+runs) or when the server already knows it (MalwaresRequest.show), so a
+re-run only uploads the new samples:
+
+    ledger = UploadLedger('/var/lib/collector/uploads.db')
+    for ingested in malwares.upload_directory('/quarantine', ledger=ledger):
+        print(ingested.path, ingested.status)
+
+"""
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+from .configuration import FANOUT_WORKERS, UPLOAD_CHUNK_SIZE
+from .fanout import bounded_map
+
+IngestResult = collections.namedtuple('IngestResult',
+                                      ('path', 'sha256', 'md5', 'status',
+                                       'result', 'error'))
+
+UPLOADED = 'uploaded'
+IN_LEDGER = 'ledger'
+ON_SERVER = 'server'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+
+# Files submitted to the hashing pool per process, ahead of the results.
+HASH_WINDOW = 4
+
+
+def hash_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Hash a file in chunks (a module function, so process pools can run it).
+
+    :param path: the file.
+    :param chunk_size: the number of bytes read at a time.
+    :return: tuple (path, md5, sha256, size), with the hex digests.
+    """
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as sample:
+        for chunk in iter(lambda: sample.read(chunk_size), b''):
+            md5.update(chunk)
+            sha256.update(chunk)
+            size += len(chunk)
+    return path, md5.hexdigest(), sha256.hexdigest(), size
+
+
+def iter_files(directory: str, recursive: bool = True):
+    """
+    Walk the regular files of a directory, in name order.
+
+    :param directory: the directory.
+    :param recursive: include the files of the subdirectories.
+    :return: a generator of paths.
+    """
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        if not recursive:
+            directories[:] = []
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                yield path
+
+
+def hash_files(paths: typing.Iterable[str],
+               workers: typing.Optional[int] = None):
+    """
+    Hash files in a process pool (hashing is CPU bound, so threads would be
+    serialized). The paths are consumed lazily, with at most a few files
+    per process waiting to be hashed, and a file that fails (unreadable,
+    removed meanwhile...) does not stop the others.
+
+    :param paths: iterable with the files.
+    :param workers: the number of processes (None for one per CPU, 0 to hash
+    in the current process).
+    :return: a generator of (path, hashed, exception) tuples, in order,
+    where hashed is the (path, md5, sha256, size) tuple of hash_file, or
+    None if exception is not.
+    """
+    if workers == 0:
+        for path in paths:
+            try:
+                yield path, hash_file(path), None
+            except Exception as exception:  # pylint: disable=broad-except
+                yield path, None, exception
+        return
+
+    def outcome(path, future):
+        try:
+            return path, future.result(), None
+        except Exception as exception:  # pylint: disable=broad-except
+            return path, None, exception
+
+    window = HASH_WINDOW * (workers or os.cpu_count() or 1)
+    pending = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for path in paths:
+                pending.append((path, pool.submit(hash_file, path)))
+                if len(pending) >= window:
+                    yield outcome(*pending.popleft())
+            while pending:
+                yield outcome(*pending.popleft())
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+class UploadLedger:
+    """UploadLedger keeps in a SQLite database the sha256 of every sample
+    uploaded (or found on the server), so they are not uploaded again.
+
+    Attributes:
+        path: the database file (':memory:' for a volatile one).
+
+    """
+
+    path: str = ':memory:'
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS uploads ('
+                ' sha256 TEXT PRIMARY KEY,'
+                ' md5 TEXT,'
+                ' filename TEXT,'
+                ' size INTEGER,'
+                ' status TEXT NOT NULL,'
+                ' updated_at REAL NOT NULL)')
+
+    def get(self, sha256: str):
+        """
+        Retrieve the record of a sample.
+
+        :param sha256: the sha256 of the sample.
+        :return: dict with md5, filename, size and status, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT md5, filename, size, status FROM uploads'
+                ' WHERE sha256 = ?', (sha256,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('md5', 'filename', 'size', 'status'), row))
+
+    def add(self,  # pylint: disable=too-many-arguments
+            sha256: str,
+            md5: str,
+            filename: str,
+            size: int,
+            status: str = UPLOADED):
+        """
+        Record a sample (committed before returning).
+
+        :param sha256: the sha256 of the sample.
+        :param md5: the md5 of the sample.
+        :param filename: the file it was read from.
+        :param size: its size in bytes.
+        :param status: uploaded or server (already known there).
+        :return: nothing.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO uploads (sha256, md5, filename, size,'
+                ' status, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (sha256, md5, filename, size, status, time.time()))
+
+    def __contains__(self, sha256: str):
+        return self.get(sha256) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM uploads').fetchone()[0]
+
+    def close(self):
+        """
+        Close the database.
+
+        :return: nothing.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+def ingest_directory(malwares,  # pylint: disable=too-many-arguments
+                     directory: str,
+                     ledger: typing.Optional[UploadLedger] = None,
+                     recursive: bool = True,
+                     workers: int = FANOUT_WORKERS,
+                     hash_workers: typing.Optional[int] = None,
+                     check_server: bool = True):
+    """
+    Upload the samples of a directory that are not in the ledger nor on the
+    server (see MalwaresRequest.upload_directory).
+
+    :return: a generator of IngestResult, one per file.
+    """
+    if ledger is None:
+        ledger = UploadLedger()
+
+    def upload(hashed):
+        path, md5, sha256, size = hashed
+        if check_server:
+            try:
+                known = malwares.show(sha256, as_json=True)
+            except Exception as error:  # pylint: disable=broad-except
+                # Only a 404 means unknown: auth, rate limit or network
+                # errors fail the file instead of uploading it blindly.
+                if getattr(error, 'status_code', None) != 404:
+                    raise
+                known = None
+            if known:
+                ledger.add(sha256, md5, path, size, ON_SERVER)
+                return ON_SERVER, known
+
+        result = malwares.upload(path, as_json=True)
+        ledger.add(sha256, md5, path, size, UPLOADED)
+        return UPLOADED, result
+
+    seen = set()
+    skipped = collections.deque()
+
+    def pending():
+        for path, hashed, error in hash_files(iter_files(directory,
+                                                         recursive),
+                                              hash_workers):
+            if error is not None:
+                skipped.append(IngestResult(path, None, None, FAILED, None,
+                                            error))
+                continue
+            md5, sha256 = hashed[1:3]
+            if sha256 in seen:
+                skipped.append(IngestResult(path, sha256, md5, DUPLICATE,
+                                            None, None))
+            elif sha256 in ledger:
+                skipped.append(IngestResult(path, sha256, md5, IN_LEDGER,
+                                            ledger.get(sha256), None))
+            else:
+                seen.add(sha256)
+                yield hashed
+
+    for hashed, outcome, error in bounded_map(upload,
+                                              pending(),
+                                              workers=workers,
+                                              ordered=False):
+        while skipped:
+            yield skipped.popleft()
+        path, md5, sha256 = hashed[:3]
+        if error is not None:
+            yield IngestResult(path, sha256, md5, FAILED, None, error)
+        else:
+            yield IngestResult(path, sha256, md5, outcome[0], outcome[1],
+                               None)
+
+    while skipped:
+        yield skipped.popleft()
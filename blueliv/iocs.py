@@ -2,6 +2,10 @@
 Module to deal and manage IoCs.
 
 """
+import array
+import datetime
+import functools
+import itertools
 import typing
 
 from .configuration import (  # pylint: disable=E0401
@@ -33,33 +37,414 @@ class BluelivIOC(BASEModel):  # pylint: disable=too-few-public-methods
     Model to store IOC information.
 
     """
-    spark_id = None
-    ioc_id = None
-    content = None
-    ioc_type = None
-    ioc_subtype = None
-    created_at = None
+
+    __slots__ = ('spark_id', 'ioc_id', 'content', 'ioc_type', 'ioc_subtype',
+                 'created_at')
+
+    _api_fields = (('spark_id', 'spark_id'), ('id', 'ioc_id'),
+                   ('content', 'content'), ('type', 'ioc_type'),
+                   ('subtype', 'ioc_subtype'), ('created_at', 'created_at'))
+
+    spark_id: typing.Optional[int]
+    ioc_id: typing.Optional[int]
+    content: typing.Optional[str]
+    ioc_type: typing.Optional[str]
+    ioc_subtype: typing.Optional[str]
+    created_at: typing.Optional[str]
 
     def __init__(self, **kwargs):
-        if 'spark_id' in kwargs:
-            self.spark_id = kwargs.get('spark_id', None)
+        self.spark_id = kwargs.get('spark_id', None)
+        self.ioc_id = kwargs.get('ioc_id', None)
+        self.content = kwargs.get('content', None)
+        self.ioc_type = kwargs.get('ioc_type', None)
+        self.ioc_subtype = kwargs.get('ioc_subtype', None)
+        self.created_at = kwargs.get('created_at', None)
 
-        if 'ioc_id' in kwargs:
-            self.ioc_id = kwargs.get('ioc_id', None)
+        super().__init__()
 
-        if 'content' in kwargs:
-            self.content = kwargs.get('content', None)
 
-        if 'ioc_type' in kwargs:
-            self.ioc_type = kwargs.get('ioc_type', None)
+IOC_TYPE_CODES = {name: code for code, name in BluelivIOCTypes}
+IOC_SUBTYPE_CODES = {name: code for code, name in BluelivIOCSubtypes}
+IOC_TYPE_NAMES = dict(BluelivIOCTypes)
+IOC_SUBTYPE_NAMES = dict(BluelivIOCSubtypes)
 
-        if 'ioc_subtype' in kwargs:
-            self.ioc_subtype = kwargs.get('ioc_subtype', None)
+# Code for a missing or unknown type/subtype, and epoch for a missing time.
+UNKNOWN_CODE = -1
+UNKNOWN_TIME = 0
 
-        if 'created_at' in kwargs:
-            self.created_at = kwargs.get('created_at', None)
 
-        super().__init__()
+def to_epoch(value):
+    """
+    Convert a timestamp (ISO 8601 string, datetime or epoch number) into
+    epoch seconds. Naive timestamps are taken as UTC.
+
+    :param value: the timestamp.
+    :return: int with the epoch seconds (UNKNOWN_TIME if missing/invalid).
+    """
+    if value is None or value == '':
+        return UNKNOWN_TIME
+
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value.replace('Z',
+                                                                  '+00:00'))
+        except ValueError:
+            return UNKNOWN_TIME
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return int(value.timestamp())
+
+
+class IocBatch:
+    """IocBatch stores IoCs column-wise in typed arrays, so millions of them
+    cost a few dozen bytes each instead of a Python object per indicator:
+
+        batch = IocBatch.from_list(iocs.timeline(limit=1000, as_json=True))
+        domains = batch.filter_types('DOMAIN', 'HOST')
+        recent = domains.filter_time(since='2020-11-01T00:00:00Z')
+
+    Ids and spark ids are int64 arrays (-1 when missing), types and subtypes
+    int8 codes from BluelivIOCTypes/BluelivIOCSubtypes (UNKNOWN_CODE if not
+    listed there), created_at int64 epoch seconds, and the contents live in
+    one UTF-8 buffer where the values repeated in an extend call are stored
+    once.
+
+    The columns are exposed as memoryviews (numpy.frombuffer can use them
+    without copying); release them before appending more IoCs. Slicing
+    (batch[10:20]) returns a read-only view sharing the same arrays; filters
+    return new batches sharing the content buffer.
+
+    The type and subtype filters build their row mask with one
+    bytes.translate call over the int8 column. The time filter builds its
+    mask row by row, as the standard library has no comparison over a whole
+    int64 array. Either way, the selected rows are then copied out of each
+    column one value at a time.
+
+    """
+
+    _COLUMNS = (('ids', 'q'), ('spark_ids', 'q'), ('types', 'b'),
+                ('subtypes', 'b'), ('created_at', 'q'),
+                ('content_start', 'q'), ('content_end', 'q'))
+
+    def __init__(self):
+        self._columns = {name: array.array(typecode)
+                         for name, typecode in self._COLUMNS}
+        self._content = bytearray()
+        self._read_only = False
+        self._start = 0
+        self._stop = None
+
+    @classmethod
+    def from_list(cls, items: typing.Iterable):
+        """
+        Build a batch from IoCs.
+
+        :param items: API items (dicts) or BluelivIOC models.
+        :return: the new IocBatch.
+        """
+        batch = cls()
+        batch.extend(items)
+        return batch
+
+    def _view(self, start: int, stop: int):
+        """
+        A read-only batch over a range of rows, sharing every buffer.
+
+        :param start: the first row (absolute).
+        :param stop: the row after the last one (absolute).
+        :return: the IocBatch view.
+        """
+        view = self.__class__.__new__(self.__class__)
+        view._columns = self._columns
+        view._content = self._content
+        view._read_only = True
+        view._start = start
+        view._stop = stop
+        return view
+
+    def _bounds(self):
+        stop = self._stop
+        if stop is None:
+            stop = len(self._columns['ids'])
+        return self._start, stop
+
+    def _store(self, content: str, interned: typing.Optional[dict] = None):
+        """
+        Store a content in the buffer (once, if it is already interned).
+
+        :param content: the IoC content.
+        :param interned: dict with the spans of the contents already stored.
+        :return: tuple (start, end) in the buffer.
+        """
+        span = None if interned is None else interned.get(content, None)
+        if span is None:
+            data = content.encode('utf-8')
+            start = len(self._content)
+            self._content += data
+            span = (start, start + len(data))
+            if interned is not None:
+                interned[content] = span
+        return span
+
+    def append(self, ioc, interned: typing.Optional[dict] = None):
+        """
+        Add an IoC at the end of the batch.
+
+        :param ioc: an API item (dict) or a BluelivIOC.
+        :param interned: dict to share repeated contents (see extend).
+        :return: nothing.
+        """
+        if self._read_only:
+            raise Exception('IocBatch views are read-only')
+
+        if isinstance(ioc, BluelivIOC):
+            ioc = ioc.to_dict()
+
+        columns = self._columns
+        ioc_id = ioc.get('id', None)
+        spark_id = ioc.get('spark_id', None)
+        start, end = self._store(ioc.get('content', None) or '', interned)
+
+        columns['ids'].append(-1 if ioc_id is None else int(ioc_id))
+        columns['spark_ids'].append(-1 if spark_id is None else int(spark_id))
+        columns['types'].append(IOC_TYPE_CODES.get(ioc.get('type', None),
+                                                   UNKNOWN_CODE))
+        columns['subtypes'].append(
+            IOC_SUBTYPE_CODES.get(ioc.get('subtype', None), UNKNOWN_CODE))
+        columns['created_at'].append(to_epoch(ioc.get('created_at', None)))
+        columns['content_start'].append(start)
+        columns['content_end'].append(end)
+
+    def extend(self, items: typing.Iterable):
+        """
+        Add several IoCs at the end of the batch.
+
+        :param items: API items (dicts) or BluelivIOC models.
+        :return: nothing.
+        """
+        # The index of repeated contents only lives during the call, so the
+        # batch does not keep a Python object per distinct content.
+        interned = {}
+        for item in items:
+            if isinstance(item, (dict, BluelivIOC)):
+                self.append(item, interned)
+
+    def column(self, name: str):
+        """
+        A zero-copy view of a column.
+
+        :param name: ids, spark_ids, types, subtypes or created_at.
+        :return: memoryview with the column values of the batch rows.
+        """
+        start, stop = self._bounds()
+        return memoryview(self._columns[name])[start:stop]
+
+    @property
+    def ids(self):
+        """The IoC ids (int64 memoryview)."""
+        return self.column('ids')
+
+    @property
+    def spark_ids(self):
+        """The spark ids (int64 memoryview)."""
+        return self.column('spark_ids')
+
+    @property
+    def types(self):
+        """The type codes (int8 memoryview), see IOC_TYPE_CODES."""
+        return self.column('types')
+
+    @property
+    def subtypes(self):
+        """The subtype codes (int8 memoryview), see IOC_SUBTYPE_CODES."""
+        return self.column('subtypes')
+
+    @property
+    def created_at(self):
+        """The creation times (int64 epoch seconds memoryview)."""
+        return self.column('created_at')
+
+    def content(self, index: int):
+        """
+        The content of a row.
+
+        :param index: the row, relative to the batch.
+        :return: str with the content.
+        """
+        row = self._row(index)
+        start = self._columns['content_start'][row]
+        end = self._columns['content_end'][row]
+        return self._content[start:end].decode('utf-8')
+
+    def contents(self):
+        """
+        Iterate over the contents of the rows.
+
+        :return: a generator of str.
+        """
+        content = self._content
+        for start, end in zip(self.column('content_start'),
+                              self.column('content_end')):
+            yield content[start:end].decode('utf-8')
+
+    def _row(self, index: int):
+        """
+        The absolute row of an index relative to the batch.
+
+        :param index: the index (negative ones count from the end).
+        :return: the absolute row.
+        """
+        start, stop = self._bounds()
+        if index < 0:
+            index += stop - start
+        if index < 0 or start + index >= stop:
+            raise IndexError('IocBatch index out of range')
+        return start + index
+
+    def take(self, indices: typing.Iterable[int]):
+        """
+        A new batch with some rows (in the given order). It shares the
+        content buffer with this one.
+
+        :param indices: the rows, relative to the batch.
+        :return: the new IocBatch.
+        """
+        start, _ = self._bounds()
+        return self._take_rows([start + index for index in indices])
+
+    def _take_rows(self, rows: list):
+        """
+        A new batch with some rows, given as absolute rows.
+
+        :param rows: list of absolute rows.
+        :return: the new IocBatch.
+        """
+        batch = self.__class__.__new__(self.__class__)
+        batch._columns = {
+            name: array.array(typecode,
+                              map(self._columns[name].__getitem__, rows))
+            for name, typecode in self._COLUMNS}
+        batch._content = self._content
+        batch._read_only = False
+        batch._start = 0
+        batch._stop = None
+        return batch
+
+    def _filter_codes(self, name: str, codes: set):
+        """
+        The rows whose int8 code column is one of codes: the column bytes
+        are translated into a 0/1 mask in one call.
+
+        :param name: types or subtypes.
+        :param codes: set of codes.
+        :return: a new IocBatch.
+        """
+        # A byte b holds the int8 code b (b < 128) or b - 256.
+        table = bytes(int(((byte ^ 0x80) - 0x80) in codes)
+                      for byte in range(256))
+        return self._filter_mask(bytes(self.column(name)).translate(table))
+
+    def _filter_mask(self, mask: bytes):
+        """
+        A new batch with the rows whose mask byte is not zero.
+
+        :param mask: bytes with a flag per row of the batch.
+        :return: the new IocBatch.
+        """
+        start, stop = self._bounds()
+        return self._take_rows(list(itertools.compress(range(start, stop),
+                                                       mask)))
+
+    def filter_types(self, *types: str):
+        """
+        The IoCs of some types.
+
+        :param types: type names (as in BluelivIOCTypes).
+        :return: a new IocBatch.
+        """
+        return self._filter_codes('types', {
+            IOC_TYPE_CODES.get(name, UNKNOWN_CODE) for name in types})
+
+    def filter_subtypes(self, *subtypes: str):
+        """
+        The IoCs of some subtypes.
+
+        :param subtypes: subtype names (as in BluelivIOCSubtypes).
+        :return: a new IocBatch.
+        """
+        return self._filter_codes('subtypes', {
+            IOC_SUBTYPE_CODES.get(name, UNKNOWN_CODE) for name in subtypes})
+
+    def filter_time(self, since=None, until=None):
+        """
+        The IoCs created in a time range. IoCs with no time are excluded if
+        since is set.
+
+        :param since: the first time included (ISO string, datetime or epoch).
+        :param until: the first time excluded (ISO string, datetime or epoch).
+        :return: a new IocBatch.
+        """
+        low = -(1 << 63) if since is None else to_epoch(since)
+        high = 1 << 63 if until is None else to_epoch(until)
+        # There is no int64 comparison over a whole array without numpy:
+        # the mask is built row by row.
+        return self._filter_mask(bytes(low <= created < high
+                                       for created in self.created_at))
+
+    def ioc(self, index: int):
+        """
+        Build the model of a row.
+
+        :param index: the row, relative to the batch.
+        :return: a BluelivIOC.
+        """
+        row = self._row(index)
+        columns = self._columns
+        ioc_id = columns['ids'][row]
+        spark_id = columns['spark_ids'][row]
+        created = columns['created_at'][row]
+        if created != UNKNOWN_TIME:
+            created = datetime.datetime.fromtimestamp(
+                created, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        else:
+            created = None
+
+        return BluelivIOC(ioc_id=None if ioc_id == -1 else ioc_id,
+                          spark_id=None if spark_id == -1 else spark_id,
+                          content=self.content(index),
+                          ioc_type=IOC_TYPE_NAMES.get(columns['types'][row]),
+                          ioc_subtype=IOC_SUBTYPE_NAMES.get(
+                              columns['subtypes'][row]),
+                          created_at=created)
+
+    @property
+    def nbytes(self):
+        """The memory used by the columns and the content buffer."""
+        start, stop = self._bounds()
+        return len(self._content) + sum(
+            self._columns[name].itemsize * (stop - start)
+            for name, _ in self._COLUMNS)
+
+    def __len__(self):
+        start, stop = self._bounds()
+        return stop - start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = self._bounds()
+            first, last, step = index.indices(stop - start)
+            if step != 1:
+                return self.take(range(first, last, step))
+            return self._view(start + first, start + max(first, last))
+        return self.ioc(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.ioc(index)
 
 
 class IocsRequest(BluelivRequest):  # pylint: disable=R0902
@@ -113,18 +498,28 @@ class IocsRequest(BluelivRequest):  # pylint: disable=R0902
                          base_url=self._base_url,
                          category=self._category,
                          limit=self.limit,
-                         since_id=self.since_id)
+                         since_id=self.since_id,
+                         transport=kwargs.get('transport', None),
+                         mirror=kwargs.get('mirror', None))
 
-    def _private_request(self, resource_url: str, params: dict):
+    def _private_request(self, resource_url: str, params: dict,
+                         as_json: bool = False, stream: bool = False,
+                         as_model: bool = False):
         """
         This is a wrapper method to reduce code and make it cleaner.
 
         :param resource_url: the url to send the request.
         :param params: all the parameters for the request.
-        :return: dict, list or JSON.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param stream: if we want a generator of items (True).
+        :param as_model: if we want BluelivIOC models instead of dicts (True).
+        :return: dict, list, JSON or a generator.
         """
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            stream=stream,
+                            model=BluelivIOC if as_model else None)
 
     def types(self):
         """
@@ -137,13 +532,19 @@ class IocsRequest(BluelivRequest):  # pylint: disable=R0902
         results = self.request(resource=resource)
         return results
 
-    def timeline(self, limit=None, since_id=None):
+    def timeline(self,  # pylint: disable=too-many-arguments
+                 limit=None, since_id=None, as_json: bool = False,
+                 stream: bool = False, as_model: bool = False):
         """
         Retrieve the latest IoCs with a timestamp mark.
 
         :param limit: the maximum number of item we want to receive.
         :param since_id: the reference since we want to get the information.
-        :return: list, dict or JSON.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param stream: if we want a generator of IoCs, decoded while the
+        response is received (True).
+        :param as_model: if we want BluelivIOC models instead of dicts (True).
+        :return: list, dict, JSON or a generator (if stream == True).
 
         """
         params = {}
@@ -158,15 +559,42 @@ class IocsRequest(BluelivRequest):  # pylint: disable=R0902
                                  self._iocs_timeline_url)
 
         return self._private_request(resource_url=resource_url,
-                                     params=params)
+                                     params=params,
+                                     as_json=as_json,
+                                     stream=stream,
+                                     as_model=as_model)
+
+    def iter_timeline(self, limit=None, since_id=None,
+                      prefetch: bool = True):
+        """
+        Iterate over the timeline IoCs one at a time, following the since_id
+        cursor page after page (see blueliv.pagination).
 
-    def discover(self, limit=None, since_id=None):
+        :param limit: the page size.
+        :param since_id: the reference since we want to get the information.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of IoCs (dicts).
+
+        """
+        return self._iter_pages(functools.partial(self.timeline,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
+
+    def discover(self,  # pylint: disable=too-many-arguments
+                 limit=None, since_id=None, as_json: bool = False,
+                 stream: bool = False, as_model: bool = False):
         """
         Retrieve the latest sparks and IoC information published.
 
         :param limit: the maximum number of item we want to receive.
         :param since_id: the reference since we want to get the information.
-        :return: list, dict or JSON.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param stream: if we want a generator of IoCs, decoded while the
+        response is received (True).
+        :param as_model: if we want BluelivIOC models instead of dicts (True).
+        :return: list, dict, JSON or a generator (if stream == True).
 
         """
         params = {}
@@ -180,4 +608,25 @@ class IocsRequest(BluelivRequest):  # pylint: disable=R0902
             params['limit'] = limit
 
         return self._private_request(resource_url=resource_url,
-                                     params=params)
+                                     params=params,
+                                     as_json=as_json,
+                                     stream=stream,
+                                     as_model=as_model)
+
+    def iter_discover(self, limit=None, since_id=None,
+                      prefetch: bool = True):
+        """
+        Iterate over the discover IoCs one at a time, following the since_id
+        cursor page after page (see blueliv.pagination).
+
+        :param limit: the page size.
+        :param since_id: the reference since we want to get the information.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of IoCs (dicts).
+
+        """
+        return self._iter_pages(functools.partial(self.discover,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
@@ -0,0 +1,199 @@
+"""
+Structured, levelled logging for the package, on the standard logging
+module (logger 'blueliv').
+
+Events have a name and fields, as:
+
+    log.debug('request.prepared', method='GET', url=url, params=params)
+
+Nothing is formatted unless the level is enabled: the fields are kept as
+they are and only the handler turns them into text (key=value pairs) or a
+JSON line. With logging off, an event costs a level check.
+
+High-rate events may be sampled: with sample=N (or
+BLUELIV_API_LOG_SAMPLE_EVERY) only one of every N occurrences of an event
+is logged, with the number of occurrences in the sampled field.
+
+The package adds no handler by default (the application configures
+logging). configure_logging adds one to the 'blueliv' logger, and it is
+called on import when BLUELIV_API_LOG_LEVEL (or BLUELIV_API_DEBUG) is set:
+
+    BLUELIV_API_LOG_LEVEL=DEBUG BLUELIV_API_LOG_FORMAT=json python sync.py
+
+Header values (the Authorization token) are never logged: use
+redact_headers.
+
+"""
+import itertools
+import json
+import logging
+import sys
+import typing
+
+from .configuration import DEBUG, LOG_FORMAT, LOG_LEVEL, LOG_SAMPLE_EVERY
+
+REDACTED = '<redacted>'
+_EXPOSED_HEADERS = ('accept', 'content-length', 'content-type',
+                    'if-modified-since', 'if-none-match', 'user-agent')
+
+
+def redact_headers(headers: typing.Optional[dict]):
+    """
+    A copy of the headers safe to log: only well known, harmless values are
+    kept (the Authorization token and any other value are redacted).
+
+    :param headers: the request headers.
+    :return: dict with the redacted headers.
+    """
+    return {name: value if name.lower() in _EXPOSED_HEADERS else REDACTED
+            for name, value in (headers or {}).items()}
+
+
+class StructuredLogger:
+    """StructuredLogger logs named events with fields through a standard
+    logging.Logger, checking the level before doing anything else.
+
+    Attributes:
+        logger: the logging.Logger.
+
+        sample_every: the default sampling (1 logs every occurrence).
+
+    """
+
+    logger: typing.Optional[logging.Logger] = None
+    sample_every: int = LOG_SAMPLE_EVERY
+
+    def __init__(self, name: str = 'blueliv', **kwargs):
+        self.logger = logging.getLogger(name)
+        self.sample_every = max(1, int(kwargs.get('sample_every',
+                                                  LOG_SAMPLE_EVERY)))
+        self._counters = {}
+
+    def enabled(self, level: int = logging.DEBUG):
+        """
+        :param level: the logging level.
+        :return: True if events of that level are logged.
+        """
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, event: str,
+            sample: typing.Optional[int] = None, **fields):
+        """
+        Log an event, if its level is enabled (and it is not sampled out).
+
+        :param level: the logging level.
+        :param event: the event name.
+        :param sample: log one of every sample occurrences (None for the
+        default sampling).
+        :param fields: the event fields.
+        :return: nothing.
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+
+        sample = self.sample_every if sample is None else sample
+        if sample > 1:
+            counter = self._counters.get(event, None)
+            if counter is None:
+                counter = self._counters.setdefault(event, itertools.count(1))
+            occurrence = next(counter)
+            if (occurrence - 1) % sample:
+                return
+            fields['sampled'] = sample
+
+        self.logger.log(level, event, extra={'blueliv_fields': fields})
+
+    def debug(self, event: str, sample: typing.Optional[int] = None,
+              **fields):
+        """Log a DEBUG event (see log)."""
+        self.log(logging.DEBUG, event, sample, **fields)
+
+    def info(self, event: str, sample: typing.Optional[int] = None,
+             **fields):
+        """Log an INFO event (see log)."""
+        self.log(logging.INFO, event, sample, **fields)
+
+    def warning(self, event: str, sample: typing.Optional[int] = None,
+                **fields):
+        """Log a WARNING event (see log)."""
+        self.log(logging.WARNING, event, sample, **fields)
+
+    def error(self, event: str, sample: typing.Optional[int] = None,
+              **fields):
+        """Log an ERROR event (see log)."""
+        self.log(logging.ERROR, event, sample, **fields)
+
+
+def _fields(record: logging.LogRecord):
+    return getattr(record, 'blueliv_fields', None) or {}
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Format events as 'time level logger event key=value ...'.
+
+    """
+
+    def format(self, record: logging.LogRecord):
+        text = '%s %s %s %s' % (self.formatTime(record), record.levelname,
+                                record.name, record.getMessage())
+        fields = _fields(record)
+        if fields:
+            text += ' ' + ' '.join('%s=%r' % item for item in fields.items())
+        if record.exc_info:
+            text += '\n' + self.formatException(record.exc_info)
+        return text
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format events as JSON lines: ts, level, logger, event and the fields
+    (values that are not JSON types are written as strings).
+
+    """
+
+    def format(self, record: logging.LogRecord):
+        document = {'ts': record.created,
+                    'level': record.levelname,
+                    'logger': record.name,
+                    'event': record.getMessage()}
+        document.update(_fields(record))
+        if record.exc_info:
+            document['exception'] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str)
+
+
+def configure_logging(level=logging.INFO,
+                      log_format: str = 'text',
+                      stream=None):
+    """
+    Add a handler to the 'blueliv' logger (replacing the one added by a
+    previous call).
+
+    :param level: the level (name or number).
+    :param log_format: text or json.
+    :param stream: where to write (sys.stderr by default).
+    :return: the handler.
+    """
+    logger = logging.getLogger('blueliv')
+    for handler in list(logger.handlers):
+        if getattr(handler, 'blueliv_handler', False):
+            logger.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.blueliv_handler = True
+    handler.setFormatter(JSONFormatter() if log_format == 'json'
+                         else TextFormatter())
+    logger.addHandler(handler)
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logger.setLevel(level)
+    return handler
+
+
+logging.getLogger('blueliv').addHandler(logging.NullHandler())
+
+if LOG_LEVEL or DEBUG:
+    configure_logging(LOG_LEVEL or logging.DEBUG, LOG_FORMAT)
+
+log = StructuredLogger()  # pylint: disable=C0103
@@ -2,12 +2,16 @@
 Module to deal with malware samples
 
 """
+import typing
 
 from .configuration import (  # pylint: disable=E0401
-    BASE_MALWARES_URL, BASE_MALWARES_UPLOAD_URL
+    BASE_MALWARES_URL, BASE_MALWARES_UPLOAD_URL, FANOUT_WORKERS,
+    UPLOAD_CHUNK_SIZE
 )
 
 from .core import BASEModel, BluelivRequest  # pylint: disable=E0401
+from .ingest import UploadLedger, ingest_directory
+from .multipart import MultipartFile
 
 
 class BluelivMalware(BASEModel):
@@ -21,43 +25,36 @@ class BluelivMalware(BASEModel):
     # All attributes are necessary.
     # Is an object without actions. Actions to be implemented in next versions
 
-    malware_id = None
-    file = dict()
-    status = None
-    upload_date = None
-    malicious = None
-    domains = list()
-    hosts = list()
-    detected_antivirus = None
-    total_antivirus = None
+    __slots__ = ('malware_id', 'file', 'status', 'upload_date', 'malicious',
+                 'domains', 'hosts', 'detected_antivirus', 'total_antivirus')
+
+    _api_fields = (('id', 'malware_id'), ('file', 'file'),
+                   ('status', 'status'), ('upload_date', 'upload_date'),
+                   ('malicious', 'malicious'), ('domains', 'domains'),
+                   ('hosts', 'hosts'),
+                   ('detected_antivirus', 'detected_antivirus'),
+                   ('total_antivirus', 'total_antivirus'))
+
+    malware_id: typing.Optional[str]
+    file: dict
+    status: typing.Optional[str]
+    upload_date: typing.Optional[str]
+    malicious: typing.Optional[bool]
+    domains: list
+    hosts: list
+    detected_antivirus: typing.Optional[int]
+    total_antivirus: typing.Optional[int]
 
     def __init__(self, **kwargs):
-        if 'malware_id' in kwargs:
-            self.malware_id = kwargs.get('malware_id', None)
-
-        if 'status' in kwargs:
-            self.status = kwargs.get('status', None)
-
-        if 'upload_date' in kwargs:
-            self.upload_date = kwargs.get('upload_date', None)
-
-        if 'malicious' in kwargs:
-            self.malicious = kwargs.get('malicious', None)
-
-        if 'detected_antivirus' in kwargs:
-            self.detected_antivirus = kwargs.get('detected_antivirus', None)
-
-        if 'total_antivirus' in kwargs:
-            self.total_antivirus = kwargs.get('total_antivirus', None)
-
-        if 'file' in kwargs:
-            self.file = kwargs.get('file', {})
-
-        if 'domains' in kwargs:
-            self.domains = kwargs.get('domains', [])
-
-        if 'hosts' in kwargs:
-            self.hosts = kwargs.get('hosts', [])
+        self.malware_id = kwargs.get('malware_id', None)
+        self.status = kwargs.get('status', None)
+        self.upload_date = kwargs.get('upload_date', None)
+        self.malicious = kwargs.get('malicious', None)
+        self.detected_antivirus = kwargs.get('detected_antivirus', None)
+        self.total_antivirus = kwargs.get('total_antivirus', None)
+        self.file = kwargs.get('file', {})
+        self.domains = kwargs.get('domains', [])
+        self.hosts = kwargs.get('hosts', [])
 
         super().__init__()
 
@@ -70,20 +67,29 @@ class BluelivUploadResponse(BASEModel):
     # pylint: disable=too-few-public-methods
     # Model to manage a remote response
 
-    md5 = None
-    sha256 = None
-    platform_type = None
-    file_size = 0
-    upload_status = None
-    fileName = None
-
-    def __init__(self):
-        self.md5 = None
-        self.sha256 = None
-        self.platform_type = None
-        self.file_size = 0
-        self.upload_status = None
-        self.file_name = None
+    __slots__ = ('md5', 'sha256', 'platform_type', 'file_size',
+                 'upload_status', 'file_name')
+
+    _api_fields = (('md5', 'md5'), ('sha256', 'sha256'),
+                   ('platformType', 'platform_type'),
+                   ('fileSize', 'file_size'),
+                   ('uploadStatus', 'upload_status'),
+                   ('fileName', 'file_name'))
+
+    md5: typing.Optional[str]
+    sha256: typing.Optional[str]
+    platform_type: typing.Optional[str]
+    file_size: int
+    upload_status: typing.Optional[str]
+    file_name: typing.Optional[str]
+
+    def __init__(self, **kwargs):
+        self.md5 = kwargs.get('md5', None)
+        self.sha256 = kwargs.get('sha256', None)
+        self.platform_type = kwargs.get('platform_type', None)
+        self.file_size = kwargs.get('file_size', 0)
+        self.upload_status = kwargs.get('upload_status', None)
+        self.file_name = kwargs.get('file_name', None)
 
         super().__init__()
 
@@ -137,14 +143,19 @@ class MalwaresRequest(BluelivRequest):  # pylint: disable=R0902
                          base_url=self._base_url,
                          category=self._category,
                          limit=self.limit,
-                         since_id=self.since_id)
+                         since_id=self.since_id,
+                         transport=kwargs.get('transport', None),
+                         mirror=kwargs.get('mirror', None))
 
-    def list(self, page: int = 0, page_size: int = 0):
+    def list(self, page: int = 0, page_size: int = 0, as_json: bool = False,
+             as_model: bool = False):
         """
         List malware items with pagination.
 
         :param page: the page number we want to list.
         :param page_size: the maximum number of pages.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param as_model: if we want BluelivMalware models instead of dicts.
         :return: dict, list or JSON.
 
         """
@@ -163,41 +174,141 @@ class MalwaresRequest(BluelivRequest):  # pylint: disable=R0902
                 params['pageSize'] = self.page_size
 
         results = self.request(resource=self._base_url,
-                               params=params)
+                               params=params,
+                               as_json=as_json,
+                               model=BluelivMalware if as_model else None)
 
         return results
 
-    def show(self, malware_id: str):
+    def iter_list(self,  # pylint: disable=too-many-arguments
+                  page_size: int = 0,
+                  start_page: int = 1,
+                  workers: int = FANOUT_WORKERS,
+                  max_pages: typing.Optional[int] = None):
+        """
+        Iterate over the malware items of every page, one at a time and in
+        order. Pages are independent, so up to workers of them are requested
+        at the same time. It stops on the first empty or short page.
+
+        :param page_size: the page size (0 to use the object page_size, or
+        the server default).
+        :param start_page: the first page we want to list.
+        :param workers: the maximum number of pages requested at a time.
+        :param max_pages: the maximum number of pages to walk, if any.
+        :return: a generator of malware items (dicts).
+
+        """
+        if page_size == 0:
+            page_size = self.page_size
+
+        def fetch(page, page_size):
+            return self.list(page=page, page_size=page_size, as_json=True)
+
+        return self._iter_numbered_pages(fetch,
+                                         start_page=start_page,
+                                         page_size=page_size or None,
+                                         workers=workers,
+                                         max_pages=max_pages)
+
+    def show(self, malware_id: str, as_json: bool = False,
+             as_model: bool = False):
         """
         Show details about an specific malware sample identified by the id.
         :param malware_id: the id for the sample.
-        :return: dict, list or JSON.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param as_model: if we want a BluelivMalware model instead (True).
+        :return: dict, list, JSON or a BluelivMalware.
 
         """
         resource = '%s/%s' % (self._base_url,
                               malware_id)
-        results = self.request(resource=resource)
+        results = self.request(resource=resource,
+                               as_json=as_json,
+                               model=BluelivMalware if as_model else None)
 
         return results
 
-    def upload(self, filename: str):
+    def upload(self,
+               filename: str,
+               progress: typing.Optional[typing.Callable] = None,
+               chunk_size: int = UPLOAD_CHUNK_SIZE,
+               as_json: bool = False):
         """
         A method to upload malware samples to the Community.
 
+        The sample is streamed from disk in chunks of chunk_size bytes (see
+        blueliv.multipart), so memory does not grow with its size, and the
+        file is closed as soon as it is sent or the upload fails.
+
         :param filename: the filename with the malware sample.
+        :param progress: an optional callable, called as progress(sent,
+        total) with the bytes of the sample sent so far.
+        :param chunk_size: the maximum number of bytes read at a time.
+        :param as_json: if we want to receive the response as JSON (True).
         :return: dict, list or JSON.
         """
         resource = '%s%s' % (self._base_url,
                              self._malwares_upload_url)
-        file_object = None
         try:
-            file_object = open(filename, 'rb')
+            body = MultipartFile(filename,
+                                 field='file',
+                                 progress=progress,
+                                 chunk_size=chunk_size)
         except Exception as exception:
             raise Exception('Error with [%s]: [%s]' % (filename,
                                                        exception))
 
-        file = {'file': (filename, file_object)}
-        results = self.request(resource=resource,
-                               files=file)
+        try:
+            results = self.request(resource=resource,
+                                   use_post=True,
+                                   data=body,
+                                   headers=body.headers(),
+                                   as_json=as_json)
+        finally:
+            # The asyncio clients send the body later: it is opened again
+            # on its first read and closed once it is sent.
+            body.close()
 
         return results
+
+    def upload_directory(self,  # pylint: disable=too-many-arguments
+                         directory: str,
+                         ledger: typing.Optional[UploadLedger] = None,
+                         recursive: bool = True,
+                         workers: int = FANOUT_WORKERS,
+                         hash_workers: typing.Optional[int] = None,
+                         check_server: bool = True):
+        """
+        Upload every sample of a directory that was not uploaded before (see
+        blueliv.ingest). Files are hashed (md5 and sha256) in a process pool;
+        a sample is skipped if its sha256 is in the ledger, repeats a file of
+        this run or, with check_server, is known by the server (show). The
+        others are uploaded with at most workers uploads in flight, and
+        recorded in the ledger.
+
+        A failed upload does not stop the others: it is reported in its
+        result and not recorded, so the next run tries it again. Only a 404
+        from the server check means unknown; any other error of the check
+        fails the file without uploading it. A file that cannot be read (or
+        is removed meanwhile) fails as well, with no hashes.
+
+        :param directory: the directory with the samples.
+        :param ledger: the UploadLedger of previous runs (a volatile one if
+        None).
+        :param recursive: include the files of the subdirectories.
+        :param workers: the maximum number of uploads in flight.
+        :param hash_workers: the number of hashing processes (None for one per
+        CPU, 0 to hash in the current process).
+        :param check_server: ask the server for each new sample before
+        uploading it.
+        :return: a generator of IngestResult(path, sha256, md5, status,
+        result, error), one per file, with status uploaded, server, ledger,
+        duplicate or failed.
+        """
+        return ingest_directory(self,
+                                directory,
+                                ledger=ledger,
+                                recursive=recursive,
+                                workers=workers,
+                                hash_workers=hash_workers,
+                                check_server=check_server)
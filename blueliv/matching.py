@@ -0,0 +1,340 @@
+"""
+Local match engine to check many values (hashes, IPs, domains, URLs) against
+the IoCs without calling the API for each one.
+
+The index is fed with IoCs (API items or BluelivIOC models), for example from
+the IoCs timeline, and can keep growing while it is being used:
+
+    matcher = IocMatcher()
+    since_id = matcher.sync(IocsRequest(token=token))
+    ...
+    for value, match in zip(values, matcher.match_many(values)):
+        if match is not None:
+            print(value, match.ioc_type, match.content)
+
+Each IoC type has its own structure: hash sets for HASH and CVE, a prefix
+table (one set per prefix length) for IPv4 addresses and networks, tries of
+reversed labels for DOMAIN/HOST (so 'evil.com' also matches 'a.evil.com')
+and normalized keys for URL.
+
+"""
+import collections
+import ipaddress
+import threading
+import typing
+from urllib.parse import urlsplit, urlunsplit
+
+IocMatch = collections.namedtuple('IocMatch',
+                                  ('value', 'ioc_type', 'content', 'ioc_id'))
+IocMatch.__doc__ = 'A value matched by an IoC (see IocMatcher.match).'
+
+HASH_LENGTHS = (32, 40, 64, 128)
+HEX_DIGITS = frozenset('0123456789abcdef')
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21}
+
+_TERMINAL = ''
+
+
+def normalize_domain(domain: str):
+    """
+    Normalize a domain or host: lower case, no trailing dot, no port.
+
+    :param domain: the domain.
+    :return: str with the normalized domain.
+    """
+    domain = domain.strip().lower()
+    if ':' in domain and not domain.endswith(']'):
+        domain = domain.split(':', 1)[0]
+    return domain.rstrip('.')
+
+
+def normalize_url(url: str):
+    """
+    Normalize an url to compare it: lower case scheme and host, no default
+    port, no fragment and no trailing slash in the path.
+
+    :param url: the url (a missing scheme is taken as http).
+    :return: str with the normalized url.
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://%s' % url
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(scheme, None):
+        host = '%s:%d' % (host, port)
+
+    path = parts.path.rstrip('/')
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+
+def parse_ipv4(value: str):
+    """
+    Parse an IPv4 address or network.
+
+    :param value: the address ('10.0.0.1') or network ('10.0.0.0/8').
+    :return: tuple (network int, prefix length), or None if not IPv4.
+    """
+    # Fast path for plain dotted addresses, the usual case in logs.
+    octets = value.split('.')
+    if len(octets) == 4 and all(octet.isdigit() and len(octet) <= 3
+                                for octet in octets):
+        address = 0
+        for octet in octets:
+            octet = int(octet)
+            if octet > 255:
+                return None
+            address = address << 8 | octet
+        return address, 32
+
+    try:
+        network = ipaddress.IPv4Network(value.strip(), strict=False)
+    except ValueError:
+        return None
+    return int(network.network_address), network.prefixlen
+
+
+def _is_hash(value: str):
+    return len(value) in HASH_LENGTHS and HEX_DIGITS.issuperset(value)
+
+
+class IocMatcher:
+    """IocMatcher is an in-memory index of IoCs optimized for lookups. It is
+    safe to add IoCs from a thread while others are matching.
+
+    Attributes:
+        since_id: the highest IoC id added (to resume the feed with sync).
+
+    """
+
+    since_id: typing.Optional[int] = None
+
+    def __init__(self, items: typing.Optional[typing.Iterable] = None):
+        self.since_id = None
+        self._hashes = {}
+        self._cves = {}
+        self._networks = {}
+        self._prefixes = ()
+        self._domains = {}
+        self._urls = {}
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+
+        if items is not None:
+            self.extend(items)
+
+    def add(self, ioc):
+        """
+        Add an IoC to the index (unknown types are ignored).
+
+        :param ioc: an API item (dict) or a BluelivIOC.
+        :return: True if it was indexed (new or replacing the same key).
+        """
+        if not isinstance(ioc, dict):
+            ioc = ioc.to_dict()
+
+        content = ioc.get('content', None)
+        ioc_type = ioc.get('type', None)
+        if not content or not ioc_type:
+            return False
+
+        entry = IocMatch(None, ioc_type, content, ioc.get('id', None))
+        with self._lock:
+            new = self._index(ioc_type, content, entry)
+            if new:
+                self._counts[ioc_type] += 1
+            if entry.ioc_id is not None:
+                if self.since_id is None or entry.ioc_id > self.since_id:
+                    self.since_id = entry.ioc_id
+        return new is not None
+
+    def _index(self, ioc_type: str, content: str, entry: IocMatch):
+        """
+        Store an entry in the structure for its type.
+
+        :return: True if it is a new key, False if it replaced an entry, None
+        if it was not indexed.
+        """
+        if ioc_type == 'HASH':
+            table, key = self._hashes, content.strip().lower()
+        elif ioc_type == 'CVE':
+            table, key = self._cves, content.strip().upper()
+        elif ioc_type == 'IPv4':
+            parsed = parse_ipv4(content)
+            if parsed is None:
+                return None
+            network, prefix = parsed
+            if prefix not in self._networks:
+                self._networks[prefix] = {}
+                self._prefixes = tuple(sorted(self._networks, reverse=True))
+            table, key = self._networks[prefix], network
+        elif ioc_type in ('DOMAIN', 'HOST'):
+            table = self._domains
+            for label in reversed(normalize_domain(content).split('.')):
+                table = table.setdefault(label, {})
+            key = _TERMINAL
+        elif ioc_type == 'URL':
+            table, key = self._urls, normalize_url(content)
+        else:
+            return None
+
+        new = key not in table
+        table[key] = entry
+        return new
+
+    def extend(self, items: typing.Iterable):
+        """
+        Add several IoCs to the index.
+
+        :param items: API items (dicts) or BluelivIOC models.
+        :return: the number of IoCs indexed.
+        """
+        return sum(1 for item in items if self.add(item))
+
+    def sync(self, iocs_request, since_id=None, limit=None,
+             feed: str = 'timeline'):
+        """
+        Add the IoCs published since since_id (or since the last one added),
+        following the feed cursor.
+
+        :param iocs_request: the IocsRequest to use.
+        :param since_id: the reference id (by default, self.since_id).
+        :param limit: the page size.
+        :param feed: 'timeline' or 'discover'.
+        :return: the new since_id.
+        """
+        if since_id is None:
+            since_id = self.since_id
+
+        iterate = getattr(iocs_request, 'iter_%s' % feed)
+        self.extend(iterate(limit=limit, since_id=since_id))
+        return self.since_id
+
+    def match_hash(self, value: str):
+        """
+        Find a HASH IoC (any subtype).
+
+        :param value: the hash (hex).
+        :return: the IocMatch or None.
+        """
+        entry = self._hashes.get(value.strip().lower(), None)
+        return None if entry is None else entry._replace(value=value)
+
+    def match_ipv4(self, value: str):
+        """
+        Find the most specific network (or address) holding an IPv4.
+
+        :param value: the address.
+        :return: the IocMatch or None.
+        """
+        parsed = parse_ipv4(value)
+        if parsed is None:
+            return None
+        return self._match_address(parsed[0], value)
+
+    def _match_address(self, address: int, value: str):
+        networks = self._networks
+        for prefix in self._prefixes:
+            entry = networks[prefix].get(
+                address >> (32 - prefix) << (32 - prefix), None)
+            if entry is not None:
+                return entry._replace(value=value)
+        return None
+
+    def match_domain(self, value: str):
+        """
+        Find the most specific DOMAIN/HOST IoC the domain is (a subdomain
+        of).
+
+        :param value: the domain or host.
+        :return: the IocMatch or None.
+        """
+        node = self._domains
+        found = None
+        for label in reversed(normalize_domain(value).split('.')):
+            node = node.get(label, None)
+            if node is None:
+                break
+            found = node.get(_TERMINAL, found)
+        return None if found is None else found._replace(value=value)
+
+    def match_url(self, value: str):
+        """
+        Find an URL IoC, or a DOMAIN/HOST/IPv4 one for its host.
+
+        :param value: the url.
+        :return: the IocMatch or None.
+        """
+        normalized = normalize_url(value)
+        entry = self._urls.get(normalized, None)
+        if entry is not None:
+            return entry._replace(value=value)
+
+        host = urlsplit(normalized).hostname or ''
+        match = self.match_ipv4(host) if parse_ipv4(host) else \
+            self.match_domain(host)
+        return None if match is None else match._replace(value=value)
+
+    def match(self, value: str):
+        """
+        Match a value of any kind: the kind is guessed from its format (url,
+        IPv4, hash, CVE or domain).
+
+        :param value: the value to check.
+        :return: the IocMatch or None.
+        """
+        if not value:
+            return None
+
+        if '://' in value:
+            return self.match_url(value)
+
+        if value[0].isdigit():
+            parsed = parse_ipv4(value)
+            if parsed is not None:
+                return self._match_address(parsed[0], value)
+
+        if '/' in value:
+            return self.match_url(value)
+
+        lowered = value.strip().lower()
+        if _is_hash(lowered):
+            return self.match_hash(value)
+
+        if lowered.startswith('cve-'):
+            entry = self._cves.get(lowered.upper(), None)
+            return None if entry is None else entry._replace(value=value)
+
+        return self.match_domain(value)
+
+    def match_many(self, values: typing.Iterable[str],
+                   kind: typing.Optional[str] = None):
+        """
+        Match many values at once.
+
+        :param values: the values to check.
+        :param kind: 'hash', 'ipv4', 'domain' or 'url' if all of them are of
+        the same kind (faster), or None to guess it for each one.
+        :return: list with an IocMatch (or None) per value, in order.
+        """
+        match = self.match if kind is None else \
+            getattr(self, 'match_%s' % kind)
+        return [match(value) for value in values]
+
+    def stats(self):
+        """
+        The number of distinct IoCs indexed per type.
+
+        :return: dict with the counters.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def __len__(self):
+        return sum(self._counts.values())
@@ -0,0 +1,323 @@
+"""
+Metrics of the requests sent to the API, per endpoint family (sparks, iocs,
+tags, users, malwares, crawl, search): calls, latency histograms (with p50,
+p95 and p99 estimates), response bytes, status codes and the cache, retry
+and coalescing counters of the transports.
+
+Every transport records into the shared registry (see get_default_metrics),
+unless it receives another one (or None, to record nothing):
+
+    from blueliv.metrics import get_default_metrics
+
+    print(get_default_metrics().snapshot()['sparks']['latency']['p95'])
+    open('/var/lib/node_exporter/blueliv.prom', 'w').write(
+        get_default_metrics().to_prometheus())
+
+"""
+import bisect
+import collections
+import threading
+import typing
+
+# Upper bounds (seconds) of the latency buckets, as Prometheus histograms.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                   0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5,
+                   10.0, 20.0, 30.0, 60.0)
+
+QUANTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+
+class Histogram:
+    """Histogram counts observations in fixed buckets, so its memory does
+    not grow with them. Quantiles are interpolated inside the bucket where
+    they fall (as Prometheus histogram_quantile does).
+
+    Attributes:
+        buckets: the upper bounds of the buckets (the last one, +Inf, is
+        implicit).
+
+        counts: the number of observations per bucket (not cumulative).
+
+        count: the number of observations.
+
+        total: the sum of the observations.
+
+        maximum: the greatest observation.
+
+    """
+
+    buckets: tuple = LATENCY_BUCKETS
+    count: int = 0
+    total: float = 0.0
+    maximum: float = 0.0
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float):
+        """
+        Add an observation.
+
+        :param value: the observed value.
+        :return: nothing.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, quantile: float):
+        """
+        Estimate a quantile.
+
+        :param quantile: between 0 and 1 (0.95 for p95).
+        :return: the estimated value (0.0 without observations).
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = quantile * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) \
+                    else self.maximum
+                upper = min(upper, self.maximum)
+                lower = min(lower, upper)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.maximum
+
+    def cumulative(self):
+        """
+        The cumulative counts per upper bound (Prometheus le buckets).
+
+        :return: list of (upper bound, count) tuples, ending with +Inf.
+        """
+        result = []
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),),
+                                       self.counts):
+            seen += bucket_count
+            result.append((bound, seen))
+        return result
+
+    def summary(self):
+        """
+        :return: dict with count, sum, max and the QUANTILES estimates.
+        """
+        summary = {'count': self.count,
+                   'sum': self.total,
+                   'max': self.maximum}
+        for name, quantile in QUANTILES:
+            summary[name] = self.quantile(quantile)
+        return summary
+
+
+class _Family:  # pylint: disable=too-few-public-methods
+    """
+    The metrics of an endpoint family.
+
+    """
+    __slots__ = ('calls', 'errors', 'bytes', 'statuses', 'latency',
+                 'counters')
+
+    def __init__(self, buckets: tuple):
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.statuses = collections.Counter()
+        self.latency = Histogram(buckets)
+        self.counters = collections.Counter()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+class MetricsRegistry:
+    """MetricsRegistry keeps the metrics of every endpoint family. It is
+    thread-safe and its memory only grows with the number of families.
+
+    Attributes:
+        buckets: the upper bounds of the latency buckets (seconds).
+
+        prefix: the prefix of the Prometheus metric names.
+
+    """
+
+    buckets: tuple = LATENCY_BUCKETS
+    prefix: str = 'blueliv'
+
+    def __init__(self, **kwargs):
+        self.buckets = LATENCY_BUCKETS
+        self.prefix = 'blueliv'
+        self._lock = threading.Lock()
+        self._families = {}
+
+        if 'buckets' in kwargs:
+            self.buckets = tuple(kwargs.get('buckets', LATENCY_BUCKETS))
+
+        if 'prefix' in kwargs:
+            self.prefix = kwargs.get('prefix', 'blueliv')
+
+    def _family(self, family: str):
+        metrics = self._families.get(family, None)
+        if metrics is None:
+            metrics = self._families[family] = _Family(self.buckets)
+        return metrics
+
+    def observe(self,  # pylint: disable=too-many-arguments
+                family: str,
+                status: typing.Optional[int],
+                seconds: float,
+                size: int = 0):
+        """
+        Record a call.
+
+        :param family: the endpoint family (see endpoint_family).
+        :param status: the status code (None if it failed without one).
+        :param seconds: the time it took.
+        :param size: the response body bytes.
+        :return: nothing.
+        """
+        with self._lock:
+            metrics = self._family(family)
+            metrics.calls += 1
+            metrics.bytes += size or 0
+            metrics.latency.observe(seconds)
+            if status is None:
+                metrics.errors += 1
+                metrics.statuses['error'] += 1
+            else:
+                metrics.statuses[str(status)] += 1
+
+    def increment(self, name: str, family: str, value: int = 1):
+        """
+        Increment a counter of a family (retries, cache_hits...).
+
+        :param name: the counter name.
+        :param family: the endpoint family.
+        :param value: the increment.
+        :return: nothing.
+        """
+        with self._lock:
+            self._family(family).counters[name] += value
+
+    def snapshot(self):
+        """
+        A copy of the metrics.
+
+        :return: dict per family with calls, errors, bytes, status (dict
+        with the calls per status code), latency (count, sum, max, p50, p95
+        and p99, in seconds) and counters.
+        """
+        with self._lock:
+            return {family: {'calls': metrics.calls,
+                             'errors': metrics.errors,
+                             'bytes': metrics.bytes,
+                             'status': dict(metrics.statuses),
+                             'latency': metrics.latency.summary(),
+                             'counters': dict(metrics.counters)}
+                    for family, metrics in sorted(self._families.items())}
+
+    def to_prometheus(self):
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        :return: str with the metrics.
+        """
+        prefix = self.prefix
+        lines = []
+
+        with self._lock:
+            families = sorted(self._families.items())
+            counters = sorted({name for _, metrics in families
+                               for name in metrics.counters})
+
+            lines.append('# HELP %s_requests_total Requests by endpoint '
+                         'family and status.' % prefix)
+            lines.append('# TYPE %s_requests_total counter' % prefix)
+            for family, metrics in families:
+                for status, value in sorted(metrics.statuses.items()):
+                    lines.append('%s_requests_total{family="%s",status="%s"}'
+                                 ' %d' % (prefix, _label(family),
+                                          _label(status), value))
+
+            lines.append('# HELP %s_request_duration_seconds Request '
+                         'latency by endpoint family.' % prefix)
+            lines.append('# TYPE %s_request_duration_seconds histogram'
+                         % prefix)
+            for family, metrics in families:
+                for bound, value in metrics.latency.cumulative():
+                    lines.append('%s_request_duration_seconds_bucket{'
+                                 'family="%s",le="%s"} %d'
+                                 % (prefix, _label(family),
+                                    '+Inf' if bound == float('inf')
+                                    else repr(bound), value))
+                lines.append('%s_request_duration_seconds_sum{family="%s"} '
+                             '%r' % (prefix, _label(family),
+                                     metrics.latency.total))
+                lines.append('%s_request_duration_seconds_count{family="%s"}'
+                             ' %d' % (prefix, _label(family),
+                                      metrics.latency.count))
+
+            lines.append('# HELP %s_response_bytes_total Response body bytes '
+                         'by endpoint family.' % prefix)
+            lines.append('# TYPE %s_response_bytes_total counter' % prefix)
+            for family, metrics in families:
+                lines.append('%s_response_bytes_total{family="%s"} %d'
+                             % (prefix, _label(family), metrics.bytes))
+
+            for name in counters:
+                lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+                for family, metrics in families:
+                    if name in metrics.counters:
+                        lines.append('%s_%s_total{family="%s"} %d'
+                                     % (prefix, name, _label(family),
+                                        metrics.counters[name]))
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Forget every metric.
+
+        :return: nothing.
+        """
+        with self._lock:
+            self._families = {}
+
+
+_DEFAULT_METRICS = MetricsRegistry()
+
+
+def get_default_metrics():
+    """
+    Retrieve the registry shared by the transports that did not receive an
+    explicit one.
+
+    :return: the shared MetricsRegistry.
+    """
+    return _DEFAULT_METRICS
+
+
+def set_default_metrics(metrics: MetricsRegistry):
+    """
+    Replace the shared registry. Transports created before keep the
+    previous one.
+
+    :param metrics: the new MetricsRegistry to share.
+    :return: the previous shared registry.
+    """
+    global _DEFAULT_METRICS  # pylint: disable=global-statement
+
+    previous = _DEFAULT_METRICS
+    _DEFAULT_METRICS = metrics
+    return previous
@@ -0,0 +1,412 @@
+"""
+Local mirror of sparks, IoCs, tags and malwares in an embedded SQLite store,
+to answer the repeated queries of dashboards without a network round trip.
+
+Feed it with what the request classes return (pages, lists of items or
+models), or plug it as the handler of a FeedSync:
+
+    mirror = MirrorStore('/var/lib/collector/mirror.db')
+    mirror.add_sparks(sparks.timeline(limit=100, as_json=True))
+    sync.sync_all(mirror.sync_handler)
+
+    mirror.iocs(ioc_type='DOMAIN', created_after='2020-11-01')
+    mirror.search('iocs', 'evil', tag='phishing', limit=10)
+
+The request classes answer search() from a mirror when they receive one:
+
+    iocs = IocsRequest(token=token, mirror=mirror)
+    iocs.search(search_term='evil', limit=10)  # offline
+
+Every item is kept as received (JSON) next to the indexed columns: spark_id,
+IoC content and type, tag slug, username and created_at.
+
+"""
+import re
+import sqlite3
+import threading
+import typing
+
+from . import codec
+from .pagination import extract_items
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS sparks ('
+    ' id INTEGER PRIMARY KEY, title TEXT, description TEXT,'
+    ' username TEXT, created_at TEXT, data TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS spark_tags ('
+    ' spark_id INTEGER NOT NULL, slug TEXT NOT NULL,'
+    ' PRIMARY KEY (spark_id, slug))',
+    'CREATE TABLE IF NOT EXISTS iocs ('
+    ' id INTEGER PRIMARY KEY, spark_id INTEGER, content TEXT, type TEXT,'
+    ' subtype TEXT, created_at TEXT, data TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS tags ('
+    ' slug TEXT PRIMARY KEY, id INTEGER, name TEXT, data TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS malwares ('
+    ' id TEXT PRIMARY KEY, status TEXT, malicious INTEGER,'
+    ' upload_date TEXT, data TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS sparks_username ON sparks (username)',
+    'CREATE INDEX IF NOT EXISTS sparks_created_at ON sparks (created_at)',
+    'CREATE INDEX IF NOT EXISTS spark_tags_slug ON spark_tags (slug)',
+    'CREATE INDEX IF NOT EXISTS iocs_spark_id ON iocs (spark_id)',
+    'CREATE INDEX IF NOT EXISTS iocs_content ON iocs (content)',
+    'CREATE INDEX IF NOT EXISTS iocs_type ON iocs (type, subtype)',
+    'CREATE INDEX IF NOT EXISTS iocs_created_at ON iocs (created_at)',
+    'CREATE INDEX IF NOT EXISTS malwares_upload_date ON malwares'
+    ' (upload_date)',
+)
+
+
+def _items(document):
+    """
+    The items of a page, a list or a single item (dicts or models).
+
+    :param document: the decoded document.
+    :return: list of dicts.
+    """
+    if isinstance(document, dict) and not extract_items(document):
+        document = [document]
+    elif not isinstance(document, list):
+        document = extract_items(document)
+
+    return [item if isinstance(item, dict) else item.to_dict()
+            for item in document
+            if isinstance(item, dict) or hasattr(item, 'to_dict')]
+
+
+def _tag_slug(tag):
+    if isinstance(tag, dict):
+        return tag.get('slug', None) or tag.get('name', None)
+    return tag
+
+
+class MirrorStore:
+    """MirrorStore keeps the items in SQLite tables with the columns used by
+    the queries indexed. It is safe to use from several threads.
+
+    Attributes:
+        path: the database file (':memory:' for a volatile one).
+
+    """
+
+    path: str = ':memory:'
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+
+    def _write(self, statement: str, rows: list):
+        with self._lock, self._connection:
+            self._connection.executemany(statement, rows)
+        return len(rows)
+
+    def _query(self, statement: str, arguments: tuple = ()):
+        with self._lock:
+            rows = self._connection.execute(statement, arguments).fetchall()
+        return [codec.loads(row[0]) for row in rows]
+
+    def add_sparks(self, document, tag: typing.Optional[str] = None):
+        """
+        Store sparks (new ones are added, known ones replaced).
+
+        :param document: a page, a list of sparks or a spark (dicts or
+        Spark models).
+        :param tag: a tag slug to link them to, besides their own tags (for
+        the sparks returned by TagsRequest.list_sparks).
+        :return: the number of sparks stored.
+        """
+        rows = []
+        tags = []
+        for spark in _items(document):
+            user = spark.get('user', None) or {}
+            rows.append((spark.get('id', None), spark.get('title', None),
+                         spark.get('description', None),
+                         user.get('username', None)
+                         if isinstance(user, dict) else None,
+                         spark.get('created_at', None), codec.dumps(spark)))
+            slugs = {_tag_slug(item) for item in spark.get('tags', None) or ()}
+            if tag:
+                slugs.add(tag)
+            tags.extend((spark.get('id', None), slug)
+                        for slug in slugs if slug)
+
+        self._write('INSERT OR REPLACE INTO sparks (id, title, description,'
+                    ' username, created_at, data) VALUES (?, ?, ?, ?, ?, ?)',
+                    rows)
+        self._write('INSERT OR IGNORE INTO spark_tags (spark_id, slug)'
+                    ' VALUES (?, ?)', tags)
+        return len(rows)
+
+    def add_iocs(self, document):
+        """
+        Store IoCs (new ones are added, known ones replaced).
+
+        :param document: a page, a list of IoCs or an IoC (dicts or
+        BluelivIOC models).
+        :return: the number of IoCs stored.
+        """
+        return self._write(
+            'INSERT OR REPLACE INTO iocs (id, spark_id, content, type,'
+            ' subtype, created_at, data) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(ioc.get('id', None), ioc.get('spark_id', None),
+              ioc.get('content', None), ioc.get('type', None),
+              ioc.get('subtype', None), ioc.get('created_at', None),
+              codec.dumps(ioc)) for ioc in _items(document)])
+
+    def add_tags(self, document):
+        """
+        Store tags (new ones are added, known ones replaced).
+
+        :param document: a page, a list of tags or a tag (dicts or Tag
+        models).
+        :return: the number of tags stored.
+        """
+        return self._write(
+            'INSERT OR REPLACE INTO tags (slug, id, name, data)'
+            ' VALUES (?, ?, ?, ?)',
+            [(tag.get('slug', None), tag.get('id', None),
+              tag.get('name', None), codec.dumps(tag))
+             for tag in _items(document) if tag.get('slug', None)])
+
+    def add_malwares(self, document):
+        """
+        Store malwares (new ones are added, known ones replaced).
+
+        :param document: a page, a list of malwares or a malware (dicts or
+        BluelivMalware models).
+        :return: the number of malwares stored.
+        """
+        return self._write(
+            'INSERT OR REPLACE INTO malwares (id, status, malicious,'
+            ' upload_date, data) VALUES (?, ?, ?, ?, ?)',
+            [(str(malware.get('id', None)), malware.get('status', None),
+              malware.get('malicious', None),
+              malware.get('upload_date', None), codec.dumps(malware))
+             for malware in _items(document)
+             if malware.get('id', None) is not None])
+
+    def sync_handler(self, feed: str, items: list):
+        """
+        A FeedSync handler storing the pages of its feeds. The kind of items
+        comes from the feed name: the first part of a feed as
+        'sparks.timeline' or 'iocs.discover', the last part of the feeds of
+        a resource as 'tags.<slug>.sparks' (those sparks are linked to the
+        tag) or 'users.<username>.iocs'.
+
+        :param feed: the feed name.
+        :param items: the items of a page.
+        :return: the number of items stored.
+        """
+        parts = feed.split('.')
+        kind = parts[-1] if len(parts) > 2 else parts[0]
+        if kind == 'iocs':
+            return self.add_iocs(items)
+        if kind == 'sparks':
+            tag = '.'.join(parts[1:-1]) if parts[0] == 'tags' else None
+            return self.add_sparks(items, tag=tag or None)
+        raise Exception('Unknown kind of items for feed [%s]' % feed)
+
+    @staticmethod
+    def _page(conditions: list, arguments: list, since_id=None, limit=None):
+        """
+        Complete the WHERE and LIMIT clauses of a query.
+
+        :return: tuple (sql, arguments).
+        """
+        if since_id:
+            conditions.append('id > ?')
+            arguments.append(since_id)
+
+        sql = ''
+        if conditions:
+            sql = ' WHERE %s' % ' AND '.join(conditions)
+        sql += ' ORDER BY id DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            arguments.append(int(limit))
+        return sql, tuple(arguments)
+
+    def sparks(self, **kwargs):
+        """
+        Query the sparks, newest first.
+
+        :param tag: only sparks with this tag slug.
+        :param username: only sparks published by this user.
+        :param created_after: only sparks created at or after this time
+        (ISO string).
+        :param created_before: only sparks created before this time.
+        :param since_id: only sparks with a greater id.
+        :param limit: the maximum number of sparks.
+        :return: list of sparks (dicts).
+        """
+        conditions, arguments = [], []
+        if kwargs.get('tag', None):
+            conditions.append('id IN (SELECT spark_id FROM spark_tags'
+                              ' WHERE slug = ?)')
+            arguments.append(kwargs['tag'])
+        if kwargs.get('username', None):
+            conditions.append('username = ?')
+            arguments.append(kwargs['username'])
+        if kwargs.get('created_after', None):
+            conditions.append('created_at >= ?')
+            arguments.append(kwargs['created_after'])
+        if kwargs.get('created_before', None):
+            conditions.append('created_at < ?')
+            arguments.append(kwargs['created_before'])
+
+        sql, arguments = self._page(conditions, arguments,
+                                    kwargs.get('since_id', None),
+                                    kwargs.get('limit', None))
+        return self._query('SELECT data FROM sparks%s' % sql, arguments)
+
+    def iocs(self, **kwargs):
+        """
+        Query the IoCs, newest first.
+
+        :param spark_id: only IoCs of this spark.
+        :param content: only IoCs with this exact content.
+        :param ioc_type: only IoCs of this type (DOMAIN, IPv4...).
+        :param ioc_subtype: only IoCs of this subtype.
+        :param tag: only IoCs of sparks with this tag slug.
+        :param created_after: only IoCs created at or after this time (ISO
+        string).
+        :param created_before: only IoCs created before this time.
+        :param since_id: only IoCs with a greater id.
+        :param limit: the maximum number of IoCs.
+        :return: list of IoCs (dicts).
+        """
+        conditions, arguments = [], []
+        for argument, column in (('spark_id', 'spark_id'),
+                                 ('content', 'content'),
+                                 ('ioc_type', 'type'),
+                                 ('ioc_subtype', 'subtype')):
+            if kwargs.get(argument, None) is not None:
+                conditions.append('%s = ?' % column)
+                arguments.append(kwargs[argument])
+        if kwargs.get('tag', None):
+            conditions.append('spark_id IN (SELECT spark_id FROM spark_tags'
+                              ' WHERE slug = ?)')
+            arguments.append(kwargs['tag'])
+        if kwargs.get('created_after', None):
+            conditions.append('created_at >= ?')
+            arguments.append(kwargs['created_after'])
+        if kwargs.get('created_before', None):
+            conditions.append('created_at < ?')
+            arguments.append(kwargs['created_before'])
+
+        sql, arguments = self._page(conditions, arguments,
+                                    kwargs.get('since_id', None),
+                                    kwargs.get('limit', None))
+        return self._query('SELECT data FROM iocs%s' % sql, arguments)
+
+    def spark(self, spark_id):
+        """
+        :param spark_id: the spark id.
+        :return: the spark (dict) or None.
+        """
+        found = self._query('SELECT data FROM sparks WHERE id = ?',
+                            (spark_id,))
+        return found[0] if found else None
+
+    def tag(self, slug: str):
+        """
+        :param slug: the tag slug.
+        :return: the tag (dict) or None.
+        """
+        found = self._query('SELECT data FROM tags WHERE slug = ?', (slug,))
+        return found[0] if found else None
+
+    def malware(self, malware_id):
+        """
+        :param malware_id: the malware id.
+        :return: the malware (dict) or None.
+        """
+        found = self._query('SELECT data FROM malwares WHERE id = ?',
+                            (str(malware_id),))
+        return found[0] if found else None
+
+    def search(self,  # pylint: disable=too-many-arguments
+               category: str,
+               search_term: str,
+               tag: typing.Optional[str] = None,
+               limit: int = 0,
+               since_id: int = 0):
+        """
+        Offline version of BluelivRequest.search: the term is searched (case
+        insensitive) in the title and description of the sparks, the content
+        of the IoCs or the slug and name of the tags.
+
+        :param category: sparks, iocs or tags.
+        :param search_term: the term we want to search.
+        :param tag: only sparks (or IoCs of sparks) with this tag slug, or
+        only the tag with this slug.
+        :param limit: the maximum number of items we want to receive.
+        :param since_id: the reference id from we want to receive results.
+        :return: list of items (dicts), newest first (tags by slug).
+        """
+        # The wildcards of the term are escaped, so it matches literally.
+        pattern = '%%%s%%' % re.sub(r'([\\%_])', r'\\\1', search_term or '')
+        if category == 'tags':
+            conditions = ["(slug LIKE ? ESCAPE '\\' OR"
+                          " name LIKE ? ESCAPE '\\')"]
+            arguments = [pattern, pattern]
+            if tag:
+                conditions.append('slug = ?')
+                arguments.append(tag)
+            if since_id:
+                conditions.append('id > ?')
+                arguments.append(since_id)
+
+            sql = 'SELECT data FROM tags WHERE %s ORDER BY slug' % (
+                ' AND '.join(conditions))
+            if limit:
+                sql += ' LIMIT ?'
+                arguments.append(int(limit))
+            return self._query(sql, tuple(arguments))
+
+        if category == 'sparks':
+            conditions = ["(title LIKE ? ESCAPE '\\' OR"
+                          " description LIKE ? ESCAPE '\\')"]
+            arguments = [pattern, pattern]
+            table = 'sparks'
+            tag_column = 'id'
+        elif category == 'iocs':
+            conditions = ["content LIKE ? ESCAPE '\\'"]
+            arguments = [pattern]
+            table = 'iocs'
+            tag_column = 'spark_id'
+        else:
+            raise Exception('Categories for search are: iocs, sparks, tags.')
+
+        if tag:
+            conditions.append('%s IN (SELECT spark_id FROM spark_tags'
+                              ' WHERE slug = ?)' % tag_column)
+            arguments.append(tag)
+
+        sql, arguments = self._page(conditions, arguments, since_id, limit)
+        return self._query('SELECT data FROM %s%s' % (table, sql), arguments)
+
+    def counts(self):
+        """
+        The number of items stored per kind.
+
+        :return: dict with the counters.
+        """
+        counts = {}
+        with self._lock:
+            for table in ('sparks', 'iocs', 'tags', 'malwares'):
+                counts[table] = self._connection.execute(
+                    'SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+        return counts
+
+    def close(self):
+        """
+        Close the database.
+
+        :return: nothing.
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,192 @@
+"""
+Streaming multipart/form-data bodies, to upload files of any size with a
+constant amount of memory.
+
+A MultipartFile is a file-like body (read and len, plus sync and async
+iteration, which reads the file in a thread) that both requests and aiohttp
+send as it is read: the form
+headers, the file in chunks of chunk_size bytes and the closing boundary.
+The file is opened on the first read and closed as soon as it is fully
+sent (or on close), so no descriptor outlives the upload:
+
+    with MultipartFile('/samples/big.bin', progress=print) as body:
+        requests.post(url, data=body, headers=body.headers())
+
+"""
+import asyncio
+import functools
+import os
+import typing
+import uuid
+
+from .configuration import UPLOAD_CHUNK_SIZE
+
+
+def _quote(value: str):
+    """
+    Quote a form parameter value (as browsers do, with the quotes and the
+    line breaks percent encoded).
+
+    :param value: the value.
+    :return: the quoted value.
+    """
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartFile:
+    """MultipartFile is a multipart/form-data body with one file field,
+    read from disk as it is sent.
+
+    Attributes:
+        path: the file to upload.
+
+        field: the form field name.
+
+        filename: the file name sent in the form (path by default).
+
+        chunk_size: the maximum number of bytes read from the file at a
+        time.
+
+        progress: an optional callable, called as progress(sent, total) with
+        the number of file bytes sent after each chunk.
+
+        boundary: the multipart boundary.
+
+        file_size: the size of the file, taken when the body is created.
+
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    path: str = ''
+    field: str = 'file'
+    filename: str = ''
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+    progress: typing.Optional[typing.Callable] = None
+    boundary: str = ''
+    file_size: int = 0
+
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        self.field = kwargs.get('field', 'file')
+        self.filename = kwargs.get('filename', None) or path
+        self.chunk_size = max(1, int(kwargs.get('chunk_size',
+                                                UPLOAD_CHUNK_SIZE)))
+        self.progress = kwargs.get('progress', None)
+        self.boundary = uuid.uuid4().hex
+        self.file_size = os.path.getsize(path)
+
+        self._head = ('--%s\r\nContent-Disposition: form-data; name="%s"; '
+                      'filename="%s"\r\nContent-Type: '
+                      'application/octet-stream\r\n\r\n'
+                      % (self.boundary, _quote(self.field),
+                         _quote(self.filename))).encode('utf-8')
+        self._tail = ('\r\n--%s--\r\n' % self.boundary).encode('ascii')
+        self._file = None
+        self._position = 0
+        self._sent = 0
+
+    def __len__(self):
+        return len(self._head) + self.file_size + len(self._tail)
+
+    def headers(self):
+        """
+        The headers to send with the body.
+
+        :return: dict with Content-Type and Content-Length.
+        """
+        return {'Content-Type': 'multipart/form-data; boundary=%s'
+                                % self.boundary,
+                'Content-Length': str(len(self))}
+
+    def _read_file(self, size: int):
+        """
+        Read up to size bytes of the file, opening it on the first call and
+        closing it at the end.
+
+        :param size: the maximum number of bytes.
+        :return: bytes (fewer than size only at the end of the file).
+        """
+        if self._file is None and self._sent < self.file_size:
+            self._file = open(self.path, 'rb')  # pylint: disable=R1732
+
+        chunk = b''
+        if self._file is not None:
+            chunk = self._file.read(min(size, self.file_size - self._sent))
+            self._sent += len(chunk)
+            if self.progress is not None:
+                self.progress(self._sent, self.file_size)
+            if not chunk or self._sent >= self.file_size:
+                self.close()
+                if self._sent < self.file_size:
+                    raise Exception('Error with [%s]: file changed while '
+                                    'uploading' % self.path)
+        return chunk
+
+    def read(self, size: int = -1):
+        """
+        Read the next part of the body. The HTTP clients read it with a size;
+        without one, the rest of the body is read (chunk by chunk, but
+        returned at once).
+
+        :param size: the maximum number of bytes (-1 for the rest).
+        :return: bytes (b'' at the end of the body).
+        """
+        if size is None or size < 0:
+            return b''.join(iter(self._read_chunk, b''))
+        return self._read_chunk(size)
+
+    def _read_chunk(self, size: int = UPLOAD_CHUNK_SIZE):
+        """
+        Read the next part of the body, never more than chunk_size bytes.
+
+        :param size: the maximum number of bytes.
+        :return: bytes (b'' at the end of the body).
+        """
+        size = max(1, min(size, self.chunk_size))
+
+        head_size = len(self._head)
+        if self._position < head_size:
+            chunk = self._head[self._position:self._position + size]
+        elif self._position < head_size + self.file_size:
+            chunk = self._read_file(size)
+        else:
+            offset = self._position - head_size - self.file_size
+            chunk = self._tail[offset:offset + size]
+
+        self._position += len(chunk)
+        return chunk
+
+    def __iter__(self):
+        return iter(functools.partial(self._read_chunk, self.chunk_size), b'')
+
+    async def __aiter__(self):
+        # The file is read in the default executor, not to block the loop
+        # (progress is called from there too).
+        loop = asyncio.get_running_loop()
+        head_size = len(self._head)
+        while True:
+            if head_size <= self._position < head_size + self.file_size:
+                chunk = await loop.run_in_executor(None, self._read_chunk,
+                                                   self.chunk_size)
+            else:
+                chunk = self._read_chunk(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        """
+        Close the file, if it is open.
+
+        :return: nothing.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,282 @@
+"""
+Pagination helpers to walk the since_id/limit feeds (timeline, discover,
+tags and users lists) lazily, one item at a time.
+
+The next page is requested in the background while the items of the current
+one are being consumed, so memory only holds two pages at most and the network
+is kept busy during long backfills.
+
+Numbered pages (page/pageSize, as in the malwares list) are independent, so
+they are fetched concurrently with a bounded number of requests in flight.
+
+"""
+import asyncio
+import collections
+import itertools
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from .configuration import FANOUT_WORKERS
+from .fanout import bounded_map
+
+ITEMS_KEYS = ('data', 'results', 'items')
+
+
+def extract_items(page, items_key: typing.Optional[str] = None):
+    """
+    Extract the list of items from a decoded page. A page may be the list
+    itself or a dict with the list under one of the ITEMS_KEYS.
+
+    :param page: the decoded page (list, dict or None).
+    :param items_key: the key holding the items, if known.
+    :return: the list of items (empty if none).
+    """
+    if not page:
+        return []
+
+    if isinstance(page, list):
+        return page
+
+    if isinstance(page, dict):
+        keys = (items_key,) if items_key else ITEMS_KEYS
+        for key in keys:
+            items = page.get(key, None)
+            if isinstance(items, list):
+                return items
+
+    return []
+
+
+def _cursor_value(value):
+    """
+    :param value: an id, from an item or given as since_id.
+    :return: the value as int if it is a numeric string, as it is otherwise.
+    """
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    return value
+
+
+def next_cursor(items: list, since_id, cursor_key: str = 'id'):
+    """
+    Compute the since_id for the next page: the highest cursor_key of the
+    items received. Numeric strings are compared as numbers, so since_id
+    may be given as '3' for items with integer ids.
+
+    :param items: the items in the current page.
+    :param since_id: the since_id used to request the current page.
+    :param cursor_key: the item key holding the id.
+    :return: the next since_id, or None if the cursor does not advance.
+    """
+    cursors = [_cursor_value(item.get(cursor_key)) for item in items
+               if isinstance(item, dict) and item.get(cursor_key) is not None]
+    if not cursors:
+        return None
+
+    cursor = max(cursors)
+    if since_id is not None and cursor <= _cursor_value(since_id):
+        return None
+    return cursor
+
+
+def is_last_page(items: list, limit):
+    """
+    A page is the last one if it is empty or shorter than the limit.
+
+    :param items: the items in the page.
+    :param limit: the page size requested.
+    :return: True if there are no more pages.
+    """
+    if not items:
+        return True
+    return bool(limit) and len(items) < int(limit)
+
+
+def iter_pages(fetch: typing.Callable,  # pylint: disable=too-many-arguments
+               limit=None,
+               since_id=None,
+               prefetch: bool = True,
+               cursor_key: str = 'id',
+               items_key: typing.Optional[str] = None):
+    """
+    Follow the since_id cursor lazily, yielding the items one at a time.
+
+    :param fetch: callable as fetch(limit=..., since_id=...) returning the
+    decoded page.
+    :param limit: the page size.
+    :param since_id: the reference id to start from.
+    :param prefetch: request the next page while the current is consumed.
+    :param cursor_key: the item key holding the id.
+    :param items_key: the page key holding the items, if known.
+    :return: a generator of items.
+    """
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    future = None
+    try:
+        page = fetch(limit=limit, since_id=since_id)
+        while True:
+            items = extract_items(page, items_key)
+            cursor = None
+            if not is_last_page(items, limit):
+                cursor = next_cursor(items, since_id, cursor_key)
+
+            future = None
+            if cursor is not None and executor is not None:
+                future = executor.submit(fetch, limit=limit, since_id=cursor)
+
+            yield from items
+
+            if cursor is None:
+                return
+
+            if future is not None:
+                page = future.result()
+                future = None
+            else:
+                page = fetch(limit=limit, since_id=cursor)
+            since_id = cursor
+    finally:
+        # Do not start the prefetch if the consumer stopped, and wait for it
+        # if it is running, so no request outlives the generator.
+        if future is not None:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+async def aiter_pages(fetch: typing.Callable,  # pylint: disable=R0913
+                      limit=None,
+                      since_id=None,
+                      prefetch: bool = True,
+                      cursor_key: str = 'id',
+                      items_key: typing.Optional[str] = None):
+    """
+    Asyncio version of iter_pages: fetch returns a coroutine and the next
+    page is prefetched in a task.
+
+    :return: an asynchronous generator of items.
+    """
+    page = await fetch(limit=limit, since_id=since_id)
+    task = None
+    try:
+        while True:
+            items = extract_items(page, items_key)
+            cursor = None
+            if not is_last_page(items, limit):
+                cursor = next_cursor(items, since_id, cursor_key)
+
+            if cursor is not None and prefetch:
+                task = asyncio.ensure_future(fetch(limit=limit,
+                                                   since_id=cursor))
+
+            for item in items:
+                yield item
+
+            if cursor is None:
+                return
+
+            if task is not None:
+                page = await task
+                task = None
+            else:
+                page = await fetch(limit=limit, since_id=cursor)
+            since_id = cursor
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+
+
+def _page_numbers(start_page: int, max_pages: typing.Optional[int]):
+    """
+    The page numbers to request: endless unless max_pages is set.
+
+    :param start_page: the first page.
+    :param max_pages: the maximum number of pages, if any.
+    :return: an iterator of page numbers.
+    """
+    if max_pages is None:
+        return itertools.count(start_page)
+    return iter(range(start_page, start_page + max_pages))
+
+
+def iter_numbered_pages(fetch: typing.Callable,  # pylint: disable=R0913
+                        start_page: int = 1,
+                        page_size: typing.Optional[int] = None,
+                        workers: int = FANOUT_WORKERS,
+                        max_pages: typing.Optional[int] = None,
+                        items_key: typing.Optional[str] = None):
+    """
+    Walk numbered pages fetching up to workers of them concurrently, and
+    yield their items in order. It stops on the first empty or short page
+    (pages requested beyond it are discarded).
+
+    :param fetch: callable as fetch(page=..., page_size=...) returning the
+    decoded page.
+    :param start_page: the first page number.
+    :param page_size: the page size.
+    :param workers: the maximum number of pages requested at the same time.
+    :param max_pages: the maximum number of pages to walk, if any.
+    :param items_key: the page key holding the items, if known.
+    :return: a generator of items.
+    """
+    def fetch_page(page):
+        return fetch(page=page, page_size=page_size)
+
+    results = bounded_map(fetch_page,
+                          _page_numbers(start_page, max_pages),
+                          workers=workers,
+                          ordered=True)
+    try:
+        for _, page, exception in results:
+            if exception is not None:
+                raise exception
+
+            items = extract_items(page, items_key)
+            yield from items
+
+            if is_last_page(items, page_size):
+                return
+    finally:
+        results.close()
+
+
+async def aiter_numbered_pages(fetch: typing.Callable,  # pylint: disable=R0913
+                               start_page: int = 1,
+                               page_size: typing.Optional[int] = None,
+                               workers: int = FANOUT_WORKERS,
+                               max_pages: typing.Optional[int] = None,
+                               items_key: typing.Optional[str] = None):
+    """
+    Asyncio version of iter_numbered_pages: fetch returns a coroutine and the
+    pages in flight are tasks.
+
+    :return: an asynchronous generator of items.
+    """
+    pages = _page_numbers(start_page, max_pages)
+    pending = collections.deque()
+
+    def submit_next():
+        for page in pages:
+            pending.append(asyncio.ensure_future(fetch(page=page,
+                                                       page_size=page_size)))
+            return True
+        return False
+
+    try:
+        for _ in range(max(1, int(workers))):
+            if not submit_next():
+                break
+
+        while pending:
+            page = await pending.popleft()
+            submit_next()
+
+            items = extract_items(page, items_key)
+            for item in items:
+                yield item
+
+            if is_last_page(items, page_size):
+                return
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,266 @@
+"""
+Client-side rate limiting, to stay under the API quota instead of
+overshooting it in bursts and then stalling.
+
+Limits are token buckets shared by every request instance (in any thread)
+using the same API token: register a RateLimiter for a token and all of them
+will wait for it before sending a request.
+
+    set_rate_limiter(token, RateLimiter(rate=5, budgets={'iocs': 2}))
+
+Each endpoint family (sparks, iocs, tags, users, malwares, crawl, search) may
+have its own budget on top of the global one. With a directory, buckets are
+kept in lock-protected files, so several processes on the same host share
+them.
+
+"""
+import hashlib
+import os
+import threading
+import time
+import typing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # pylint: disable=C0103
+
+from .configuration import RATE_LIMIT, RATE_BURST, RATE_LIMIT_DIR
+
+
+class TokenBucket:
+    """TokenBucket refills rate tokens per second, up to burst tokens. It is
+    thread-safe.
+
+    Requests reserve their tokens at once (the level may go below zero) and
+    wait for the time the bucket needs to pay them back, so waiting callers
+    are served in order.
+
+    Attributes:
+        rate: tokens added per second.
+
+        burst: the bucket capacity (maximum burst of requests).
+
+    """
+
+    rate: float = 1.0
+    burst: float = 1.0
+
+    def __init__(self, rate: float, burst: typing.Optional[float] = None):
+        if not rate or rate <= 0:
+            raise Exception('TokenBucket rate must be greater than 0')
+
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._level = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0):
+        """
+        Take tokens from the bucket.
+
+        :param tokens: the number of tokens to take.
+        :return: seconds to wait before using them (0 if available now).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.burst,
+                              self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= tokens
+            level = self._level
+        return max(0.0, -level / self.rate)
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Take tokens from the bucket, sleeping until they are available.
+
+        :param tokens: the number of tokens to take.
+        :return: the seconds waited.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class FileTokenBucket(TokenBucket):
+    """FileTokenBucket keeps the bucket level in a file protected with an
+    exclusive lock (fcntl.flock), so every process using the same path
+    shares it. Only available on POSIX systems.
+
+    Attributes:
+        path: the file holding the bucket state.
+
+    """
+
+    path: str = ''
+
+    def __init__(self, path: str, rate: float,
+                 burst: typing.Optional[float] = None):
+        if fcntl is None:
+            raise Exception('FileTokenBucket needs fcntl (POSIX systems)')
+
+        super().__init__(rate, burst)
+        self.path = path
+
+    def reserve(self, tokens: float = 1.0):
+        """
+        Take tokens from the shared bucket file.
+
+        :param tokens: the number of tokens to take.
+        :return: seconds to wait before using them (0 if available now).
+        """
+        with self._lock, open(self.path, 'a+b') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                handle.seek(0)
+                state = handle.read().split()
+                level, updated = self.burst, now
+                if len(state) == 2:
+                    level, updated = float(state[0]), float(state[1])
+
+                level = min(self.burst,
+                            level + max(0.0, now - updated) * self.rate)
+                level -= tokens
+
+                handle.seek(0)
+                handle.truncate()
+                handle.write(('%r %r' % (level, now)).encode('ascii'))
+                handle.flush()
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return max(0.0, -level / self.rate)
+
+
+class RateLimiter:
+    """RateLimiter combines a global token bucket with optional per endpoint
+    family ones.
+
+    Attributes:
+        rate: global requests per second (None for no global limit).
+
+        burst: global bucket capacity.
+
+        budgets: dict with per family limits, as {'iocs': rate} or
+        {'iocs': (rate, burst)}.
+
+        directory: if set, buckets are FileTokenBucket files in it, shared by
+        every process using the same directory and name.
+
+        name: the prefix for the bucket files.
+
+    """
+
+    rate: typing.Optional[float] = None
+    burst: typing.Optional[float] = None
+    budgets: typing.Optional[dict] = None
+    directory: typing.Optional[str] = None
+    name: str = 'blueliv'
+
+    def __init__(self, **kwargs):
+        self.rate = kwargs.get('rate', None)
+        self.burst = kwargs.get('burst', None)
+        self.budgets = dict(kwargs.get('budgets', None) or {})
+        self.directory = kwargs.get('directory', None)
+        self.name = kwargs.get('name', 'blueliv')
+
+        self._global = None
+        if self.rate:
+            self._global = self._build('all', self.rate, self.burst)
+
+        self._buckets = {}
+        for family, budget in self.budgets.items():
+            if isinstance(budget, (tuple, list)):
+                rate, burst = budget
+            else:
+                rate, burst = budget, None
+            self._buckets[family] = self._build(family, rate, burst)
+
+    def _build(self, family: str, rate: float, burst=None):
+        """
+        Build the bucket for a family (in memory or in a file).
+
+        :param family: the endpoint family ('all' for the global one).
+        :param rate: tokens per second.
+        :param burst: bucket capacity.
+        :return: the TokenBucket.
+        """
+        if self.directory:
+            path = os.path.join(self.directory,
+                                '%s-%s.bucket' % (self.name, family))
+            return FileTokenBucket(path, rate, burst)
+        return TokenBucket(rate, burst)
+
+    def reserve(self, family: typing.Optional[str] = None):
+        """
+        Take a token for a request of an endpoint family.
+
+        :param family: the endpoint family (sparks, iocs...).
+        :return: seconds to wait before sending the request.
+        """
+        delay = 0.0
+        if self._global is not None:
+            delay = self._global.reserve()
+
+        bucket = self._buckets.get(family, None)
+        if bucket is not None:
+            delay = max(delay, bucket.reserve())
+        return delay
+
+    def acquire(self, family: typing.Optional[str] = None):
+        """
+        Take a token for a request, sleeping until it is allowed.
+
+        :param family: the endpoint family (sparks, iocs...).
+        :return: the seconds waited.
+        """
+        delay = self.reserve(family)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+_LIMITERS: dict = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(token: str):
+    """
+    Retrieve the rate limiter shared by all the instances using a token. If
+    there is none and BLUELIV_API_RATE_LIMIT is set, a default one is created
+    (in BLUELIV_API_RATE_LIMIT_DIR, if set).
+
+    :param token: the API token.
+    :return: the RateLimiter, or None if requests are not limited.
+    """
+    limiter = _LIMITERS.get(token, None)
+    if limiter is not None or not RATE_LIMIT:
+        return limiter
+
+    with _LIMITERS_LOCK:
+        if token not in _LIMITERS:
+            # Never write the token itself in file names.
+            name = hashlib.sha256(str(token).encode('utf-8')).hexdigest()
+            _LIMITERS[token] = RateLimiter(rate=RATE_LIMIT,
+                                           burst=RATE_BURST,
+                                           directory=RATE_LIMIT_DIR,
+                                           name=name[:16])
+        return _LIMITERS[token]
+
+
+def set_rate_limiter(token: str, limiter: typing.Optional[RateLimiter]):
+    """
+    Register the rate limiter for a token (None removes it).
+
+    :param token: the API token.
+    :param limiter: the RateLimiter to share.
+    :return: the previous limiter for the token (or None).
+    """
+    with _LIMITERS_LOCK:
+        previous = _LIMITERS.pop(token, None)
+        if limiter is not None:
+            _LIMITERS[token] = limiter
+    return previous
@@ -0,0 +1,132 @@
+"""
+Retry policy for the idempotent requests.
+
+A 429 (Too Many Requests) or a 5xx under load should not kill a whole sync
+run, so the transports retry them with exponential backoff and full jitter,
+honoring the Retry-After header, and within a maximum total wait (budget).
+
+"""
+import email.utils
+import random
+import time
+import typing
+
+from .configuration import RETRY_MAX, RETRY_BACKOFF, RETRY_BUDGET
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def parse_retry_after(value: typing.Optional[str]):
+    """
+    Parse a Retry-After header, in seconds or as an HTTP date.
+
+    :param value: the header value.
+    :return: seconds to wait, or None if missing or invalid.
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None:
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """RetryPolicy decides if and when a request is retried.
+
+    Attributes:
+        max_retries: the maximum number of retries for a request.
+
+        backoff_factor: the base delay; retry n waits a random time up to
+        backoff_factor * 2 ** n (full jitter).
+
+        max_backoff: the maximum delay between two attempts.
+
+        budget: the maximum total time (seconds) spent waiting between the
+        attempts of a request. Once exhausted, the last response or error is
+        returned.
+
+        statuses: the response status codes that are retried.
+
+        methods: the HTTP methods that are retried (idempotent ones).
+
+        jitter: if False, the delay is exactly backoff_factor * 2 ** n.
+
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    max_retries: int = RETRY_MAX
+    backoff_factor: float = RETRY_BACKOFF
+    max_backoff: float = 30.0
+    budget: float = RETRY_BUDGET
+    statuses: tuple = RETRY_STATUSES
+    methods: tuple = RETRY_METHODS
+    jitter: bool = True
+
+    def __init__(self, **kwargs):
+        self.max_retries = kwargs.get('max_retries', RETRY_MAX)
+        self.backoff_factor = kwargs.get('backoff_factor', RETRY_BACKOFF)
+        self.max_backoff = kwargs.get('max_backoff', 30.0)
+        self.budget = kwargs.get('budget', RETRY_BUDGET)
+        self.statuses = tuple(kwargs.get('statuses', RETRY_STATUSES))
+        self.methods = tuple(method.upper() for method in
+                             kwargs.get('methods', RETRY_METHODS))
+        self.jitter = kwargs.get('jitter', True)
+
+    def is_retryable(self, method: str, status_code=None):
+        """
+        Check if a request may be retried.
+
+        :param method: the HTTP method.
+        :param status_code: the response status, or None for a connection
+        error.
+        :return: True if it may be retried.
+        """
+        if method.upper() not in self.methods:
+            return False
+        return status_code is None or status_code in self.statuses
+
+    def backoff(self, retry: int, retry_after=None):
+        """
+        The delay before a retry.
+
+        :param retry: the retry number (0 for the first one).
+        :param retry_after: the Retry-After header value, if any.
+        :return: seconds to wait.
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            return delay
+
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** retry))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def next_delay(self, retry: int, waited: float, retry_after=None):
+        """
+        The delay before a retry, if the retry is allowed by max_retries and
+        the budget.
+
+        :param retry: the retry number (0 for the first one).
+        :param waited: the time already spent waiting for this request.
+        :param retry_after: the Retry-After header value, if any.
+        :return: seconds to wait, or None to give up.
+        """
+        if retry >= self.max_retries:
+            return None
+
+        delay = self.backoff(retry, retry_after)
+        if waited + delay > self.budget:
+            return None
+        return delay
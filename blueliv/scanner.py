@@ -0,0 +1,357 @@
+"""
+Multi-pattern scanner to find every occurrence of the URL and DOMAIN/HOST
+IoCs in raw text (proxy logs, email bodies...) in a single pass.
+
+All the patterns are compiled in one Aho-Corasick automaton, so the cost of a
+scan depends on the size of the text and not on the number of IoCs:
+
+    scanner = IocScanner(iocs.iter_timeline(limit=1000))
+    for match in scanner.scan(log_line):
+        print(match.start, match.end, match.content)
+
+Matching is ASCII case-insensitive and works on bytes (str is encoded as
+UTF-8, so offsets are byte offsets). By default, a match must not be part of
+a longer name: 'evil.com' matches 'mail.evil.com' but not 'notevil.com' or
+'evil.com.au'.
+
+New IoCs are added to the automaton as they arrive, updating only the
+failure links and outputs they change. Scans run on a snapshot published
+with a single reference swap, so patterns can be added while other threads
+scan (a running scan keeps the snapshot it started with).
+
+"""
+import collections
+import threading
+import typing
+
+ScanMatch = collections.namedtuple('ScanMatch', ('start', 'end', 'ioc_type',
+                                                 'content', 'ioc_id'))
+ScanMatch.__doc__ = 'An IoC found in a text (start and end byte offsets).'
+
+_Automaton = collections.namedtuple('_Automaton', ('goto', 'delta', 'fail',
+                                                   'outputs', 'patterns',
+                                                   'max_length'))
+
+SCANNED_TYPES = ('URL', 'DOMAIN', 'HOST')
+
+_NAME_BYTES = frozenset(b'abcdefghijklmnopqrstuvwxyz0123456789-_')
+_DOT = ord('.')
+
+
+class IocScanner:
+    """IocScanner finds URL, DOMAIN and HOST IoCs in texts or byte streams
+    with an Aho-Corasick automaton.
+
+    Attributes:
+        boundaries: if True, matches inside longer names are discarded.
+
+    """
+
+    boundaries: bool = True
+
+    def __init__(self, items: typing.Optional[typing.Iterable] = None,
+                 boundaries: bool = True):
+        self.boundaries = boundaries
+        # The automaton being built (only changed under the lock).
+        self._goto = [{}]
+        self._fail = [0]
+        self._fail_children = [set()]
+        self._outputs = [()]
+        self._patterns = []
+        self._keys = {}
+        self._max_length = 0
+        # The snapshot used by the scans (None when it is out of date). It
+        # shares the transitions of the states below _shared with the trie,
+        # so they are copied before being changed.
+        self._automaton = None
+        self._shared = 0
+        self._copied = set()
+        self._lock = threading.Lock()
+
+        if items is not None:
+            self.extend(items)
+
+    def add(self, ioc):
+        """
+        Add an IoC pattern (other types are ignored).
+
+        :param ioc: an API item (dict) or a BluelivIOC.
+        :return: True if it is a new pattern.
+        """
+        if not isinstance(ioc, dict):
+            ioc = ioc.to_dict()
+
+        content = ioc.get('content', None)
+        ioc_type = ioc.get('type', None)
+        if not content or ioc_type not in SCANNED_TYPES:
+            return False
+
+        key = content.strip().lower().encode('utf-8')
+        if ioc_type != 'URL':
+            key = key.rstrip(b'.')
+        if not key:
+            return False
+
+        with self._lock:
+            if key in self._keys:
+                return False
+
+            state = 0
+            for byte in key:
+                next_state = self._goto[state].get(byte, None)
+                if next_state is None:
+                    next_state = self._add_state(state, byte)
+                state = next_state
+
+            pattern = len(self._patterns)
+            self._patterns.append((len(key), ioc_type, content,
+                                   ioc.get('id', None)))
+            self._keys[key] = pattern
+            self._add_output(state, pattern)
+            self._max_length = max(self._max_length, len(key))
+            self._automaton = None
+        return True
+
+    def extend(self, items: typing.Iterable):
+        """
+        Add several IoC patterns.
+
+        :param items: API items (dicts) or BluelivIOC models.
+        :return: the number of new patterns.
+        """
+        return sum(1 for item in items if self.add(item))
+
+    def _add_state(self, parent: int, byte: int):
+        """
+        Add the state reached from parent with byte, with its failure link,
+        and move to it the failure links of the states whose longest suffix
+        in the trie it becomes (called with the lock held).
+
+        :return: the new state.
+        """
+        goto = self._goto
+        fail = self._fail
+        children = self._fail_children
+
+        link = fail[parent]
+        while link and byte not in goto[link]:
+            link = fail[link]
+        link = goto[link].get(byte, 0)
+
+        state = len(goto)
+        goto.append({})
+        fail.append(link)
+        children.append(set())
+        children[link].add(state)
+        self._outputs.append(self._outputs[link])
+        if parent < self._shared and parent not in self._copied:
+            goto[parent] = dict(goto[parent])
+            self._copied.add(parent)
+        goto[parent][byte] = state
+
+        # The states failing (directly or not) to parent reach byte through
+        # it, unless they have their own transition: their byte children
+        # failed to link, and the new state is a longer suffix. The new
+        # state has no output yet, so their outputs do not change.
+        stack = list(children[parent])
+        while stack:
+            origin = stack.pop()
+            child = goto[origin].get(byte, None)
+            if child is None:
+                stack.extend(children[origin])
+            elif child != state:
+                children[fail[child]].discard(child)
+                fail[child] = state
+                children[state].add(child)
+        return state
+
+    def _add_output(self, state: int, pattern: int):
+        """
+        Add a pattern to the outputs of its state and of every state failing
+        to it, longest patterns first (called with the lock held).
+
+        :return: nothing.
+        """
+        patterns = self._patterns
+        outputs = self._outputs
+
+        def longest_first(item):
+            return -patterns[item][0]
+
+        stack = [state]
+        while stack:
+            origin = stack.pop()
+            outputs[origin] = tuple(sorted(outputs[origin] + (pattern,),
+                                           key=longest_first))
+            stack.extend(self._fail_children[origin])
+
+    def _snapshot(self):
+        """
+        The automaton to scan with, published again after additions. The
+        lists are copied (the transitions of each state are shared until
+        the trie changes them), and the transitions cache (delta) is filled
+        by the scans, state by state.
+
+        :return: an _Automaton.
+        """
+        automaton = self._automaton
+        if automaton is None:
+            with self._lock:
+                automaton = self._automaton
+                if automaton is None:
+                    automaton = _Automaton(list(self._goto),
+                                           [None] * len(self._goto),
+                                           list(self._fail),
+                                           list(self._outputs),
+                                           tuple(self._patterns),
+                                           self._max_length)
+                    self._shared = len(self._goto)
+                    self._copied = set()
+                    self._automaton = automaton
+        return automaton
+
+    @staticmethod
+    def _transitions(automaton, state: int):
+        """
+        :return: the cached transitions of a state (a copy of the trie ones
+        the first time).
+        """
+        transitions = automaton.delta[state]
+        if transitions is None:
+            transitions = dict(automaton.goto[state])
+            automaton.delta[state] = transitions
+        return transitions
+
+    @staticmethod
+    def _transition(automaton, state: int, byte: int):
+        """
+        Follow the failure links for a byte, and cache the result (cached
+        transitions are valid shortcuts of the failure links, so they are
+        followed too).
+
+        :return: the next state.
+        """
+        origin = state
+        goto = automaton.goto
+        delta = automaton.delta
+        fail = automaton.fail
+        while state:
+            transitions = delta[state] or goto[state]
+            if byte in transitions:
+                break
+            state = fail[state]
+        transitions = delta[state] or goto[state]
+        next_state = transitions.get(byte, 0)
+        IocScanner._transitions(automaton, origin)[byte] = next_state
+        return next_state
+
+    def _feed(self, automaton, data: bytes, state: int, offset: int):
+        """
+        Run the automaton over data.
+
+        :param automaton: the snapshot to scan with.
+        :param data: the lower case bytes.
+        :param state: the state to start from.
+        :param offset: the stream offset of data.
+        :return: tuple (state, list of (start, end, pattern)).
+        """
+        delta = automaton.delta
+        outputs = automaton.outputs
+        patterns = automaton.patterns
+        transition = self._transition
+        found = []
+        for index, byte in enumerate(data):
+            transitions = delta[state]
+            if transitions is None:
+                transitions = self._transitions(automaton, state)
+            next_state = transitions.get(byte, None)
+            if next_state is None:
+                next_state = transition(automaton, state, byte)
+            state = next_state
+            if outputs[state]:
+                end = offset + index + 1
+                for pattern in outputs[state]:
+                    found.append((end - patterns[pattern][0], end, pattern))
+        return state, found
+
+    @staticmethod
+    def _is_bounded(window: bytes, start: int, end: int):
+        """
+        Check a match is not part of a longer name.
+
+        :param window: the bytes around the match.
+        :param start: the match start in window.
+        :param end: the match end in window.
+        :return: True if the match is delimited.
+        """
+        if start > 0 and window[start - 1] in _NAME_BYTES:
+            return False
+        if end < len(window):
+            after = window[end]
+            if after in _NAME_BYTES:
+                return False
+            if after == _DOT and end + 1 < len(window) \
+                    and window[end + 1] in _NAME_BYTES:
+                return False
+        return True
+
+    @staticmethod
+    def _match(automaton, start: int, end: int, pattern: int):
+        _, ioc_type, content, ioc_id = automaton.patterns[pattern]
+        return ScanMatch(start, end, ioc_type, content, ioc_id)
+
+    def scan_stream(self, chunks: typing.Iterable):
+        """
+        Find the IoCs in a stream, keeping the automaton state between
+        chunks (matches may span them).
+
+        :param chunks: the chunks (bytes or str).
+        :return: a generator of ScanMatch, in order of their end.
+        """
+        automaton = self._snapshot()
+        state = 0
+        offset = 0
+        tail = b''
+        pending = []
+        keep = automaton.max_length + 4
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = chunk.lower()
+            state, found = self._feed(automaton, data, state, offset)
+            offset += len(data)
+
+            if not self.boundaries:
+                for start, end, pattern in found:
+                    yield self._match(automaton, start, end, pattern)
+                continue
+
+            window = tail + data
+            window_start = offset - len(window)
+            candidates, pending = pending + found, []
+            for start, end, pattern in candidates:
+                # The two bytes after a match are needed to check it.
+                if end + 2 > offset:
+                    pending.append((start, end, pattern))
+                elif self._is_bounded(window, start - window_start,
+                                      end - window_start):
+                    yield self._match(automaton, start, end, pattern)
+            tail = window[-keep:]
+
+        window_start = offset - len(tail)
+        for start, end, pattern in pending:
+            if self._is_bounded(tail, start - window_start,
+                                end - window_start):
+                yield self._match(automaton, start, end, pattern)
+
+    def scan(self, text):
+        """
+        Find the IoCs in a text.
+
+        :param text: str or bytes.
+        :return: list of ScanMatch.
+        """
+        return list(self.scan_stream((text,)))
+
+    def __len__(self):
+        return len(self._patterns)
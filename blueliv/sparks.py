@@ -4,12 +4,34 @@ Sparks are pieces of information with IoC, URLs and other associated assets.
 We can search using the API and by term, tag or other parameters.
 
 """
+import collections
+import functools
 import typing
 from .configuration import (  # pylint: disable=E0401
-    BASE_SPARKS_URL, BASE_SPARKS_TIMELINE_URL, BASE_SPARKS_DISCOVER_URL
+    BASE_SPARKS_URL, BASE_SPARKS_TIMELINE_URL, BASE_SPARKS_DISCOVER_URL,
+    FANOUT_WORKERS
 )
 
 from .core import BASEModel, BluelivRequest  # pylint: disable=E0401
+from .fanout import bounded_map
+from .iocs import BluelivIOC
+
+SparkIocs = collections.namedtuple('SparkIocs',
+                                   ('spark_id', 'result', 'error'))
+
+
+def unique_ids(spark_ids: typing.Iterable):
+    """
+    Drop the empty and repeated spark ids, lazily and keeping the order.
+
+    :param spark_ids: iterable with the spark ids.
+    :return: a generator of spark ids.
+    """
+    seen = set()
+    for spark_id in spark_ids:
+        if spark_id not in seen and spark_id not in (None, ''):
+            seen.add(spark_id)
+            yield spark_id
 
 
 class Spark(BASEModel):  # pylint: disable=too-few-public-methods
@@ -21,42 +43,59 @@ class Spark(BASEModel):  # pylint: disable=too-few-public-methods
     # pylint: disable=too-many-instance-attributes
     # 17 elements, but are all used.
 
-    spark_id = None
-    title = None
-    description = None
-    tlp = None
-    created_at = None
-    likes_count = None
-    spark_created_at = None
-    source_url = []
-    weight = None
-    geo_domains = []
-    geo_ips = []
-    geo_points = []
-    resparks_count = 0
-    iocs_counters = {}
-    tags = []
-    user = {}
-    original_spark = {}
-
-    def __init__(self):
-        self.spark_id = None
-        self.title = None
-        self.description = None
-        self.tlp = 'red'
-        self.created_at = None
-        self.likes_count = None
-        self.spark_created_at = None
-        self.source_url = []
-        self.weight = None
-        self.geo_domains = []
-        self.geo_ips = []
-        self.geo_points = []
-        self.resparks_count = 0
-        self.iocs_counters = {}
-        self.tags = []
-        self.user = {}
-        self.original_spark = {}
+    __slots__ = ('spark_id', 'title', 'description', 'tlp', 'created_at',
+                 'likes_count', 'spark_created_at', 'source_url', 'weight',
+                 'geo_domains', 'geo_ips', 'geo_points', 'resparks_count',
+                 'iocs_counters', 'tags', 'user', 'original_spark')
+
+    _api_fields = (('id', 'spark_id'), ('title', 'title'),
+                   ('description', 'description'), ('tlp', 'tlp'),
+                   ('created_at', 'created_at'),
+                   ('likes_count', 'likes_count'),
+                   ('spark_created_at', 'spark_created_at'),
+                   ('source_url', 'source_url'), ('weight', 'weight'),
+                   ('geo_domains', 'geo_domains'), ('geo_ips', 'geo_ips'),
+                   ('geo_points', 'geo_points'),
+                   ('resparks_count', 'resparks_count'),
+                   ('iocs_counters', 'iocs_counters'), ('tags', 'tags'),
+                   ('user', 'user'), ('original_spark', 'original_spark'))
+
+    spark_id: typing.Optional[int]
+    title: typing.Optional[str]
+    description: typing.Optional[str]
+    tlp: str
+    created_at: typing.Optional[str]
+    likes_count: typing.Optional[int]
+    spark_created_at: typing.Optional[str]
+    source_url: list
+    weight: typing.Optional[int]
+    geo_domains: list
+    geo_ips: list
+    geo_points: list
+    resparks_count: int
+    iocs_counters: dict
+    tags: list
+    user: dict
+    original_spark: dict
+
+    def __init__(self, **kwargs):
+        self.spark_id = kwargs.get('spark_id', None)
+        self.title = kwargs.get('title', None)
+        self.description = kwargs.get('description', None)
+        self.tlp = kwargs.get('tlp', 'red')
+        self.created_at = kwargs.get('created_at', None)
+        self.likes_count = kwargs.get('likes_count', None)
+        self.spark_created_at = kwargs.get('spark_created_at', None)
+        self.source_url = kwargs.get('source_url', [])
+        self.weight = kwargs.get('weight', None)
+        self.geo_domains = kwargs.get('geo_domains', [])
+        self.geo_ips = kwargs.get('geo_ips', [])
+        self.geo_points = kwargs.get('geo_points', [])
+        self.resparks_count = kwargs.get('resparks_count', 0)
+        self.iocs_counters = kwargs.get('iocs_counters', {})
+        self.tags = kwargs.get('tags', [])
+        self.user = kwargs.get('user', {})
+        self.original_spark = kwargs.get('original_spark', {})
 
         super().__init__()
 
@@ -116,29 +155,41 @@ class SparksRequest(BluelivRequest):
                          base_url=self._base_url,
                          category=self._category,
                          limit=self.limit,
-                         since_id=self.since_id)
+                         since_id=self.since_id,
+                         transport=kwargs.get('transport', None),
+                         mirror=kwargs.get('mirror', None))
 
     def get(self,
-            spark_id: str):
+            spark_id: str,
+            as_model: bool = False):
         """
         Quick get to retrieve a Spark by its id.
 
         :param spark_id: the spark id we want to retrieve.
-        :return: list, dict or JSON with the data.
+        :param as_model: if we want a Spark model instead of JSON (True).
+        :return: list, dict, JSON or a Spark with the data.
 
         """
         resource_url = '%s/%s' % (self._base_url, spark_id)
-        return self.request(resource=resource_url)
+        return self.request(resource=resource_url,
+                            model=Spark if as_model else None)
 
     def timeline(self,
                  limit: typing.Optional[str] = None,
-                 since_id: typing.Optional[str] = None):
+                 since_id: typing.Optional[str] = None,
+                 as_json: bool = False,
+                 stream: bool = False,
+                 as_model: bool = False):
         """
         Retrieve sparks ordered in a timeline, with timestamp info.
 
         :param limit: the maximum number of item we want to receive.
         :param since_id: the reference since we want to get the information.
-        :return: list, dict or JSON.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param stream: if we want a generator of sparks, decoded while the
+        response is received (True).
+        :param as_model: if we want Spark models instead of dicts (True).
+        :return: list, dict, JSON or a generator (if stream == True).
 
         """
         params = {}
@@ -152,18 +203,48 @@ class SparksRequest(BluelivRequest):
             params['limit'] = limit
 
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            stream=stream,
+                            model=Spark if as_model else None)
+
+    def iter_timeline(self,
+                      limit: typing.Optional[str] = None,
+                      since_id: typing.Optional[str] = None,
+                      prefetch: bool = True):
+        """
+        Iterate over the timeline sparks one at a time, following the
+        since_id cursor page after page (see blueliv.pagination).
+
+        :param limit: the page size.
+        :param since_id: the reference since we want to get the information.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of sparks (dicts).
+
+        """
+        return self._iter_pages(functools.partial(self.timeline,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
 
     def discover(self,
                  limit: typing.Optional[str] = None,
-                 since_id: typing.Optional[str] = None):
+                 since_id: typing.Optional[str] = None,
+                 as_json: bool = False,
+                 stream: bool = False,
+                 as_model: bool = False):
         """
         Discover will retrieve the latest relevant informations that can be
         found in the Bluelivs community.
 
         :param limit: the maximum number of item we want to receive.
         :param since_id: the reference since we want to get the information.
-        :return: list, dict or JSON.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param stream: if we want a generator of sparks, decoded while the
+        response is received (True).
+        :param as_model: if we want Spark models instead of dicts (True).
+        :return: list, dict, JSON or a generator (if stream == True).
 
         """
         params = {}
@@ -177,12 +258,37 @@ class SparksRequest(BluelivRequest):
             params['limit'] = limit
 
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            stream=stream,
+                            model=Spark if as_model else None)
+
+    def iter_discover(self,
+                      limit: typing.Optional[str] = None,
+                      since_id: typing.Optional[str] = None,
+                      prefetch: bool = True):
+        """
+        Iterate over the discover sparks one at a time, following the
+        since_id cursor page after page (see blueliv.pagination).
+
+        :param limit: the page size.
+        :param since_id: the reference since we want to get the information.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of sparks (dicts).
+
+        """
+        return self._iter_pages(functools.partial(self.discover,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
 
-    def iocs(self,
+    def iocs(self,  # pylint: disable=too-many-arguments
              spark_id,
              limit: typing.Optional[str] = None,
-             since_id: typing.Optional[str] = None):
+             since_id: typing.Optional[str] = None,
+             as_json: bool = False,
+             as_model: bool = False):
         """
         iocs will retrieve the relevant IoCs for an specific spark, set by
         the spark_id.
@@ -190,7 +296,9 @@ class SparksRequest(BluelivRequest):
         :param spark_id: the id for the Spark.
         :param limit: the maximum number of item we want to receive.
         :param since_id: the reference since we want to get the information.
-        :return: list, dict or JSON.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param as_model: if we want BluelivIOC models instead of dicts (True).
+        :return: list, dict, JSON or BluelivIOC models.
 
         """
         params = {}
@@ -205,7 +313,43 @@ class SparksRequest(BluelivRequest):
             params['limit'] = limit
 
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            model=BluelivIOC if as_model else None)
+
+    def iocs_many(self,  # pylint: disable=too-many-arguments
+                  spark_ids: typing.Iterable,
+                  limit: typing.Optional[str] = None,
+                  workers: int = FANOUT_WORKERS,
+                  ordered: bool = False,
+                  as_json: bool = False):
+        """
+        Retrieve the IoCs of many sparks, with at most workers requests in
+        flight over the shared transport, so the time is bounded by the
+        slowest request instead of the sum of all of them. Repeated ids are
+        requested once. They are consumed lazily, so spark_ids may be a
+        generator.
+
+        A failed request does not stop the others: its error is reported in
+        its result.
+
+        :param spark_ids: iterable with the spark ids.
+        :param limit: the maximum number of IoCs per spark.
+        :param workers: the maximum number of requests in flight.
+        :param ordered: yield in the order of the ids (True) or as soon as
+        each request completes (False).
+        :param as_json: if we want to receive the responses as JSON (True).
+        :return: a generator of SparkIocs(spark_id, result, error), where
+        error is None if the request succeeded.
+        """
+        def fetch(spark_id):
+            return self.iocs(spark_id, limit=limit, as_json=as_json)
+
+        for spark_id, result, error in bounded_map(fetch,
+                                                   unique_ids(spark_ids),
+                                                   workers=workers,
+                                                   ordered=ordered):
+            yield SparkIocs(spark_id, result, error)
 
     def publish(self, title: str, description: str,
                 tlp: str = 'green',
@@ -0,0 +1,216 @@
+"""
+Incremental parsing of JSON feeds, to decode the items of a page while it is
+still being received.
+
+A page is either the list of items or a dict with the list under one of the
+pagination.ITEMS_KEYS. Items are decoded as soon as they are complete, so the
+time to the first item and the memory used do not grow with the page size:
+
+    for spark in sparks.timeline(limit=5000, stream=True):
+        print(spark['id'])
+
+"""
+import codecs
+import contextlib
+import json
+import re
+import typing
+
+from .configuration import STREAM_CHUNK_SIZE
+from .pagination import ITEMS_KEYS
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_KEY = re.compile(r'"((?:[^"\\]|\\.)*)"[ \t\n\r]*:')
+_DELIMITERS = frozenset(' \t\n\r,]}')
+_INCOMPLETE = object()
+
+_START = 'start'
+_KEY_STATE = 'key'
+_VALUE = 'value'
+_ARRAY = 'array'
+_DONE = 'done'
+
+
+class JSONItemParser:
+    """JSONItemParser is a push parser: feed it the body chunks as they
+    arrive and it returns the items completed by each one.
+
+    Only the pending (incomplete) part of the document is kept in memory.
+    Anything after the list of items is ignored.
+
+    Attributes:
+        items_key: the key holding the items when the page is a dict (by
+        default, the first of ITEMS_KEYS found).
+
+    """
+
+    items_key: typing.Optional[str] = None
+
+    def __init__(self, items_key: typing.Optional[str] = None):
+        self.items_key = items_key
+        self._text = codecs.getincrementaldecoder('utf-8-sig')()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._state = _START
+        self._key = None
+        self._min_pending = 0
+
+    def _is_items_key(self, key: str):
+        if self.items_key:
+            return key == self.items_key
+        return key in ITEMS_KEYS
+
+    def _skip_whitespace(self):
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+
+    def _decode_value(self, final: bool):
+        """
+        Decode the JSON value at the current position.
+
+        :param final: True if no more data will be fed.
+        :return: the value, or _INCOMPLETE if more data is needed.
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return _INCOMPLETE
+
+        # A value is only complete when followed by a delimiter (a number
+        # at the end of the buffer may still have more digits).
+        complete = end < len(self._buffer) and self._buffer[end] in _DELIMITERS
+        if not final and not complete:
+            return _INCOMPLETE
+
+        self._pos = end
+        return value
+
+    def _parse(self, final: bool):  # pylint: disable=R0912
+        """
+        Advance over the buffer as far as possible.
+
+        :param final: True if no more data will be fed.
+        :return: list with the items completed.
+        """
+        items = []
+        while self._state != _DONE:
+            self._skip_whitespace()
+            if self._pos >= len(self._buffer):
+                break
+
+            char = self._buffer[self._pos]
+            if self._state == _START:
+                if char == '[':
+                    self._state = _ARRAY
+                    self._pos += 1
+                elif char == '{':
+                    self._state = _KEY_STATE
+                    self._pos += 1
+                else:
+                    # A scalar document has no items.
+                    self._state = _DONE
+            elif self._state == _KEY_STATE:
+                if char == '}':
+                    self._state = _DONE
+                elif char == ',':
+                    self._pos += 1
+                else:
+                    match = _KEY.match(self._buffer, self._pos)
+                    if match is None:
+                        if final:
+                            raise ValueError('Invalid JSON object key at %d'
+                                             % self._pos)
+                        break
+                    self._key = json.loads('"%s"' % match.group(1))
+                    self._pos = match.end()
+                    self._state = _VALUE
+            elif self._state == _VALUE:
+                if char == '[' and self._is_items_key(self._key):
+                    self._state = _ARRAY
+                    self._pos += 1
+                elif self._decode_value(final) is _INCOMPLETE:
+                    break
+                else:
+                    self._state = _KEY_STATE
+            elif char == ']':
+                self._state = _DONE
+            elif char == ',':
+                self._pos += 1
+            else:
+                item = self._decode_value(final)
+                if item is _INCOMPLETE:
+                    break
+                items.append(item)
+
+        if self._state == _DONE:
+            self._buffer = ''
+        else:
+            self._buffer = self._buffer[self._pos:]
+            # Wait for the pending data to double before retrying, so a big
+            # item is not decoded again for every small chunk.
+            self._min_pending = 2 * len(self._buffer)
+        self._pos = 0
+        return items
+
+    def feed(self, data: bytes):
+        """
+        Add a chunk of the body.
+
+        :param data: the chunk (bytes).
+        :return: list with the items completed by it.
+        """
+        if self._state == _DONE:
+            return []
+
+        self._buffer += self._text.decode(data)
+        if len(self._buffer) < self._min_pending:
+            return []
+        return self._parse(final=False)
+
+    def close(self):
+        """
+        Signal the end of the body.
+
+        :return: list with the remaining items.
+        """
+        if self._state == _DONE:
+            return []
+
+        self._buffer += self._text.decode(b'', final=True)
+        items = self._parse(final=True)
+        if self._state not in (_DONE, _START):
+            raise ValueError('Truncated JSON document')
+        return items
+
+
+def iter_items(chunks: typing.Iterable[bytes],
+               items_key: typing.Optional[str] = None):
+    """
+    Decode the items of a JSON page from an iterable of body chunks.
+
+    :param chunks: the body chunks (bytes).
+    :param items_key: the page key holding the items, if known.
+    :return: a generator of items.
+    """
+    parser = JSONItemParser(items_key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def iter_response_items(response,
+                        items_key: typing.Optional[str] = None,
+                        chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Decode the items of a streamed requests.Response while it is received.
+    The connection is released when the generator ends or is closed.
+
+    :param response: the requests.Response (sent with stream=True).
+    :param items_key: the page key holding the items, if known.
+    :param chunk_size: the size of the chunks read from the socket.
+    :return: a generator of items.
+    """
+    with contextlib.closing(response):
+        yield from iter_items(response.iter_content(chunk_size), items_key)
@@ -0,0 +1,296 @@
+"""
+Incremental sync of the since_id feeds with durable checkpoints.
+
+A FeedSync keeps, for every feed, the since_id of the last page processed in
+a checkpoint store (SQLite or a JSON file replaced atomically). After a
+restart each feed resumes exactly where it stopped, so catching up costs one
+request per feed instead of a full backfill:
+
+    sync = FeedSync(SQLiteCheckpointStore('/var/lib/collector/feeds.db'))
+    sync.add_feed('sparks.timeline', sparks.timeline)
+    sync.add_feed('iocs.discover', iocs.discover)
+    sync.add_feed('tags.mafia.sparks',
+                  functools.partial(tags.list_sparks, 'mafia'))
+
+    sync.sync_all(lambda feed, items: store_items(feed, items))
+
+The handler receives the items page by page, and the checkpoint is written
+after it returns: if the process dies in the middle, that page is requested
+again on the next run (at-least-once delivery).
+
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import typing
+
+from .configuration import FANOUT_WORKERS
+from .fanout import bounded_map
+from .pagination import extract_items, is_last_page, next_cursor
+
+
+class SQLiteCheckpointStore:
+    """SQLiteCheckpointStore keeps the checkpoints in a SQLite database.
+
+    Attributes:
+        path: the database file.
+
+    """
+
+    path: str = ':memory:'
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints ('
+                ' feed TEXT PRIMARY KEY,'
+                ' since_id TEXT NOT NULL,'
+                ' updated_at REAL NOT NULL)')
+
+    def get(self, feed: str):
+        """
+        Retrieve the checkpoint of a feed.
+
+        :param feed: the feed name.
+        :return: the since_id, or None if the feed was never synced.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT since_id FROM checkpoints WHERE feed = ?',
+                (feed,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, feed: str, since_id):
+        """
+        Store the checkpoint of a feed (committed before returning).
+
+        :param feed: the feed name.
+        :param since_id: the since_id to resume from.
+        :return: nothing.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO checkpoints (feed, since_id,'
+                ' updated_at) VALUES (?, ?, ?)',
+                (feed, json.dumps(since_id), time.time()))
+
+    def all(self):
+        """
+        Every checkpoint.
+
+        :return: dict with the since_id per feed.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT feed, since_id FROM checkpoints').fetchall()
+        return {feed: json.loads(since_id) for feed, since_id in rows}
+
+    def close(self):
+        """
+        Close the database.
+
+        :return: nothing.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+class FileCheckpointStore:
+    """FileCheckpointStore keeps the checkpoints in a JSON file. Every change
+    is written to a temporary file, flushed to disk and renamed over the
+    previous one, so a crash never leaves a half written file.
+
+    Attributes:
+        path: the JSON file.
+
+    """
+
+    path: str = ''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checkpoints = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as handle:
+                self._checkpoints = json.load(handle)
+
+    def get(self, feed: str):
+        """
+        Retrieve the checkpoint of a feed.
+
+        :param feed: the feed name.
+        :return: the since_id, or None if the feed was never synced.
+        """
+        with self._lock:
+            return self._checkpoints.get(feed, None)
+
+    def set(self, feed: str, since_id):
+        """
+        Store the checkpoint of a feed (on disk before returning).
+
+        :param feed: the feed name.
+        :param since_id: the since_id to resume from.
+        :return: nothing.
+        """
+        with self._lock:
+            checkpoints = dict(self._checkpoints)
+            checkpoints[feed] = since_id
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            descriptor, temporary = tempfile.mkstemp(dir=directory,
+                                                     suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as handle:
+                    json.dump(checkpoints, handle)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                os.replace(temporary, self.path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+            self._checkpoints = checkpoints
+
+    def all(self):
+        """
+        Every checkpoint.
+
+        :return: dict with the since_id per feed.
+        """
+        with self._lock:
+            return dict(self._checkpoints)
+
+    def close(self):
+        """
+        Nothing to release (every change is already on disk).
+
+        :return: nothing.
+        """
+
+
+class FeedSync:
+    """FeedSync pulls the new items of several since_id feeds, resuming each
+    one from its checkpoint.
+
+    Attributes:
+        store: the checkpoint store (SQLiteCheckpointStore or
+        FileCheckpointStore).
+
+        limit: the page size requested.
+
+        cursor_key: the item key holding the id.
+
+    """
+
+    store = None
+    limit: typing.Optional[int] = None
+    cursor_key: str = 'id'
+
+    def __init__(self, store, **kwargs):
+        self.store = store
+        self.limit = None
+        self.cursor_key = 'id'
+        self._feeds = {}
+
+        if 'limit' in kwargs:
+            self.limit = kwargs.get('limit', None)
+
+        if 'cursor_key' in kwargs:
+            self.cursor_key = kwargs.get('cursor_key', 'id')
+
+    def add_feed(self, name: str, fetch: typing.Callable, since_id=None):
+        """
+        Register a feed.
+
+        :param name: the feed name (the checkpoint key).
+        :param fetch: callable as fetch(limit=..., since_id=..., as_json=...)
+        returning a page, as SparksRequest.timeline or a functools.partial of
+        TagsRequest.list_sparks.
+        :param since_id: where to start if there is no checkpoint yet.
+        :return: nothing.
+        """
+        self._feeds[name] = (fetch, since_id)
+
+    def feeds(self):
+        """
+        The names of the registered feeds.
+
+        :return: list of names.
+        """
+        return list(self._feeds)
+
+    def checkpoint(self, name: str):
+        """
+        The since_id a feed will resume from.
+
+        :param name: the feed name.
+        :return: the since_id (None to start from the beginning).
+        """
+        since_id = self.store.get(name)
+        if since_id is None:
+            since_id = self._feeds[name][1]
+        return since_id
+
+    def sync(self, name: str, handler: typing.Callable,
+             max_pages: typing.Optional[int] = None):
+        """
+        Fetch the pages published since the checkpoint of a feed, passing
+        each one to the handler and moving the checkpoint after it.
+
+        :param name: the feed name.
+        :param handler: callable as handler(name, items).
+        :param max_pages: the maximum number of pages to fetch, if any.
+        :return: the number of items handled.
+        """
+        fetch = self._feeds[name][0]
+        since_id = self.checkpoint(name)
+        handled = 0
+        pages = 0
+        while max_pages is None or pages < max_pages:
+            page = fetch(limit=self.limit, since_id=since_id, as_json=True)
+            pages += 1
+            items = extract_items(page)
+            cursor = next_cursor(items, since_id, self.cursor_key)
+            if cursor is None:
+                break
+
+            handler(name, items)
+            handled += len(items)
+            self.store.set(name, cursor)
+            since_id = cursor
+
+            if is_last_page(items, self.limit):
+                break
+        return handled
+
+    def sync_all(self, handler: typing.Callable,
+                 workers: int = FANOUT_WORKERS):
+        """
+        Sync every registered feed, up to workers of them at the same time.
+
+        :param handler: callable as handler(name, items). It may be called
+        from several threads.
+        :param workers: the maximum number of feeds synced concurrently.
+        :return: dict with the number of items handled per feed.
+        """
+        results = {}
+        errors = {}
+        for name, handled, exception in bounded_map(
+                lambda name: self.sync(name, handler),
+                list(self._feeds),
+                workers=workers):
+            if exception is not None:
+                errors[name] = exception
+            else:
+                results[name] = handled
+
+        if errors:
+            raise Exception('Feeds failed to sync: %s' % ', '.join(
+                '%s (%s)' % (name, error) for name, error in errors.items()))
+        return results
@@ -2,6 +2,7 @@
 Tags to manage and dealt with tagged assets and to tag by ourselves.
 
 """
+import functools
 import typing
 
 from .configuration import (
@@ -9,24 +10,33 @@ from .configuration import (
 )
 
 from .core import BASEModel, BluelivRequest
+from .iocs import BluelivIOC
+from .sparks import Spark
 
 
 class Tag(BASEModel):  # pylint: disable=too-few-public-methods
     """
     A model to store a tag, with its information.
     """
-    tag_id: typing.Optional[str] = None
-    name: typing.Optional[str] = None
-    questions_count: int = 0
-    slug: typing.Optional[str] = None
-    sparks_count: int = 0
-
-    def __init__(self):
-        self.tag_id = None
-        self.name = None
-        self.questions_count = 0
-        self.slug = None
-        self.sparks_count = 0
+
+    __slots__ = ('tag_id', 'name', 'questions_count', 'slug', 'sparks_count')
+
+    _api_fields = (('id', 'tag_id'), ('name', 'name'),
+                   ('questions_count', 'questions_count'), ('slug', 'slug'),
+                   ('sparks_count', 'sparks_count'))
+
+    tag_id: typing.Optional[str]
+    name: typing.Optional[str]
+    questions_count: int
+    slug: typing.Optional[str]
+    sparks_count: int
+
+    def __init__(self, **kwargs):
+        self.tag_id = kwargs.get('tag_id', None)
+        self.name = kwargs.get('name', None)
+        self.questions_count = kwargs.get('questions_count', 0)
+        self.slug = kwargs.get('slug', None)
+        self.sparks_count = kwargs.get('sparks_count', 0)
 
         super().__init__()
 
@@ -83,27 +93,35 @@ class TagsRequest(BluelivRequest):
                          base_url=self._base_url,
                          category=self._category,
                          limit=self.limit,
-                         since_id=self.since_id)
+                         since_id=self.since_id,
+                         transport=kwargs.get('transport', None),
+                         mirror=kwargs.get('mirror', None))
 
-    def list(self):
+    def list(self, as_model: bool = False):
         """
         List all the tags in the Community.
 
+        :param as_model: if we want Tag models instead of dicts (True).
         :return: dict, list or JSON with the tag list.
         """
-        return self.request(resource=self._base_url)
+        return self.request(resource=self._base_url,
+                            model=Tag if as_model else None)
 
-    def list_sparks(self,
+    def list_sparks(self,  # pylint: disable=too-many-arguments
                     tag_slug: str,
                     limit: typing.Optional[str] = None,
-                    since_id: typing.Optional[str] = None):
+                    since_id: typing.Optional[str] = None,
+                    as_json: bool = False,
+                    as_model: bool = False):
         """
         List sparks tagged with a specific tag.
 
         :param tag_slug: the tag.
         :param limit: the maximum number of items we want to retrieve.
         :param since_id: the reference id from we want to receive items.
-        :return: dict, list or JSON with the sparks.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param as_model: if we want Spark models instead of dicts (True).
+        :return: dict, list, JSON or Spark models with the sparks.
         """
         params = {}
         resource_url = '%s/%s%s' % (self._base_url,
@@ -117,18 +135,47 @@ class TagsRequest(BluelivRequest):
             params['limit'] = limit
 
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            model=Spark if as_model else None)
+
+    def iter_sparks(self, tag_slug: str,
+                    limit=None,
+                    since_id=None,
+                    prefetch: bool = True):
+        """
+        Iterate over the sparks tagged with the tag one at a time, following
+        the since_id cursor page after page (see blueliv.pagination).
+
+        :param tag_slug: the tag.
+        :param limit: the page size.
+        :param since_id: the reference id from we want to receive items.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of sparks (dicts).
 
-    def list_iocs(self, tag_slug: str,
+        """
+        return self._iter_pages(functools.partial(self.list_sparks,
+                                                  tag_slug,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
+
+    def list_iocs(self,  # pylint: disable=too-many-arguments
+                  tag_slug: str,
                   limit: typing.Optional[str] = None,
-                  since_id: typing.Optional[str] = None):
+                  since_id: typing.Optional[str] = None,
+                  as_json: bool = False,
+                  as_model: bool = False):
         """
         List IoCs associated with a tag.
 
         :param tag_slug: the tag.
         :param limit: the maximum number of items we want to retrieve.
         :param since_id: the reference id from we want to receive items.
-        :return: dict, list or JSON with the IoCs.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param as_model: if we want BluelivIOC models instead of dicts (True).
+        :return: dict, list, JSON or BluelivIOC models with the IoCs.
 
         """
         params = {}
@@ -143,4 +190,28 @@ class TagsRequest(BluelivRequest):
             params['limit'] = limit
 
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            model=BluelivIOC if as_model else None)
+
+    def iter_iocs(self, tag_slug: str,
+                  limit=None,
+                  since_id=None,
+                  prefetch: bool = True):
+        """
+        Iterate over the IoCs tagged with the tag one at a time, following the
+        since_id cursor page after page (see blueliv.pagination).
+
+        :param tag_slug: the tag.
+        :param limit: the page size.
+        :param since_id: the reference id from we want to receive items.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of IoCs (dicts).
+
+        """
+        return self._iter_pages(functools.partial(self.list_iocs,
+                                                  tag_slug,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
@@ -0,0 +1,488 @@
+"""
+Transport defines the HTTP layer shared by every request class in the
+package.
+
+Instead of opening a new TCP+TLS connection for every call (as the module
+level requests.get/requests.post do), all BluelivRequest instances send their
+requests through a BluelivTransport, that keeps a pooled requests.Session with
+keep-alive connections.
+
+By default every instance shares the same module transport (see
+get_default_transport), but a custom one may be passed in the constructor of
+any request class with the transport parameter.
+
+A transport may also keep a response cache and a persistent HTTP cache with
+conditional revalidation (see blueliv.cache) for the GET requests, and
+retries the idempotent ones that fail with a 429, a 5xx or a connection
+error (see blueliv.retry). Requests wait for the rate limiter of their token,
+if there is one (see blueliv.ratelimit).
+
+Identical GET requests sent at the same time by several threads are
+coalesced: only the first one goes to the network and the others wait for
+its response (single-flight).
+
+"""
+import collections
+import threading
+import time
+import typing
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .cache import ResponseCache, SQLiteHTTPCache, cache_key
+from .configuration import (
+    BASE_API_URL,
+    POOL_CONNECTIONS, POOL_MAXSIZE, POOL_BLOCK,
+    HTTP_CACHE_PATH, COALESCE
+)
+from .logs import log
+from .metrics import MetricsRegistry, get_default_metrics
+from .retry import RetryPolicy
+
+
+def endpoint_family(url: str, base_url: str = BASE_API_URL):
+    """
+    The endpoint family of an url: the first segment of the resource, as
+    sparks, iocs, tags, users, malwares, crawl or search.
+
+    :param url: the full url.
+    :param base_url: the API base url.
+    :return: the family name ('core' if the resource is empty).
+    """
+    if url.startswith(base_url):
+        resource = url[len(base_url):]
+    else:
+        resource = urlsplit(url).path
+    resource = resource.split('?', 1)[0]
+
+    for segment in resource.split('/'):
+        if segment:
+            return segment
+    return 'core'
+
+
+class BluelivTransport:
+    """BluelivTransport wraps a requests.Session with a pooled HTTPAdapter
+    mounted for http and https, so connections are reused between calls.
+
+    Attributes:
+        pool_connections: the number of connection pools to cache (one per
+        host).
+
+        pool_maxsize: the maximum number of connections kept alive in each
+        pool. Set it to the number of threads sharing the transport.
+
+        pool_block: if True, when the pool is exhausted callers will wait for
+        a free connection instead of opening a throw-away one.
+
+        session: the requests.Session used to send every request.
+
+        cache: an optional ResponseCache for the GET requests (None means no
+        cache at all).
+
+        http_cache: an optional SQLiteHTTPCache, to revalidate GET responses
+        stored in previous runs. If BLUELIV_API_HTTP_CACHE_PATH is set, it is
+        created there by default.
+
+        retry: the RetryPolicy for failed requests (None disables retries).
+
+        coalesce: if True, concurrent identical GET requests share one
+        request in flight and all receive its response.
+
+        metrics: the MetricsRegistry recording the latency, size and status
+        of every request (the shared one by default, None records nothing).
+
+    """
+
+    pool_connections: int = POOL_CONNECTIONS
+    pool_maxsize: int = POOL_MAXSIZE
+    pool_block: bool = POOL_BLOCK
+    session: typing.Optional[requests.Session] = None
+    cache: typing.Optional[ResponseCache] = None
+    http_cache: typing.Optional[SQLiteHTTPCache] = None
+    retry: typing.Optional[RetryPolicy] = None
+    coalesce: bool = COALESCE
+    metrics: typing.Optional[MetricsRegistry] = None
+
+    def __init__(self, **kwargs):
+        self.pool_connections = POOL_CONNECTIONS
+        self.pool_maxsize = POOL_MAXSIZE
+        self.pool_block = POOL_BLOCK
+        self.session = None
+        self.cache = None
+        self.http_cache = None
+        self.retry = RetryPolicy()
+        self.coalesce = COALESCE
+        self.metrics = get_default_metrics()
+        self._stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+        if 'pool_connections' in kwargs:
+            self.pool_connections = kwargs.get('pool_connections',
+                                               POOL_CONNECTIONS)
+
+        if 'pool_maxsize' in kwargs:
+            self.pool_maxsize = kwargs.get('pool_maxsize', POOL_MAXSIZE)
+
+        if 'pool_block' in kwargs:
+            self.pool_block = kwargs.get('pool_block', POOL_BLOCK)
+
+        if 'session' in kwargs:
+            self.session = kwargs.get('session', None)
+
+        if 'cache' in kwargs:
+            self.cache = kwargs.get('cache', None)
+
+        if 'http_cache' in kwargs:
+            self.http_cache = kwargs.get('http_cache', None)
+        elif HTTP_CACHE_PATH:
+            self.http_cache = SQLiteHTTPCache(HTTP_CACHE_PATH)
+
+        if 'retry' in kwargs:
+            self.retry = kwargs.get('retry', None)
+
+        if 'coalesce' in kwargs:
+            self.coalesce = kwargs.get('coalesce', COALESCE)
+
+        if 'metrics' in kwargs:
+            self.metrics = kwargs.get('metrics', None)
+
+        if self.session is None:
+            self.session = self.build_session()
+
+    def build_session(self):
+        """
+        Build a new requests.Session with the pooled adapter mounted.
+
+        :return: the new requests.Session.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Send a request through the pooled session. GET requests are served
+        from the cache, if there is one and the response is fresh, or
+        revalidated against the HTTP cache, and they are coalesced with an
+        identical one in flight (see coalesce).
+
+        :param method: the HTTP method (GET, POST...).
+        :param url: the full url to connect to.
+        :param kwargs: any other parameter accepted by requests, and
+        rate_limiter (a RateLimiter to wait for before each attempt).
+        :return: the requests.Response object.
+        """
+        rate_limiter = kwargs.pop('rate_limiter', None)
+
+        # Streamed bodies are read by the caller, so they are never cached
+        # nor shared.
+        cached = self.cache is not None or self.http_cache is not None
+        key = None
+        if method.upper() == 'GET' and not kwargs.get('stream', False) \
+                and (self.coalesce or cached):
+            key = cache_key(method,
+                            url,
+                            kwargs.get('params', None),
+                            kwargs.get('headers', None))
+
+        if key is not None and self.coalesce:
+            return self._single_flight(key, endpoint_family(url),
+                                       self._request, method, url, key,
+                                       rate_limiter, **kwargs)
+        return self._request(method, url, key, rate_limiter, **kwargs)
+
+    def observe(self, family: str, response, start: float,
+                stream: bool = False):
+        """
+        Record a request sent to the network in the metrics registry, if
+        there is one (cache hits and coalesced requests only increment
+        their counters).
+
+        :param family: the endpoint family.
+        :param response: the response (None if the request failed).
+        :param start: the time.perf_counter() when it started.
+        :param stream: if the body was not read (its size is taken from the
+        Content-Length header).
+        :return: nothing.
+        """
+        if self.metrics is None:
+            return
+
+        elapsed = time.perf_counter() - start
+        if response is None:
+            self.metrics.observe(family, None, elapsed)
+            return
+
+        if stream:
+            size = int(response.headers.get('Content-Length', 0) or 0)
+        else:
+            size = len(response.content or b'')
+        self.metrics.observe(family, response.status_code, elapsed, size)
+
+    def _single_flight(self, key, family, func, *args, **kwargs):
+        """
+        Call func, unless an identical request is already in flight: then
+        wait for it and return its response (or raise its exception).
+
+        :param key: the request key (see cache_key).
+        :param family: the endpoint family.
+        :param func: the callable sending the request.
+        :return: the requests.Response object.
+        """
+        with self._flights_lock:
+            flight = self._flights.get(key, None)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = {'done': threading.Event()}
+
+        if not leader:
+            self.count('coalesced', family=family)
+            flight['done'].wait()
+            if 'error' in flight:
+                raise flight['error']
+            return flight['response']
+
+        try:
+            flight['response'] = func(*args, **kwargs)
+            return flight['response']
+        except BaseException as exception:
+            flight['error'] = exception
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight['done'].set()
+
+    def _request(self,  # pylint: disable=too-many-arguments
+                 method: str,
+                 url: str,
+                 key,
+                 rate_limiter=None,
+                 **kwargs):
+        """
+        Serve a request from the caches or send it.
+
+        :param method: the HTTP method (GET, POST...).
+        :param url: the full url to connect to.
+        :param key: the request key (see cache_key), None if not cacheable.
+        :param rate_limiter: the RateLimiter to wait for, if any.
+        :param kwargs: any other parameter accepted by requests.
+        :return: the requests.Response object.
+        """
+        if key is not None and self.cache is not None:
+            response = self.cache.get(key)
+            if response is not None:
+                self.count('cache_hits', family=endpoint_family(url))
+                return response
+
+        stored = None
+        if key is not None and self.http_cache is not None:
+            stored = self.http_cache.get(key)
+            if stored is not None:
+                headers = dict(kwargs.get('headers', None) or {})
+                headers.update(self.http_cache.conditional_headers(stored))
+                kwargs['headers'] = headers
+
+        family = endpoint_family(url)
+        start = time.perf_counter()
+        try:
+            response = self._send(method, url, rate_limiter, **kwargs)
+        except Exception:
+            self.observe(family, None, start)
+            raise
+        self.observe(family, response, start,
+                     stream=kwargs.get('stream', False))
+
+        if stored is not None and response.status_code == 304:
+            response = self._stored_response(stored, response)
+            self.http_cache.hit()
+            self.count('revalidated', family=family)
+        elif self.http_cache is not None and key is not None \
+                and response.status_code == 200:
+            self.http_cache.set(key, url, response.headers, response.content)
+
+        if self.cache is not None and key is not None \
+                and response.status_code == 200:
+            self.cache.set(key, response)
+        return response
+
+    def _send(self, method: str, url: str, rate_limiter=None, **kwargs):
+        """
+        Send a request through the session, retrying it as the retry policy
+        allows.
+
+        :param method: the HTTP method (GET, POST...).
+        :param url: the full url to connect to.
+        :param rate_limiter: the RateLimiter to wait for, if any.
+        :param kwargs: any other parameter accepted by requests.
+        :return: the requests.Response object.
+        """
+        self.count('requests')
+        family = endpoint_family(url)
+        retry = 0
+        waited = 0.0
+        while True:
+            if rate_limiter is not None \
+                    and rate_limiter.acquire(family) > 0:
+                self.count('rate_limited', family=family)
+
+            self.count('attempts', family=family)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                delay = None
+                if self.retry is not None \
+                        and self.retry.is_retryable(method, None):
+                    delay = self.retry.next_delay(retry, waited)
+                if delay is None:
+                    self.count('errors', family=family)
+                    raise
+            else:
+                if self.retry is None \
+                        or not self.retry.is_retryable(method,
+                                                       response.status_code):
+                    return response
+
+                delay = self.retry.next_delay(
+                    retry, waited, response.headers.get('Retry-After', None))
+                if delay is None:
+                    self.count('retry_giveups', family=family)
+                    return response
+                response.close()
+
+            self.count('retries', family=family)
+            log.info('request.retry', method=method, url=url,
+                     attempt=retry + 1, delay=delay)
+            time.sleep(delay)
+            waited += delay
+            retry += 1
+
+    def count(self, name: str, value: int = 1,
+              family: typing.Optional[str] = None):
+        """
+        Increment a counter in the transport stats (and in the metrics of
+        the family, if it is set).
+
+        :param name: the counter name.
+        :param value: the increment.
+        :param family: the endpoint family of the request.
+        :return: nothing.
+        """
+        with self._stats_lock:
+            self._stats[name] += value
+        if family is not None and self.metrics is not None:
+            self.metrics.increment(name, family, value)
+
+    def stats(self):
+        """
+        The transport counters: requests (not served by the cache), attempts
+        (sent to the network), retries, retry_giveups, errors, rate_limited
+        (attempts delayed by the rate limiter) and coalesced (requests that
+        waited for an identical one in flight), plus the cache ones.
+
+        :return: dict with the counters.
+        """
+        with self._stats_lock:
+            stats = {name: self._stats[name]
+                     for name in ('requests', 'attempts', 'retries',
+                                  'retry_giveups', 'errors', 'rate_limited',
+                                  'coalesced')}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if self.http_cache is not None:
+            stats['http_cache'] = self.http_cache.stats()
+        return stats
+
+    @staticmethod
+    def _stored_response(stored: dict, not_modified: requests.Response):
+        """
+        Build the response for a 304 (Not Modified) from the stored body.
+
+        :param stored: the stored response (see SQLiteHTTPCache.get).
+        :param not_modified: the 304 response received.
+        :return: a requests.Response with status 200.
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.elapsed = not_modified.elapsed
+        response.headers = CaseInsensitiveDict(stored['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = stored['body']  # pylint: disable=W0212
+        return response
+
+    def get(self, url: str, **kwargs):
+        """
+        Shortcut to send a GET request.
+
+        :param url: the full url to connect to.
+        :return: the requests.Response object.
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        """
+        Shortcut to send a POST request.
+
+        :param url: the full url to connect to.
+        :return: the requests.Response object.
+        """
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """
+        Close the session and every pooled connection.
+
+        :return: nothing.
+        """
+        if self.session is not None:
+            self.session.close()
+
+
+_DEFAULT_TRANSPORT: typing.Optional[BluelivTransport] = None
+_DEFAULT_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_default_transport():
+    """
+    Retrieve the module transport shared by all request instances that did
+    not receive an explicit one. It is created on first use.
+
+    :return: the shared BluelivTransport.
+    """
+    global _DEFAULT_TRANSPORT  # pylint: disable=global-statement
+
+    if _DEFAULT_TRANSPORT is None:
+        with _DEFAULT_TRANSPORT_LOCK:
+            if _DEFAULT_TRANSPORT is None:
+                _DEFAULT_TRANSPORT = BluelivTransport()
+    return _DEFAULT_TRANSPORT
+
+
+def set_default_transport(transport: BluelivTransport):
+    """
+    Replace the shared module transport (for example, to configure a bigger
+    pool size). Instances created before keep the previous one.
+
+    :param transport: the new BluelivTransport to share.
+    :return: the previous shared transport (or None).
+    """
+    global _DEFAULT_TRANSPORT  # pylint: disable=global-statement
+
+    with _DEFAULT_TRANSPORT_LOCK:
+        previous = _DEFAULT_TRANSPORT
+        _DEFAULT_TRANSPORT = transport
+    return previous
@@ -2,6 +2,7 @@
 Module to get information about users, including self.
 
 """
+import functools
 import typing
 
 from .configuration import (  # pylint: disable=E0401
@@ -9,6 +10,8 @@ from .configuration import (  # pylint: disable=E0401
 )
 
 from .core import BASEModel, BluelivRequest  # pylint: disable=E0401
+from .iocs import BluelivIOC
+from .sparks import Spark
 
 
 class BluelivUser(BASEModel):  # pylint: disable=too-few-public-methods
@@ -16,31 +19,28 @@ class BluelivUser(BASEModel):  # pylint: disable=too-few-public-methods
     Model to store User details.
 
     """
-    user_id = None
-    username = None
-    first_name = None
-    last_name = None
-    karma = None
-    badge = None
 
-    def __init__(self, **kwargs):
-        if 'user_id' in kwargs:
-            self.user_id = kwargs.get('user_id', None)
-
-        if 'username' in kwargs:
-            self.username = kwargs.get('username', None)
-
-        if 'first_name' in kwargs:
-            self.first_name = kwargs.get('first_name', None)
+    __slots__ = ('user_id', 'username', 'first_name', 'last_name', 'karma',
+                 'badge')
 
-        if 'last_name' in kwargs:
-            self.last_name = kwargs.get('last_name', None)
+    _api_fields = (('id', 'user_id'), ('username', 'username'),
+                   ('first_name', 'first_name'), ('last_name', 'last_name'),
+                   ('karma', 'karma'), ('badge', 'badge'))
 
-        if 'karma' in kwargs:
-            self.karma = kwargs.get('karma', None)
+    user_id: typing.Optional[int]
+    username: typing.Optional[str]
+    first_name: typing.Optional[str]
+    last_name: typing.Optional[str]
+    karma: typing.Optional[int]
+    badge: typing.Optional[str]
 
-        if 'badge' in kwargs:
-            self.last_name = kwargs.get('badge', None)
+    def __init__(self, **kwargs):
+        self.user_id = kwargs.get('user_id', None)
+        self.username = kwargs.get('username', None)
+        self.first_name = kwargs.get('first_name', None)
+        self.last_name = kwargs.get('last_name', None)
+        self.karma = kwargs.get('karma', None)
+        self.badge = kwargs.get('badge', None)
 
         super().__init__()
 
@@ -90,26 +90,37 @@ class UsersRequest(BluelivRequest):
                          base_url=self._base_url,
                          category=self._category,
                          limit=self.limit,
-                         since_id=self.since_id)
+                         since_id=self.since_id,
+                         transport=kwargs.get('transport', None),
+                         mirror=kwargs.get('mirror', None))
 
-    def me(self):  # pylint: disable=invalid-name
+    def me(self, as_model: bool = False):  # pylint: disable=invalid-name
         """
         Me retrieve information about our own user. The name has a conflict
         with C0103-lint, so we put an exception for pylint and other linters.
 
-        :return: user details as JSON, dict or list.
+        :param as_model: if we want a BluelivUser model instead of JSON.
+        :return: user details as JSON, dict, list or a BluelivUser.
         """
         resource = '%s/me' % self._base_url
-        return self.request(resource=resource)
-
-    def list_sparks(self, username, limit=None, since_id=None):
+        return self.request(resource=resource,
+                            model=BluelivUser if as_model else None)
+
+    def list_sparks(self,  # pylint: disable=too-many-arguments
+                    username,
+                    limit=None,
+                    since_id=None,
+                    as_json: bool = False,
+                    as_model: bool = False):
         """
         List sparks associated with an username.
 
         :param username: the username to search associated sparks.
         :param limit: the maximum number of items we want to retrieve.
         :param since_id: the reference id from we want to receive items.
-        :return: dict, list or JSON with the sparks.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param as_model: if we want Spark models instead of dicts (True).
+        :return: dict, list, JSON or Spark models with the sparks.
 
         """
         params = {}
@@ -124,16 +135,47 @@ class UsersRequest(BluelivRequest):
             params['limit'] = limit
 
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            model=Spark if as_model else None)
+
+    def iter_sparks(self, username,
+                    limit=None,
+                    since_id=None,
+                    prefetch: bool = True):
+        """
+        Iterate over the sparks associated with the user one at a time,
+        following the since_id cursor page after page (see blueliv.pagination).
+
+        :param username: the username.
+        :param limit: the page size.
+        :param since_id: the reference id from we want to receive items.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of sparks (dicts).
 
-    def list_iocs(self, username, limit=None, since_id=None):
+        """
+        return self._iter_pages(functools.partial(self.list_sparks,
+                                                  username,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
+
+    def list_iocs(self,  # pylint: disable=too-many-arguments
+                  username,
+                  limit=None,
+                  since_id=None,
+                  as_json: bool = False,
+                  as_model: bool = False):
         """
         List IoCs associated with the user by username.
 
         :param username: the username.
         :param limit: the maximum number of items we want to retrieve.
         :param since_id: the reference id from we want to receive items.
-        :return: dict, list or JSON with the IoCs.
+        :param as_json: if we want to receive the response as JSON (True).
+        :param as_model: if we want BluelivIOC models instead of dicts (True).
+        :return: dict, list, JSON or BluelivIOC models with the IoCs.
 
         """
         params = {}
@@ -148,4 +190,28 @@ class UsersRequest(BluelivRequest):
             params['limit'] = limit
 
         return self.request(resource=resource_url,
-                            params=params)
+                            params=params,
+                            as_json=as_json,
+                            model=BluelivIOC if as_model else None)
+
+    def iter_iocs(self, username,
+                  limit=None,
+                  since_id=None,
+                  prefetch: bool = True):
+        """
+        Iterate over the IoCs associated with the user one at a time, following
+        the since_id cursor page after page (see blueliv.pagination).
+
+        :param username: the username.
+        :param limit: the page size.
+        :param since_id: the reference id from we want to receive items.
+        :param prefetch: request the next page while the current is consumed.
+        :return: a generator of IoCs (dicts).
+
+        """
+        return self._iter_pages(functools.partial(self.list_iocs,
+                                                  username,
+                                                  as_json=True),
+                                limit=limit,
+                                since_id=since_id,
+                                prefetch=prefetch)
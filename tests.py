@@ -8,8 +8,19 @@ The following tests are divided in tests cases per contexts:
     RemoteEndpoint: test to verify the API url is alive.
 
 """
+import asyncio
+import email
+import hashlib
+import io
+import json
+import logging
 import os
+import re
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
 try:
     import requests
@@ -38,11 +49,34 @@ from blueliv.configuration import (  # pylint: disable=E0401, E0611
 )
 from blueliv.core import BASEModel, BASERequestModel, BluelivRequest  # pylint: disable=E0401, E0611
 from blueliv.crawl import CrawlerRequest  # pylint: disable=E0401, E0611
-from blueliv.iocs import BluelivIOC, IocsRequest  # pylint: disable=E0401, E0611
+from blueliv.iocs import BluelivIOC, IocBatch, IocsRequest  # pylint: disable=E0401, E0611
 from blueliv.malwares import BluelivMalware, MalwaresRequest  # pylint: disable=E0401, E0611
 from blueliv.sparks import Spark, SparksRequest  # pylint: disable=E0401, E0611
 from blueliv.tags import Tag, TagsRequest  # pylint: disable=E0401, E0611
 from blueliv.users import BluelivUser, UsersRequest  # pylint: disable=E0401, E0611
+from blueliv.transport import BluelivTransport, get_default_transport  # pylint: disable=E0401, E0611
+from blueliv import aio  # pylint: disable=E0401, E0611
+from blueliv.aio import AsyncBluelivTransport, AsyncCrawlerRequest, AsyncResponse, AsyncSparksRequest  # pylint: disable=E0401, E0611
+from blueliv.fanout import bounded_map  # pylint: disable=E0401, E0611
+from blueliv.pagination import iter_pages, next_cursor  # pylint: disable=E0401, E0611
+from blueliv.cache import ResponseCache, SQLiteHTTPCache  # pylint: disable=E0401, E0611
+from blueliv.retry import RetryPolicy, parse_retry_after  # pylint: disable=E0401, E0611
+from blueliv.streaming import JSONItemParser, iter_items  # pylint: disable=E0401, E0611
+from blueliv.matching import IocMatcher  # pylint: disable=E0401, E0611
+from blueliv.scanner import IocScanner  # pylint: disable=E0401, E0611
+from blueliv.sync import FeedSync, FileCheckpointStore, SQLiteCheckpointStore  # pylint: disable=E0401, E0611
+from blueliv import ingest  # pylint: disable=E0401, E0611
+from blueliv.ingest import UploadLedger, hash_file, hash_files  # pylint: disable=E0401, E0611
+from blueliv.multipart import MultipartFile  # pylint: disable=E0401, E0611
+from blueliv.hooks import register_hook, unregister_hook  # pylint: disable=E0401, E0611
+from blueliv.logs import StructuredLogger, configure_logging, log  # pylint: disable=E0401, E0611
+from blueliv.metrics import Histogram, MetricsRegistry  # pylint: disable=E0401, E0611
+from blueliv.mirror import MirrorStore  # pylint: disable=E0401, E0611
+from blueliv.codec import JSONCodec, get_codec, set_codec  # pylint: disable=E0401, E0611
+from benchmarks.api_stub import ApiStubServer  # pylint: disable=E0401, E0611
+from blueliv.ratelimit import (  # pylint: disable=E0401, E0611
+    FileTokenBucket, RateLimiter, TokenBucket, set_rate_limiter
+)
 
 
 class EnvironmentTests(unittest.TestCase):
@@ -201,6 +235,1858 @@ class ModelsTests(unittest.TestCase):
         users_request_model = UsersRequest(token='testing-token')
         self.assertNotEqual(users_request_model, None)
 
+    def test_models_from_dict(self):
+        """
+        Models are built from API items, keep no __dict__ and do not share
+        mutable defaults.
+
+        :return:  nothing as is a test case.
+
+        """
+        first, second = Spark(), Spark()
+        first.source_url.append('https://example.com')
+        self.assertEqual(second.source_url, [])
+        self.assertFalse(hasattr(first, '__dict__'))
+
+        item = {'id': 7, 'spark_id': 3, 'content': 'example.com',
+                'type': 'DOMAIN', 'subtype': None, 'created_at': None,
+                'unknown': True}
+        iocs = BluelivIOC.from_list([item, item, None])
+        self.assertEqual(len(iocs), 2)
+        self.assertEqual((iocs[0].ioc_id, iocs[0].ioc_type), (7, 'DOMAIN'))
+        self.assertNotIn('unknown', iocs[0].to_dict())
+
+        user = BluelivUser.from_dict({'username': 'analyst', 'badge': 'gold'})
+        self.assertEqual((user.badge, user.last_name), ('gold', None))
+
+    def test_ioc_batch(self):
+        """
+        IocBatch stores IoCs column-wise, filters them by type and time and
+        slices them without copying.
+
+        :return:  nothing as is a test case.
+
+        """
+        types = ('DOMAIN', 'HASH', 'IPv4')
+        batch = IocBatch.from_list(
+            {'id': ioc_id, 'spark_id': ioc_id // 2,
+             'content': 'example-%d.com' % (ioc_id % 2),
+             'type': types[ioc_id % 3],
+             'created_at': '2020-11-%02dT10:00:00Z' % (ioc_id + 1)}
+            for ioc_id in range(10))
+
+        self.assertEqual(len(batch), 10)
+        self.assertEqual(batch.ids.format, 'q')
+        self.assertEqual(list(batch.filter_types('DOMAIN').ids), [0, 3, 6, 9])
+        self.assertEqual(
+            list(batch.filter_time(since='2020-11-03T00:00:00Z',
+                                   until='2020-11-05T00:00:00Z').ids), [2, 3])
+
+        view = batch[2:5]
+        self.assertIs(view.ids.obj, batch.ids.obj)
+        self.assertEqual(list(view.ids), [2, 3, 4])
+        self.assertEqual(view[-1].content, 'example-0.com')
+        self.assertEqual(view[0].to_dict()['created_at'],
+                         '2020-11-03T10:00:00Z')
+        with self.assertRaises(Exception):
+            view.append({'id': 11})
+
+    @responses.activate
+    def test_request_models(self):
+        """
+        Request methods return models with as_model=True.
+
+        :return:  nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s%s' % (BASE_API_URL, BASE_SPARKS_URL,
+                                  BASE_SPARKS_TIMELINE_URL),
+                      json={'data': [{'id': 1, 'title': 'first'}]})
+        responses.add(responses.GET, '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                      json=[{'slug': 'mafia', 'sparks_count': 2}])
+
+        sparks = SparksRequest(token='testing-token').timeline(as_model=True)
+        self.assertIsInstance(sparks[0], Spark)
+        self.assertEqual(sparks[0].title, 'first')
+
+        tags = TagsRequest(token='testing-token').list(as_model=True)
+        self.assertEqual((tags[0].slug, tags[0].sparks_count), ('mafia', 2))
+
+    @responses.activate
+    def test_single_item_models(self):
+        """
+        The single item calls and the lists of a tag, a user or a spark
+        return models with as_model=True as well.
+
+        :return:  nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s/1' % (BASE_API_URL, BASE_SPARKS_URL),
+                      json={'id': 1, 'title': 'first'})
+        responses.add(responses.GET,
+                      '%s%s/me' % (BASE_API_URL, BASE_USERS_URL),
+                      json={'id': 3, 'username': 'analyst'})
+        responses.add(responses.GET,
+                      '%s%s/abc' % (BASE_API_URL, BASE_MALWARES_URL),
+                      json={'id': 'abc', 'malicious': True})
+        for url in ('%s%s/mafia%s' % (BASE_API_URL, BASE_TAGS_URL,
+                                      BASE_TAGS_IOCS_URL),
+                    '%s%s/analyst%s' % (BASE_API_URL, BASE_USERS_URL,
+                                        BASE_USERS_IOCS_URL),
+                    '%s%s/1%s' % (BASE_API_URL, BASE_SPARKS_URL,
+                                  BASE_SPARKS_IOCS_URL)):
+            responses.add(responses.GET, url,
+                          json=[{'id': 10, 'content': 'evil.example.com'}])
+        responses.add(responses.GET,
+                      '%s%s/analyst%s' % (BASE_API_URL, BASE_USERS_URL,
+                                          BASE_USERS_SPARKS_URL),
+                      json=[{'id': 1, 'title': 'first'}])
+        responses.add(responses.GET,
+                      '%s%s/mafia%s' % (BASE_API_URL, BASE_TAGS_URL,
+                                        BASE_TAGS_SPARKS_URL),
+                      json=[{'id': 1, 'title': 'first'}])
+
+        sparks = SparksRequest(token='testing-token')
+        users = UsersRequest(token='testing-token')
+        tags = TagsRequest(token='testing-token')
+        self.assertEqual(sparks.get('1', as_model=True).title, 'first')
+        self.assertEqual(users.me(as_model=True).username, 'analyst')
+        self.assertTrue(MalwaresRequest(token='testing-token').show(
+            'abc', as_model=True).malicious)
+        for page in (tags.list_iocs('mafia', as_model=True),
+                     users.list_iocs('analyst', as_model=True),
+                     sparks.iocs(1, as_model=True)):
+            self.assertIsInstance(page[0], BluelivIOC)
+            self.assertEqual(page[0].content, 'evil.example.com')
+        for page in (tags.list_sparks('mafia', as_model=True),
+                     users.list_sparks('analyst', as_model=True)):
+            self.assertIsInstance(page[0], Spark)
+
+
+class TransportTests(unittest.TestCase):
+    """
+    Tests oriented to verify the pooled transport shared by request classes.
+
+    """
+    def test_default_transport_is_shared(self):
+        """
+        Every request instance without an explicit transport shares the
+        default one (and its pooled session).
+
+        :return: nothing as is a test case.
+
+        """
+        sparks = SparksRequest(token='testing-token')
+        iocs = IocsRequest(token='testing-token')
+        self.assertIs(sparks.get_transport(), get_default_transport())
+        self.assertIs(sparks.get_transport(), iocs.get_transport())
+
+        transport = BluelivTransport(pool_maxsize=32)
+        tags = TagsRequest(token='testing-token', transport=transport)
+        self.assertIs(tags.get_transport(), transport)
+        adapter = transport.session.get_adapter(BASE_API_URL)
+        self.assertEqual(adapter._pool_maxsize, 32)  # pylint: disable=W0212
+
+    @responses.activate
+    def test_request_uses_transport(self):
+        """
+        Requests are sent through the pooled session of the transport.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                      json=[{'slug': 'mafia'}],
+                      status=200)
+        transport = BluelivTransport()
+        tags = TagsRequest(token='testing-token', transport=transport)
+        self.assertEqual(tags.list(), '[{"slug": "mafia"}]')
+        self.assertEqual(responses.calls[0].request.headers['Authorization'],
+                         'Token testing-token')
+
+    @responses.activate
+    def test_identical_requests_are_coalesced(self):
+        """
+        Identical GET requests in flight at the same time share one call,
+        but not those of another token.
+
+        :return: nothing as is a test case.
+
+        """
+        def spark_callback(request):
+            time.sleep(0.2)
+            return 200, {}, json.dumps({'id': 42})
+
+        responses.add_callback(responses.GET,
+                               '%s%s/42' % (BASE_API_URL, BASE_SPARKS_URL),
+                               callback=spark_callback,
+                               content_type='application/json')
+        metrics = MetricsRegistry()
+        transport = BluelivTransport(metrics=metrics)
+        clients = [SparksRequest(token='testing-token', transport=transport)
+                   for _ in range(6)]
+        clients.append(SparksRequest(token='other-token',
+                                     transport=transport))
+        barrier = threading.Barrier(len(clients))
+        results = []
+
+        def get_spark(sparks):
+            barrier.wait()
+            results.append(sparks.get('42'))
+
+        threads = [threading.Thread(target=get_spark, args=(sparks,))
+                   for sparks in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['{"id": 42}'] * 7)
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(transport.stats()['coalesced'], 5)
+        snapshot = metrics.snapshot()['sparks']
+        self.assertEqual(snapshot['calls'], 2)
+        self.assertEqual(snapshot['counters']['coalesced'], 5)
+
+    def test_async_requests_are_coalesced(self):
+        """
+        The asyncio transport coalesces identical GET requests as well.
+
+        :return: nothing as is a test case.
+
+        """
+        if aio.aiohttp is None:
+            self.skipTest('aiohttp is not installed')
+
+        transport = AsyncBluelivTransport()
+        sent = []
+
+        async def fake_request(method, url, key, rate_limiter=None,
+                               **kwargs):
+            sent.append(url)
+            await asyncio.sleep(0.05)
+            return AsyncResponse(200, b'{"id": 42}')
+
+        transport._request = fake_request  # pylint: disable=W0212
+
+        async def run():
+            return await asyncio.gather(*[
+                transport.request('GET', 'https://example.com/sparks/42')
+                for _ in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual([result.content for result in results],
+                         [b'{"id": 42}'] * 5)
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(transport.stats()['coalesced'], 4)
+
+    def test_async_leader_cancelled(self):
+        """
+        Cancelling the first of the coalesced requests does not cancel the
+        others waiting for the same response.
+
+        :return: nothing as is a test case.
+
+        """
+        if aio.aiohttp is None:
+            self.skipTest('aiohttp is not installed')
+
+        transport = AsyncBluelivTransport()
+        sent = []
+
+        async def fake_request(method, url, key, rate_limiter=None,
+                               **kwargs):
+            sent.append(url)
+            await asyncio.sleep(0.05)
+            return AsyncResponse(200, b'{"id": 42}')
+
+        transport._request = fake_request  # pylint: disable=W0212
+
+        async def run():
+            url = 'https://example.com/sparks/42'
+            leader = asyncio.ensure_future(transport.request('GET', url))
+            await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(transport.request('GET', url))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            result = await follower
+            return leader.cancelled(), result.content
+
+        self.assertEqual(asyncio.run(run()), (True, b'{"id": 42}'))
+        self.assertEqual(len(sent), 1)
+
+
+class PaginationTests(unittest.TestCase):
+    """
+    Tests oriented to verify the iter_* methods follow the since_id cursor.
+
+    """
+    @responses.activate
+    def test_iter_timeline(self):
+        """
+        iter_timeline yields every item of every page and stops on the
+        first short page.
+
+        :return: nothing as is a test case.
+
+        """
+        def timeline_callback(request):
+            since_id = int(request.params.get('since_id', 0))
+            items = [{'id': item_id}
+                     for item_id in range(since_id + 1, min(since_id + 3, 6))]
+            return 200, {}, json.dumps(items)
+
+        responses.add_callback(responses.GET,
+                               '%s%s%s' % (BASE_API_URL,
+                                           BASE_SPARKS_URL,
+                                           BASE_SPARKS_TIMELINE_URL),
+                               callback=timeline_callback,
+                               content_type='application/json')
+
+        sparks = SparksRequest(token='testing-token')
+        for prefetch in (True, False):
+            items = list(sparks.iter_timeline(limit=2, prefetch=prefetch))
+            self.assertEqual([item['id'] for item in items], [1, 2, 3, 4, 5])
+
+        self.assertEqual(len(responses.calls), 6)
+
+    def test_string_since_id(self):
+        """
+        A numeric since_id given as a string is compared with the integer
+        ids of the items.
+
+        :return: nothing as is a test case.
+
+        """
+        self.assertEqual(next_cursor([{'id': 5}, {'id': 4}], '3'), 5)
+        self.assertIsNone(next_cursor([{'id': 5}], '12'))
+        self.assertEqual(next_cursor([{'id': '10'}, {'id': '9'}], 3), 10)
+
+        def fetch(limit, since_id):
+            since_id = int(since_id or 0)
+            return [{'id': item_id}
+                    for item_id in range(since_id + 1, min(since_id + 3, 8))]
+
+        items = list(iter_pages(fetch, limit=2, since_id='3'))
+        self.assertEqual([item['id'] for item in items], [4, 5, 6, 7])
+
+    def test_iter_pages_close_waits(self):
+        """
+        Closing the generator waits for the prefetch in flight: no page is
+        fetched after close returns.
+
+        :return: nothing as is a test case.
+
+        """
+        fetched = []
+
+        def fetch(limit, since_id):
+            if since_id:
+                time.sleep(0.1)
+            fetched.append(since_id)
+            since_id = since_id or 0
+            return [{'id': since_id + 1}, {'id': since_id + 2}]
+
+        items = iter_pages(fetch, limit=2)
+        next(items)
+        items.close()
+        self.assertEqual(fetched, [None, 2])
+
+    @responses.activate
+    def test_iter_malwares_list(self):
+        """
+        iter_list yields the items of concurrent pages in order, and stops on
+        the first short page.
+
+        :return: nothing as is a test case.
+
+        """
+        def list_callback(request):
+            page = int(request.params['page'])
+            size = 2 if page < 4 else 1
+            items = [{'id': page * 10 + index} for index in range(size)]
+            return 200, {}, json.dumps(items)
+
+        responses.add_callback(responses.GET,
+                               '%s%s' % (BASE_API_URL, BASE_MALWARES_URL),
+                               callback=list_callback,
+                               content_type='application/json')
+
+        malwares = MalwaresRequest(token='testing-token')
+        items = list(malwares.iter_list(page_size=2, workers=3))
+        self.assertEqual([item['id'] for item in items],
+                         [10, 11, 20, 21, 30, 31, 40])
+
+    def test_bounded_map_reports_errors(self):
+        """
+        A failing call is reported for its argument and the others go on.
+
+        :return: nothing as is a test case.
+
+        """
+        def invert(value):
+            return 1 / value
+
+        results = list(bounded_map(invert, [1, 0, 2], workers=2))
+        self.assertEqual([argument for argument, _, _ in results], [1, 0, 2])
+        self.assertEqual(results[0][1], 1)
+        self.assertIsInstance(results[1][2], ZeroDivisionError)
+        self.assertEqual(results[2][1], 0.5)
+
+    def test_bounded_map_close_waits(self):
+        """
+        Closing the generator cancels the calls not started and waits for
+        the running ones: nothing completes after close returns.
+
+        :return: nothing as is a test case.
+
+        """
+        completed = []
+
+        def slow(value):
+            time.sleep(0.05 if value else 0)
+            completed.append(value)
+            return value
+
+        results = bounded_map(slow, range(100), workers=4)
+        next(results)
+        results.close()
+        finished = len(completed)
+        time.sleep(0.15)
+        self.assertEqual(len(completed), finished)
+        self.assertLessEqual(finished, 5)
+
+    @responses.activate
+    def test_iocs_many(self):
+        """
+        iocs_many requests the IoCs of several sparks at the same time and
+        reports a failed one without stopping the others.
+
+        :return: nothing as is a test case.
+
+        """
+        in_flight = [0, 0]
+        lock = threading.Lock()
+
+        def iocs_callback(request):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            spark_id = request.url.split('/')[-2]
+            if spark_id == '3':
+                return 404, {}, 'Not found'
+            return 200, {}, json.dumps([{'spark_id': spark_id}])
+
+        responses.add_callback(responses.GET,
+                               re.compile('%s%s/[0-9]+%s' % (
+                                   BASE_API_URL, BASE_SPARKS_URL,
+                                   BASE_SPARKS_IOCS_URL)),
+                               callback=iocs_callback,
+                               content_type='application/json')
+        sparks = SparksRequest(token='testing-token')
+        results = list(sparks.iocs_many([1, 2, 3, 2, 4], workers=4,
+                                        ordered=True, as_json=True))
+
+        self.assertEqual([result.spark_id for result in results],
+                         [1, 2, 3, 4])
+        self.assertEqual(results[1].result, [{'spark_id': '2'}])
+        self.assertIsInstance(results[2].error, Exception)
+        self.assertEqual(len(responses.calls), 4)
+        self.assertGreater(in_flight[1], 1)
+
+
+class FakeAsyncTransport:  # pylint: disable=too-few-public-methods
+    """
+    An asyncio transport that records the calls and answers with a fixed
+    JSON document, so the asyncio clients can be tested without network.
+
+    """
+    def __init__(self, body: bytes = b'[{"id": 1}]'):
+        self.body = body
+        self.calls = []
+
+    async def request(self, method, url, **kwargs):
+        """
+        Record the call and return the fixed response.
+
+        :return: an AsyncResponse.
+        """
+        self.calls.append((method, url, kwargs))
+        await asyncio.sleep(0)
+        return AsyncResponse(200, self.body)
+
+
+class AsyncTests(unittest.TestCase):
+    """
+    Tests oriented to verify the asyncio clients mirror the blocking ones.
+
+    """
+    def test_async_sparks_request(self):
+        """
+        Methods of the asyncio clients are coroutines that build the same
+        requests as the blocking ones.
+
+        :return: nothing as is a test case.
+
+        """
+        transport = FakeAsyncTransport()
+        sparks = AsyncSparksRequest(token='testing-token', transport=transport)
+
+        async def run():
+            return await asyncio.gather(sparks.timeline(limit=5, since_id=10),
+                                        sparks.get('1234'))
+
+        timeline, spark = asyncio.run(run())
+        self.assertEqual(timeline, '[{"id": 1}]')
+        self.assertEqual(spark, '[{"id": 1}]')
+
+        method, url, kwargs = transport.calls[0]
+        self.assertEqual(method, 'GET')
+        self.assertEqual(url, '%s%s%s' % (BASE_API_URL,
+                                          BASE_SPARKS_URL,
+                                          BASE_SPARKS_TIMELINE_URL))
+        self.assertEqual(kwargs['params'], {'since_id': 10, 'limit': 5})
+        self.assertEqual(kwargs['headers']['Authorization'],
+                         'Token testing-token')
+        self.assertTrue(transport.calls[1][1].endswith('/sparks/1234'))
+
+
+class CacheTests(unittest.TestCase):
+    """
+    Tests oriented to verify the response cache of the transport.
+
+    """
+    @responses.activate
+    def test_cached_requests(self):
+        """
+        Repeated GET requests are served from the cache until invalidated,
+        and endpoints with a ttl of 0 are never cached.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                      json=[{'slug': 'mafia'}])
+        responses.add(responses.GET,
+                      '%s%s' % (BASE_API_URL, BASE_IOCS_TYPES_URL),
+                      json=[{'type': 'HASH'}])
+
+        cache = ResponseCache(ttls={BASE_IOCS_TYPES_URL: 0})
+        transport = BluelivTransport(cache=cache)
+        tags = TagsRequest(token='testing-token', transport=transport)
+        iocs = IocsRequest(token='testing-token', transport=transport)
+
+        self.assertEqual(tags.list(), tags.list())
+        self.assertEqual(len(responses.calls), 1)
+
+        iocs.types()
+        iocs.types()
+        self.assertEqual(len(responses.calls), 3)
+
+        self.assertEqual(cache.invalidate(BASE_TAGS_URL), 1)
+        tags.list()
+        self.assertEqual(len(responses.calls), 4)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_lru_eviction(self):
+        """
+        When full, the least recently used entry is evicted.
+
+        :return: nothing as is a test case.
+
+        """
+        cache = ResponseCache(maxsize=2)
+        keys = [('GET', '%s/sparks/%d' % (BASE_API_URL, index), (), ())
+                for index in range(3)]
+        cache.set(keys[0], 'first')
+        cache.set(keys[1], 'second')
+        self.assertEqual(cache.get(keys[0]), 'first')
+        cache.set(keys[2], 'third')
+
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[0]), 'first')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    @responses.activate
+    def test_http_cache_revalidation(self):
+        """
+        A new transport (as after a restart) sends a conditional request and
+        serves the stored body on 304.
+
+        :return: nothing as is a test case.
+
+        """
+        def spark_callback(request):
+            if request.headers.get('If-None-Match') == '"v1"':
+                return 304, {'ETag': '"v1"'}, ''
+            return 200, {'ETag': '"v1"'}, '{"id": 1234}'
+
+        responses.add_callback(responses.GET,
+                               '%s%s/1234' % (BASE_API_URL, BASE_SPARKS_URL),
+                               callback=spark_callback,
+                               content_type='application/json')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'http-cache.db')
+            for _ in range(2):
+                http_cache = SQLiteHTTPCache(path)
+                transport = BluelivTransport(http_cache=http_cache)
+                sparks = SparksRequest(token='testing-token',
+                                       transport=transport)
+                self.assertEqual(sparks.get('1234'), '{"id": 1234}')
+                http_cache.close()
+
+            self.assertEqual(http_cache.hits, 1)
+            first, second = (call.request for call in responses.calls)
+            self.assertNotIn('If-None-Match', first.headers)
+            self.assertEqual(second.headers['If-None-Match'], '"v1"')
+
+    def test_http_cache_path_default(self):
+        """
+        BLUELIV_API_HTTP_CACHE_PATH enables the HTTP cache of the blocking
+        and asyncio transports alike.
+
+        :return: nothing as is a test case.
+
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'http.db')
+            with mock.patch('blueliv.transport.HTTP_CACHE_PATH', path), \
+                    mock.patch('blueliv.aio.HTTP_CACHE_PATH', path):
+                transports = [BluelivTransport()]
+                if aio.aiohttp is not None:
+                    transports.append(AsyncBluelivTransport())
+            for transport in transports:
+                self.assertIsInstance(transport.http_cache, SQLiteHTTPCache)
+                self.assertEqual(transport.http_cache.path, path)
+                transport.http_cache.close()
+
+
+class RetryTests(unittest.TestCase):
+    """
+    Tests oriented to verify failed requests are retried by the transport.
+
+    """
+    @responses.activate
+    def test_retry_then_success(self):
+        """
+        A 503 and a 429 are retried (honoring Retry-After) and counted in the
+        stats, until a 200 arrives.
+
+        :return: nothing as is a test case.
+
+        """
+        url = '%s%s' % (BASE_API_URL, BASE_TAGS_URL)
+        responses.add(responses.GET, url, status=503)
+        responses.add(responses.GET, url, status=429,
+                      headers={'Retry-After': '0'})
+        responses.add(responses.GET, url, json=[{'slug': 'mafia'}])
+
+        transport = BluelivTransport(retry=RetryPolicy(backoff_factor=0))
+        tags = TagsRequest(token='testing-token', transport=transport)
+        self.assertEqual(tags.list(), '[{"slug": "mafia"}]')
+
+        stats = tags.get_stats()
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['attempts'], 3)
+        self.assertEqual(stats['retries'], 2)
+
+    @responses.activate
+    def test_retry_budget_and_methods(self):
+        """
+        A Retry-After beyond the budget gives up at once, and POST requests
+        are never retried.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET, '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                      status=503, headers={'Retry-After': '120'})
+        responses.add(responses.POST, '%s%s' % (BASE_API_URL, BASE_CRAWL_URL),
+                      status=503)
+
+        transport = BluelivTransport(retry=RetryPolicy(budget=10))
+        tags = TagsRequest(token='testing-token', transport=transport)
+        crawler = CrawlerRequest(token='testing-token', transport=transport)
+        self.assertRaises(Exception, tags.list)
+        self.assertRaises(Exception, crawler.crawl, term='http://example.com')
+
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(transport.stats()['retry_giveups'], 1)
+
+    def test_parse_retry_after(self):
+        """
+        Retry-After may be seconds or an HTTP date.
+
+        :return: nothing as is a test case.
+
+        """
+        self.assertEqual(parse_retry_after('5'), 5.0)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+
+class RateLimitTests(unittest.TestCase):
+    """
+    Tests oriented to verify the client-side rate limiter.
+
+    """
+    def test_token_bucket(self):
+        """
+        A bucket allows a burst and then makes callers wait, in memory or
+        shared through a file.
+
+        :return: nothing as is a test case.
+
+        """
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertTrue(0.05 < bucket.reserve() <= 0.1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'iocs.bucket')
+            first = FileTokenBucket(path, rate=10, burst=1)
+            second = FileTokenBucket(path, rate=10, burst=1)
+            self.assertEqual(first.reserve(), 0)
+            self.assertTrue(0.05 < second.reserve() <= 0.1)
+
+    @responses.activate
+    def test_shared_family_budget(self):
+        """
+        All instances using a token share its limiter, and each family has
+        its own budget.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET, '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                      json=[{'slug': 'mafia'}])
+        responses.add(responses.GET,
+                      '%s%s' % (BASE_API_URL, BASE_IOCS_TYPES_URL),
+                      json=[{'type': 'HASH'}])
+
+        limiter = RateLimiter(budgets={'tags': (20, 1)})
+        set_rate_limiter('rate-limited-token', limiter)
+        try:
+            transport = BluelivTransport()
+            tags = TagsRequest(token='rate-limited-token',
+                               transport=transport)
+            other_tags = TagsRequest(token='rate-limited-token',
+                                     transport=transport)
+            iocs = IocsRequest(token='rate-limited-token',
+                               transport=transport)
+            tags.list()
+            other_tags.list()
+            iocs.types()
+            iocs.types()
+            self.assertEqual(transport.stats()['rate_limited'], 1)
+        finally:
+            set_rate_limiter('rate-limited-token', None)
+
+    def test_async_file_buckets_off_the_loop(self):
+        """
+        The asyncio transport takes the tokens of file buckets in a thread,
+        not in the event loop.
+
+        :return: nothing as is a test case.
+
+        """
+        if aio.aiohttp is None:
+            self.skipTest('aiohttp is not installed')
+
+        threads = []
+        reserve = FileTokenBucket.reserve
+
+        def recorded_reserve(bucket, tokens=1.0):
+            threads.append(threading.current_thread())
+            return reserve(bucket, tokens)
+
+        async def fetch(url, limiter):
+            transport = AsyncBluelivTransport(metrics=None)
+            async with transport:
+                response = await transport.request('GET', url,
+                                                   rate_limiter=limiter)
+            return response.status_code
+
+        with tempfile.TemporaryDirectory() as directory, \
+                ApiStubServer(items=1) as server, \
+                mock.patch.object(FileTokenBucket, 'reserve',
+                                  recorded_reserve):
+            limiter = RateLimiter(rate=100, directory=directory)
+            self.assertEqual(asyncio.run(fetch(server.api_url + '/tags',
+                                               limiter)), 200)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+
+class ResponseFormatTests(unittest.TestCase):
+    """
+    Tests oriented to verify how response bodies are returned.
+
+    """
+    @responses.activate
+    def test_raw_and_text_responses(self):
+        """
+        Bodies are returned untouched (raw), as received (text) or decoded
+        (as_json), and empty documents are None.
+
+        :return: nothing as is a test case.
+
+        """
+        url = '%s%s' % (BASE_API_URL, BASE_TAGS_URL)
+        responses.add(responses.GET, url, body=b'[{"slug":"mafia"}]',
+                      content_type='application/json')
+        responses.add(responses.GET, '%s/empty' % url, body=b' [ ] ',
+                      content_type='application/json')
+
+        tags = TagsRequest(token='testing-token')
+        self.assertEqual(tags.request(resource=BASE_TAGS_URL, raw=True),
+                         b'[{"slug":"mafia"}]')
+        self.assertEqual(tags.list(), '[{"slug":"mafia"}]')
+        self.assertEqual(tags.request(resource=BASE_TAGS_URL, as_json=True),
+                         [{'slug': 'mafia'}])
+        self.assertIsNone(tags.request(resource='%s/empty' % BASE_TAGS_URL))
+
+    @responses.activate
+    def test_text_responses_are_utf8(self):
+        """
+        Text responses are the server document decoded as UTF-8, whatever
+        the charset guessed from the headers, not json.dumps output.
+
+        :return: nothing as is a test case.
+
+        """
+        body = '[{"slug": "caf\u00e9", "name": "Caf\u00e9"}]'
+        for content_type in ('application/json', 'text/plain'):
+            responses.add(responses.GET,
+                          '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                          body=body.encode('utf-8'),
+                          content_type=content_type)
+            tags = TagsRequest(token='testing-token')
+            self.assertEqual(tags.list(), body)
+            self.assertNotEqual(tags.list(), json.dumps(json.loads(body)))
+            responses.reset()
+
+    @responses.activate
+    def test_pluggable_codec(self):
+        """
+        The JSON codec used to decode responses can be replaced.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET, '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                      json=[{'slug': 'mafia'}])
+        decoded = []
+
+        def loads(data):
+            decoded.append(data)
+            return json.loads(data)
+
+        previous = set_codec(JSONCodec('test', loads, json.dumps))
+        try:
+            tags = TagsRequest(token='testing-token')
+            tags.request(resource=BASE_TAGS_URL, as_json=True)
+            self.assertEqual(get_codec().name, 'test')
+            self.assertEqual(len(decoded), 1)
+        finally:
+            set_codec(previous)
+
+
+class StreamingTests(unittest.TestCase):
+    """
+    Tests oriented to verify the incremental parsing of feed pages.
+
+    """
+    def test_items_split_in_chunks(self):
+        """
+        Items are decoded as soon as they are complete, whatever the chunk
+        boundaries are, from a list or a dict holding it.
+
+        :return: nothing as is a test case.
+
+        """
+        items = [{'id': 1, 'title': 'caf\u00e9 "1"'}, 12, 1.5e3, None, 'x']
+        for document in (items, {'count': 5, 'meta': {'data': [0]},
+                                 'data': items, 'next': None}):
+            body = json.dumps(document, ensure_ascii=False).encode('utf-8')
+            for size in (1, 3, 64):
+                chunks = [body[i:i + size]
+                          for i in range(0, len(body), size)]
+                self.assertEqual(list(iter_items(chunks)), items)
+
+        parser = JSONItemParser()
+        self.assertEqual(parser.feed(b'[{"id": 1}, {"id"'), [{'id': 1}])
+        self.assertEqual(parser.feed(b': 2}, 3'), [{'id': 2}])
+        self.assertEqual(parser.feed(b'4]'), [34])
+        self.assertEqual(parser.close(), [])
+
+        with self.assertRaises(ValueError):
+            list(iter_items([b'[{"id": 1}, {"id"']))
+
+    @responses.activate
+    def test_stream_timeline(self):
+        """
+        timeline(stream=True) yields the decoded sparks, and errors are
+        raised before iterating.
+
+        :return: nothing as is a test case.
+
+        """
+        url = '%s%s%s' % (BASE_API_URL, BASE_SPARKS_URL,
+                          BASE_SPARKS_TIMELINE_URL)
+        responses.add(responses.GET, url, json=[{'id': 1}, {'id': 2}])
+        responses.add(responses.GET, url, status=401, body='unauthorized')
+
+        sparks = SparksRequest(token='testing-token')
+        self.assertEqual([item['id'] for item in sparks.timeline(stream=True)],
+                         [1, 2])
+        with self.assertRaises(Exception):
+            sparks.timeline(stream=True)
+
+
+class MatchingTests(unittest.TestCase):
+    """
+    Tests oriented to verify the local IoC match index.
+
+    """
+    @responses.activate
+    def test_match_many(self):
+        """
+        Values of every kind are matched against the IoCs synced from the
+        timeline, and new IoCs can be added afterwards.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s%s' % (BASE_API_URL, BASE_IOCS_URL,
+                                  BASE_IOCS_TIMELINE_URL),
+                      json=[{'id': 1, 'type': 'HASH',
+                             'content': 'D41D8CD98F00B204E9800998ECF8427E'},
+                            {'id': 2, 'type': 'IPv4',
+                             'content': '10.1.0.0/16'},
+                            {'id': 3, 'type': 'DOMAIN',
+                             'content': 'Evil.com'},
+                            {'id': 4, 'type': 'URL',
+                             'content': 'HTTP://bad.net:80/path/#top'}])
+
+        matcher = IocMatcher()
+        since_id = matcher.sync(IocsRequest(token='testing-token'))
+        self.assertEqual((since_id, len(matcher)), (4, 4))
+
+        values = ['d41d8cd98f00b204e9800998ecf8427e', '10.1.200.3',
+                  '10.2.0.1', 'mail.evil.com', 'notevil.com',
+                  'http://bad.net/path', 'https://www.evil.com/login']
+        matches = matcher.match_many(values)
+        self.assertEqual([match.ioc_id if match else None
+                          for match in matches], [1, 2, None, 3, None, 4, 3])
+        self.assertEqual(matches[3].value, 'mail.evil.com')
+
+        self.assertIsNone(matcher.match('10.2.0.1'))
+        matcher.add({'id': 5, 'type': 'IPv4', 'content': '10.2.0.1'})
+        self.assertEqual(matcher.match_many(['10.2.0.1'], kind='ipv4')[0]
+                         .ioc_id, 5)
+
+
+class ScannerTests(unittest.TestCase):
+    """
+    Tests oriented to verify the multi-pattern IoC scanner.
+
+    """
+    def test_scan_text_and_stream(self):
+        """
+        Every delimited occurrence is found, also across chunks, and new
+        patterns are used on the next scan.
+
+        :return: nothing as is a test case.
+
+        """
+        scanner = IocScanner([
+            {'id': 1, 'type': 'DOMAIN', 'content': 'evil.com'},
+            {'id': 2, 'type': 'URL', 'content': 'http://bad.net/x'},
+            {'id': 3, 'type': 'HASH', 'content': 'ab'}])
+        self.assertEqual(len(scanner), 2)
+
+        text = ('GET http://mail.EVIL.com/ notevil.com evil.com.au '
+                'http://bad.net/x http://bad.net/xy ab evil.com')
+        matches = scanner.scan(text)
+        self.assertEqual([match.ioc_id for match in matches], [1, 2, 1])
+        self.assertEqual(text[matches[0].start:matches[0].end], 'EVIL.com')
+
+        data = text.encode('utf-8')
+        chunks = [data[index:index + 3] for index in range(0, len(data), 3)]
+        self.assertEqual(list(scanner.scan_stream(chunks)), matches)
+
+        scanner.add({'id': 4, 'type': 'HOST', 'content': 'notevil.com'})
+        self.assertEqual([match.ioc_id for match in scanner.scan(text)],
+                         [1, 4, 2, 1])
+
+    def test_add_while_scanning(self):
+        """
+        Patterns added while other threads scan are found by the next scans,
+        and the scans running never fail.
+
+        :return: nothing as is a test case.
+
+        """
+        scanner = IocScanner([{'id': 0, 'type': 'DOMAIN',
+                               'content': 'host0.evil.com'}])
+        text = ' '.join('host%d.evil.com' % number for number in range(2000))
+        errors = []
+        done = threading.Event()
+
+        def scan():
+            try:
+                while not done.is_set():
+                    scanner.scan(text)
+            except Exception as exception:  # pylint: disable=broad-except
+                errors.append(exception)
+
+        threads = [threading.Thread(target=scan) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        try:
+            for number in range(1, 2000):
+                scanner.add({'id': number, 'type': 'DOMAIN',
+                             'content': 'host%d.evil.com' % number})
+                scanner.add({'id': -number, 'type': 'DOMAIN',
+                             'content': 'st%d.evil.com' % number})
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([match.ioc_id for match in scanner.scan(text)],
+                         list(range(2000)))
+        unbounded = IocScanner(boundaries=False)
+        for content in ('he', 'she', 'his', 'hers'):
+            unbounded.add({'id': content, 'type': 'URL', 'content': content})
+            unbounded.scan('ushers')
+        self.assertEqual([(match.start, match.ioc_id)
+                          for match in unbounded.scan('ushers')],
+                         [(1, 'she'), (2, 'he'), (2, 'hers')])
+
+
+class SyncTests(unittest.TestCase):
+    """
+    Tests oriented to verify the checkpointed feed sync.
+
+    """
+    @responses.activate
+    def test_resume_from_checkpoint(self):
+        """
+        A feed resumes from its checkpoint after a restart and a failed page
+        is requested again.
+
+        :return: nothing as is a test case.
+
+        """
+        published = [1, 2, 3, 4, 5]
+
+        def timeline_callback(request):
+            since_id = int(request.params.get('since_id', 0))
+            items = [{'id': item_id} for item_id in published
+                     if item_id > since_id][:2]
+            return 200, {}, json.dumps(items)
+
+        url = '%s%s%s' % (BASE_API_URL, BASE_SPARKS_URL,
+                          BASE_SPARKS_TIMELINE_URL)
+        responses.add_callback(responses.GET, url,
+                               callback=timeline_callback,
+                               content_type='application/json')
+        sparks = SparksRequest(token='testing-token')
+
+        def failing_handler(feed, items):
+            if items[0]['id'] == 3:
+                raise RuntimeError('crash')
+            handled.extend(item['id'] for item in items)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feeds.json')
+            handled = []
+            sync = FeedSync(FileCheckpointStore(path), limit=2)
+            sync.add_feed('sparks.timeline', sparks.timeline)
+            with self.assertRaises(RuntimeError):
+                sync.sync('sparks.timeline', failing_handler)
+            self.assertEqual((handled, sync.checkpoint('sparks.timeline')),
+                             ([1, 2], 2))
+
+            # After a restart, the sync goes on from the checkpoint.
+            sync = FeedSync(FileCheckpointStore(path), limit=2)
+            sync.add_feed('sparks.timeline', sparks.timeline)
+            self.assertEqual(sync.sync_all(lambda feed, items: handled.extend(
+                item['id'] for item in items)), {'sparks.timeline': 3})
+            self.assertEqual(handled, [1, 2, 3, 4, 5])
+
+            # Once caught up, a sync costs one request.
+            calls = len(responses.calls)
+            self.assertEqual(sync.sync('sparks.timeline', failing_handler), 0)
+            self.assertEqual(len(responses.calls), calls + 1)
+
+    def test_sqlite_checkpoint_store(self):
+        """
+        The SQLite store keeps the checkpoints of every feed.
+
+        :return: nothing as is a test case.
+
+        """
+        store = SQLiteCheckpointStore()
+        self.assertIsNone(store.get('iocs.timeline'))
+        store.set('iocs.timeline', 120)
+        store.set('tags.mafia.sparks', 7)
+        store.set('iocs.timeline', 130)
+        self.assertEqual(store.all(), {'iocs.timeline': 130,
+                                       'tags.mafia.sparks': 7})
+        store.close()
+
+
+class MirrorTests(unittest.TestCase):
+    """
+    Tests oriented to verify the local mirror store.
+
+    """
+    def setUp(self):
+        self.mirror = MirrorStore()
+        self.mirror.add_sparks({'items': [
+            {'id': 1, 'title': 'Phishing wave', 'description': 'mail',
+             'created_at': '2020-11-01T10:00:00Z',
+             'user': {'username': 'analyst'},
+             'tags': [{'slug': 'phishing', 'name': 'Phishing'}]},
+            {'id': 2, 'title': 'Mafia botnet', 'description': 'c2 servers',
+             'created_at': '2020-11-02T10:00:00Z',
+             'user': {'username': 'hunter'}, 'tags': []}]})
+        self.mirror.sync_handler('tags.mafia.sparks', [
+            Spark(spark_id=2, title='Mafia botnet',
+                  description='c2 servers', user={'username': 'hunter'})])
+        self.mirror.add_iocs([
+            {'id': 10, 'spark_id': 1, 'content': 'evil.example.com',
+             'type': 'DOMAIN', 'created_at': '2020-11-01T10:00:00Z'},
+            {'id': 11, 'spark_id': 2, 'content': '10.0.0.1', 'type': 'IPv4',
+             'created_at': '2020-11-02T10:00:00Z'},
+            {'id': 12, 'spark_id': 2, 'content': 'evil.example.org',
+             'type': 'DOMAIN', 'created_at': '2020-11-03T10:00:00Z'}])
+
+    def tearDown(self):
+        self.mirror.close()
+
+    def test_indexed_queries(self):
+        """
+        The mirror answers queries by tag, user, spark, type and time.
+
+        :return: nothing as is a test case.
+
+        """
+        def ids(items):
+            return [item['id'] for item in items]
+
+        self.assertEqual(self.mirror.counts()['sparks'], 2)
+        self.assertEqual(ids(self.mirror.sparks(tag='phishing')), [1])
+        self.assertEqual(ids(self.mirror.sparks(tag='mafia')), [2])
+        self.assertEqual(ids(self.mirror.sparks(username='hunter')), [2])
+        self.assertEqual(ids(self.mirror.iocs(spark_id=2)), [12, 11])
+        self.assertEqual(ids(self.mirror.iocs(
+            ioc_type='DOMAIN', created_after='2020-11-02')), [12])
+        self.assertEqual(ids(self.mirror.iocs(content='10.0.0.1')), [11])
+        self.assertEqual(ids(self.mirror.iocs(tag='mafia', limit=1)), [12])
+        self.assertEqual(self.mirror.spark(2)['title'], 'Mafia botnet')
+
+    @responses.activate
+    def test_offline_search(self):
+        """
+        With a mirror, search does not send any request.
+
+        :return: nothing as is a test case.
+
+        """
+        iocs = IocsRequest(token='testing-token', mirror=self.mirror)
+        results = iocs.search(search_term='EVIL', since_id=10)
+        self.assertEqual([item['id'] for item in results], [12])
+        results = iocs.search(search_term='evil', tag='phishing',
+                              as_json=False)
+        self.assertEqual([item['id'] for item in json.loads(results)], [10])
+        sparks = SparksRequest(token='testing-token', mirror=self.mirror)
+        self.assertEqual([item['id'] for item in sparks.search(
+            search_term='c2', limit=5)], [2])
+        self.assertEqual(len(responses.calls), 0)
+
+    def test_search_wildcards(self):
+        """
+        The LIKE wildcards of a search term match literally.
+
+        :return: nothing as is a test case.
+
+        """
+        self.mirror.add_iocs([
+            {'id': 13, 'spark_id': 2, 'content': 'http://evil.example/a_b%',
+             'type': 'URL', 'created_at': '2020-11-04T10:00:00Z'}])
+        self.assertEqual([item['id'] for item in self.mirror.search(
+            'iocs', '_')], [13])
+        self.assertEqual([item['id'] for item in self.mirror.search(
+            'iocs', 'b%')], [13])
+        self.assertEqual(self.mirror.search('sparks', '%'), [])
+
+    def test_search_tags_filters(self):
+        """
+        The tags search applies the tag and since_id filters, as the online
+        search does.
+
+        :return: nothing as is a test case.
+
+        """
+        self.mirror.add_tags([{'id': 1, 'slug': 'mafia', 'name': 'Mafia'},
+                              {'id': 2, 'slug': 'mafia-c2', 'name': 'C2'},
+                              {'id': 3, 'slug': 'mafiaboy', 'name': 'Boy'}])
+
+        def slugs(**kwargs):
+            return [item['slug']
+                    for item in self.mirror.search('tags', 'mafia', **kwargs)]
+
+        self.assertEqual(slugs(), ['mafia', 'mafia-c2', 'mafiaboy'])
+        self.assertEqual(slugs(tag='mafia-c2'), ['mafia-c2'])
+        self.assertEqual(slugs(since_id=1), ['mafia-c2', 'mafiaboy'])
+        self.assertEqual(slugs(since_id=1, limit=1), ['mafia-c2'])
+
+    def test_sync_handler_routing(self):
+        """
+        The feed kind decides where the items go, whatever the tag slug or
+        username of the feed.
+
+        :return: nothing as is a test case.
+
+        """
+        self.mirror.sync_handler('tags.iocs.sparks', [
+            {'id': 3, 'title': 'Loader', 'user': {'username': 'analyst'}}])
+        self.mirror.sync_handler('users.sparks.iocs', [
+            {'id': 14, 'spark_id': 3, 'content': 'loader.example.com',
+             'type': 'DOMAIN'}])
+        self.assertEqual([item['id'] for item in self.mirror.sparks(
+            tag='iocs')], [3])
+        self.assertEqual(self.mirror.iocs(spark_id=3)[0]['id'], 14)
+        self.assertEqual(self.mirror.counts()['sparks'], 3)
+        self.assertRaises(Exception, self.mirror.sync_handler,
+                          'tags.sparks', [])
+
+
+class CrawlTests(unittest.TestCase):
+    """
+    Tests oriented to verify the bulk crawl.
+
+    """
+    @responses.activate
+    def test_crawl_many(self):
+        """
+        Repeated inputs are crawled once and a failed one does not stop the
+        batch.
+
+        :return: nothing as is a test case.
+
+        """
+        def crawl_callback(request):
+            url = json.loads(request.body)['url']
+            if 'broken' in url:
+                return 500, {}, 'Internal error'
+            return 200, {}, json.dumps({'url': url, 'iocs': 1})
+
+        responses.add_callback(responses.POST,
+                               '%s%s' % (BASE_API_URL, BASE_CRAWL_URL),
+                               callback=crawl_callback,
+                               content_type='application/json')
+        crawler = CrawlerRequest(token='testing-token')
+        results = list(crawler.crawl_many(['HTTP://Example.com/a/',
+                                           'http://example.com/a#top',
+                                           '  ',
+                                           'http://broken.example.com',
+                                           'example.org'],
+                                          workers=2,
+                                          ordered=True,
+                                          as_json=True))
+
+        self.assertEqual(len(responses.calls), 3)
+        self.assertEqual([(result.term, result.normalized)
+                          for result in results],
+                         [('HTTP://Example.com/a/', 'http://example.com/a'),
+                          ('http://broken.example.com',
+                           'http://broken.example.com'),
+                          ('example.org', 'http://example.org')])
+        self.assertEqual(results[0].result,
+                         {'url': 'http://example.com/a', 'iocs': 1})
+        self.assertIsNone(results[0].error)
+        self.assertIsNone(results[1].result)
+        self.assertIsInstance(results[1].error, Exception)
+        self.assertIsNone(results[2].error)
+
+    def test_async_crawl_many(self):
+        """
+        The asyncio crawler streams the results of the unique inputs.
+
+        :return: nothing as is a test case.
+
+        """
+        transport = FakeAsyncTransport()
+        crawler = AsyncCrawlerRequest(token='testing-token',
+                                      transport=transport)
+
+        async def run():
+            return [result async for result in crawler.crawl_many(
+                ['mafia', ' mafia ', 'botnet'], is_text=True, ordered=True)]
+
+        results = asyncio.run(run())
+        self.assertEqual([result.normalized for result in results],
+                         ['mafia', 'botnet'])
+        self.assertEqual([call[2]['json']['text'] for call in transport.calls],
+                         [True, True])
+
+
+class UploadTests(unittest.TestCase):
+    """
+    Tests oriented to verify the streamed malware uploads.
+
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sample.bin')
+        self.sample = bytes(range(256)) * 1000
+        with open(self.path, 'wb') as sample:
+            sample.write(self.sample)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_multipart_file(self):
+        """
+        The body is read in bounded chunks, is valid multipart and the file
+        is closed once sent.
+
+        :return: nothing as is a test case.
+
+        """
+        progress = []
+        body = MultipartFile(self.path, filename='sample.bin',
+                             chunk_size=4096,
+                             progress=lambda sent, total: progress.append(
+                                 (sent, total)))
+        chunks = list(body)
+        self.assertEqual(len(b''.join(chunks)), len(body))
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), 4096)
+        self.assertEqual(progress[-1], (len(self.sample), len(self.sample)))
+        self.assertIsNone(body._file)  # pylint: disable=protected-access
+
+        message = email.message_from_bytes(
+            ('Content-Type: %s\r\n\r\n'
+             % body.headers()['Content-Type']).encode() + b''.join(chunks))
+        part = message.get_payload()[0]
+        self.assertEqual(part.get_filename(), 'sample.bin')
+        self.assertEqual(part.get_payload(decode=True), self.sample)
+
+    def test_multipart_file_async(self):
+        """
+        Iterated asynchronously, the body is the same and the file is read
+        outside the event loop thread.
+
+        :return: nothing as is a test case.
+
+        """
+        threads = set()
+        read_file = MultipartFile._read_file  # pylint: disable=W0212
+
+        def recorded_read_file(body, size):
+            threads.add(threading.current_thread())
+            return read_file(body, size)
+
+        async def read(body):
+            return [chunk async for chunk in body]
+
+        body = MultipartFile(self.path, chunk_size=4096)
+        with mock.patch.object(MultipartFile, '_read_file',
+                               recorded_read_file):
+            chunks = asyncio.run(read(body))
+        self.assertEqual(len(b''.join(chunks)), len(body))
+        self.assertIn(self.sample, b''.join(chunks))
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    @responses.activate
+    def test_upload(self):
+        """
+        MalwaresRequest.upload streams the sample as multipart/form-data.
+
+        :return: nothing as is a test case.
+
+        """
+        received = {}
+
+        def upload_callback(request):
+            received['content_type'] = request.headers['Content-Type']
+            received['body'] = request.body
+            return 200, {}, json.dumps({'uploadStatus': 'ok'})
+
+        responses.add_callback(responses.POST,
+                               '%s%s%s' % (BASE_API_URL, BASE_MALWARES_URL,
+                                           BASE_MALWARES_UPLOAD_URL),
+                               callback=upload_callback,
+                               content_type='application/json')
+        progress = []
+        malwares = MalwaresRequest(token='testing-token')
+        results = malwares.upload(self.path,
+                                  progress=lambda sent, total: progress.append(
+                                      sent))
+        self.assertEqual(json.loads(results), {'uploadStatus': 'ok'})
+        self.assertTrue(received['content_type'].startswith(
+            'multipart/form-data; boundary='))
+        self.assertIn(self.sample, received['body'])
+        self.assertEqual(progress[-1], len(self.sample))
+        self.assertRaises(Exception, malwares.upload,
+                          os.path.join(self.directory.name, 'missing.bin'))
+
+
+class IngestTests(unittest.TestCase):
+    """
+    Tests oriented to verify the directory ingestion.
+
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.samples = {'a.bin': b'sample a', 'b.bin': b'sample a',
+                        'c.bin': b'sample c', 'd.bin': b'sample d',
+                        os.path.join('old', 'e.bin'): b'sample e'}
+        os.mkdir(os.path.join(self.directory.name, 'old'))
+        for name, content in self.samples.items():
+            with open(os.path.join(self.directory.name, name), 'wb') as sample:
+                sample.write(content)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hash_files(self):
+        """
+        The process pool gives the same md5 and sha256 as hashlib.
+
+        :return: nothing as is a test case.
+
+        """
+        paths = [os.path.join(self.directory.name, name)
+                 for name in sorted(self.samples)]
+        hashed = list(hash_files(paths, workers=2))
+        self.assertEqual(hashed, [(path, hash_file(path), None)
+                                  for path in paths])
+        self.assertEqual(hashed[0][1][1:],
+                         (hashlib.md5(b'sample a').hexdigest(),
+                          hashlib.sha256(b'sample a').hexdigest(), 8))
+
+    @responses.activate
+    def test_upload_directory(self):
+        """
+        Only the samples not in the ledger, not repeated and unknown by the
+        server are uploaded, and a second run uploads nothing.
+
+        :return: nothing as is a test case.
+
+        """
+        on_server = hashlib.sha256(b'sample c').hexdigest()
+        malwares_url = '%s%s' % (BASE_API_URL, BASE_MALWARES_URL)
+
+        def show_callback(request):
+            if request.url.endswith(on_server):
+                return 200, {}, json.dumps({'id': on_server})
+            return 404, {}, 'Not found'
+
+        responses.add_callback(responses.GET,
+                               re.compile('%s/[0-9a-f]+$' % malwares_url),
+                               callback=show_callback)
+        responses.add(responses.POST,
+                      '%s%s' % (malwares_url, BASE_MALWARES_UPLOAD_URL),
+                      json={'uploadStatus': 'ok'})
+
+        ledger = UploadLedger()
+        ledger.add(hashlib.sha256(b'sample e').hexdigest(), None, 'e.bin', 8)
+        malwares = MalwaresRequest(token='testing-token')
+        results = {os.path.relpath(result.path, self.directory.name):
+                   result.status
+                   for result in malwares.upload_directory(
+                       self.directory.name, ledger=ledger, hash_workers=0)}
+        self.assertEqual(results, {'a.bin': 'uploaded', 'b.bin': 'duplicate',
+                                   'c.bin': 'server', 'd.bin': 'uploaded',
+                                   os.path.join('old', 'e.bin'): 'ledger'})
+        self.assertEqual(len(ledger), 4)
+
+        uploads = len(responses.calls)
+        self.assertEqual({result.status for result in
+                          malwares.upload_directory(self.directory.name,
+                                                    ledger=ledger,
+                                                    hash_workers=0)},
+                         {'ledger'})
+        self.assertEqual(len(responses.calls), uploads)
+
+    @responses.activate
+    def test_check_errors_fail_files(self):
+        """
+        An error of the server check other than 404 fails the file instead
+        of uploading it.
+
+        :return: nothing as is a test case.
+
+        """
+        malwares_url = '%s%s' % (BASE_API_URL, BASE_MALWARES_URL)
+        responses.add(responses.GET,
+                      re.compile('%s/[0-9a-f]+$' % malwares_url),
+                      body='Unauthorized', status=401)
+
+        malwares = MalwaresRequest(token='testing-token')
+        results = list(malwares.upload_directory(self.directory.name,
+                                                 hash_workers=0))
+        failed = [result for result in results if result.status == 'failed']
+        self.assertEqual(len(failed), 4)
+        self.assertEqual({result.error.status_code for result in failed},
+                         {401})
+        self.assertEqual({call.request.method for call in responses.calls},
+                         {'GET'})
+
+    @responses.activate
+    def test_unreadable_files_fail(self):
+        """
+        A file removed before it is hashed fails alone, and the others are
+        still uploaded.
+
+        :return: nothing as is a test case.
+
+        """
+        malwares_url = '%s%s' % (BASE_API_URL, BASE_MALWARES_URL)
+        responses.add(responses.GET,
+                      re.compile('%s/[0-9a-f]+$' % malwares_url),
+                      body='Not found', status=404)
+        responses.add(responses.POST,
+                      '%s%s' % (malwares_url, BASE_MALWARES_UPLOAD_URL),
+                      json={'uploadStatus': 'ok'})
+        walk = ingest.iter_files
+
+        def vanishing_files(directory, recursive):
+            for path in walk(directory, recursive):
+                if path.endswith('d.bin'):
+                    os.remove(path)
+                yield path
+
+        malwares = MalwaresRequest(token='testing-token')
+        with mock.patch('blueliv.ingest.iter_files', vanishing_files):
+            for hash_workers in (0, 2):
+                with open(os.path.join(self.directory.name, 'd.bin'),
+                          'wb') as sample:
+                    sample.write(b'sample d')
+                results = {os.path.basename(result.path): result
+                           for result in malwares.upload_directory(
+                               self.directory.name, hash_workers=hash_workers)}
+                self.assertEqual(results['d.bin'].status, 'failed')
+                self.assertIsNone(results['d.bin'].sha256)
+                self.assertIsInstance(results['d.bin'].error, OSError)
+                self.assertEqual(results['c.bin'].status, 'uploaded')
+                self.assertEqual(len(results), 5)
+
+
+class MetricsTests(unittest.TestCase):
+    """
+    Tests oriented to verify the metrics registry.
+
+    """
+    def test_histogram_quantiles(self):
+        """
+        Quantiles are estimated within the bucket resolution.
+
+        :return: nothing as is a test case.
+
+        """
+        histogram = Histogram()
+        for millisecond in range(1, 1001):
+            histogram.observe(millisecond / 1000)
+
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 1000)
+        self.assertAlmostEqual(summary['p50'], 0.5, delta=0.01)
+        self.assertAlmostEqual(summary['p95'], 0.95, delta=0.05)
+        self.assertAlmostEqual(summary['p99'], 0.99, delta=0.02)
+        self.assertLessEqual(summary['p99'], summary['max'])
+        self.assertEqual(histogram.cumulative()[-1], (float('inf'), 1000))
+
+    @responses.activate
+    def test_transport_metrics(self):
+        """
+        The transport records calls, status codes, bytes and cache hits per
+        endpoint family, exported as a snapshot and in Prometheus format.
+        Only the calls sent to the network are observed.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s/42' % (BASE_API_URL, BASE_SPARKS_URL),
+                      body='{"id": 42}', status=200)
+        responses.add(responses.GET,
+                      '%s%s' % (BASE_API_URL, BASE_TAGS_URL),
+                      body='Not found', status=404)
+        metrics = MetricsRegistry()
+        transport = BluelivTransport(metrics=metrics, cache=ResponseCache())
+        sparks = SparksRequest(token='testing-token', transport=transport)
+        tags = TagsRequest(token='testing-token', transport=transport)
+
+        sparks.get('42')
+        sparks.get('42')
+        self.assertRaises(Exception, tags.list)
+
+        snapshot = sparks.get_metrics()
+        self.assertEqual(sparks.request_count, 2)
+        self.assertEqual(snapshot['sparks']['calls'], 1)
+        self.assertEqual(snapshot['sparks']['bytes'], 10)
+        self.assertEqual(snapshot['sparks']['status'], {'200': 1})
+        self.assertEqual(snapshot['sparks']['counters']['cache_hits'], 1)
+        self.assertEqual(snapshot['tags']['status'], {'404': 1})
+        self.assertGreater(snapshot['sparks']['latency']['p95'], 0)
+
+        exported = metrics.to_prometheus()
+        self.assertIn('blueliv_requests_total{family="tags",status="404"} 1',
+                      exported)
+        self.assertIn('blueliv_request_duration_seconds_count'
+                      '{family="sparks"} 1', exported)
+        self.assertIn('blueliv_cache_hits_total{family="sparks"} 1',
+                      exported)
+
+
+class HooksTests(unittest.TestCase):
+    """
+    Tests oriented to verify the request lifecycle hooks.
+
+    """
+    @responses.activate
+    def test_lifecycle_hooks(self):
+        """
+        Instance and global hooks receive the same context through the
+        events of a request, and a failing hook does not break it.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s/42' % (BASE_API_URL, BASE_SPARKS_URL),
+                      body='{"id": 42}', status=200)
+        responses.add(responses.GET,
+                      '%s%s/43' % (BASE_API_URL, BASE_SPARKS_URL),
+                      body='Not found', status=404)
+        events = []
+
+        def trace(context):
+            events.append((context['event'], context['url'].rsplit('/')[-1],
+                           context.get('status_code', None)))
+            context.setdefault('span', len(events))
+
+        def broken(context):
+            raise RuntimeError('broken hook')
+
+        sparks = SparksRequest(token='testing-token',
+                               transport=BluelivTransport())
+        for event in ('pre_request', 'post_response', 'on_error'):
+            sparks.add_hook(event, trace)
+        register_hook('pre_request', broken)
+        register_hook('on_error', broken)
+        try:
+            self.assertEqual(sparks.get('42'), '{"id": 42}')
+            self.assertRaises(Exception, sparks.get, '43')
+        finally:
+            self.assertTrue(unregister_hook('pre_request', broken))
+            self.assertTrue(unregister_hook('on_error', broken))
+
+        self.assertEqual(events, [('pre_request', '42', None),
+                                  ('post_response', '42', 200),
+                                  ('pre_request', '43', None),
+                                  ('on_error', '43', 404)])
+        self.assertRaises(Exception, sparks.add_hook, 'post_request', trace)
+
+    @responses.activate
+    def test_hook_context(self):
+        """
+        The post_response context has the request details, size and timings.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.GET,
+                      '%s%s%s' % (BASE_API_URL, BASE_SPARKS_URL,
+                                  BASE_SPARKS_TIMELINE_URL),
+                      body='[{"id": 1}]', status=200)
+        contexts = []
+        sparks = SparksRequest(token='testing-token',
+                               transport=BluelivTransport())
+
+        def collect(context):
+            contexts.append(dict(context))
+
+        sparks.add_hook('post_response', collect)
+        sparks.timeline(limit=5)
+        self.assertTrue(sparks.remove_hook('post_response', collect))
+        sparks.timeline(limit=5)
+
+        self.assertEqual(len(contexts), 1)
+        context = contexts[0]
+        self.assertEqual((context['method'], context['params'],
+                          context['category'], context['size']),
+                         ('GET', {'limit': 5}, 'sparks', 11))
+        self.assertGreaterEqual(context['timings']['total'],
+                                context['timings']['ttfb'])
+
+
+class LoggingTests(unittest.TestCase):
+    """
+    Tests oriented to verify the structured logging.
+
+    """
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = configure_logging(logging.DEBUG, 'json', self.stream)
+
+    def tearDown(self):
+        logger = logging.getLogger('blueliv')
+        logger.removeHandler(self.handler)
+        logger.setLevel(logging.NOTSET)
+
+    def events(self):
+        """
+        :return: list with the JSON lines logged.
+        """
+        return [json.loads(line) for line in self.stream.getvalue().split('\n')
+                if line]
+
+    @responses.activate
+    def test_request_events(self):
+        """
+        A request logs JSON lines with its details, never the token.
+
+        :return: nothing as is a test case.
+
+        """
+        responses.add(responses.POST,
+                      '%s%s' % (BASE_API_URL, BASE_SPARKS_URL),
+                      body='{"id": 7}', status=200)
+        sparks = SparksRequest(token='secret-token',
+                               transport=BluelivTransport())
+        sparks.publish('title', 'description')
+
+        self.assertNotIn('secret-token', self.stream.getvalue())
+        events = self.events()
+        self.assertEqual([event['event'] for event in events],
+                         ['request.prepared', 'response.received'])
+        self.assertEqual((events[0]['method'], events[0]['body'],
+                          events[0]['headers']['Authorization']),
+                         ('POST', 'json', '<redacted>'))
+        self.assertEqual((events[1]['level'], events[1]['status']),
+                         ('DEBUG', 200))
+
+        # With the level off, the fields are not even computed.
+        logging.getLogger('blueliv').setLevel(logging.WARNING)
+        responses.add(responses.GET,
+                      '%s%s/7' % (BASE_API_URL, BASE_SPARKS_URL),
+                      body='{"id": 7}', status=200)
+        with mock.patch('blueliv.core.redact_headers') as redact, \
+                mock.patch.object(log, 'debug') as debug:
+            sparks.publish('title', 'description')
+            sparks.get('7')
+        redact.assert_not_called()
+        debug.assert_not_called()
+        self.assertEqual(len(self.events()), 2)
+
+    def test_sampling_and_level(self):
+        """
+        Sampled events log one of every N occurrences, and nothing is
+        logged below the level.
+
+        :return: nothing as is a test case.
+
+        """
+        log = StructuredLogger()
+        for number in range(10):
+            log.info('loop.step', sample=4, number=number)
+        logging.getLogger('blueliv').setLevel(logging.INFO)
+        log.debug('loop.hidden')
+
+        events = self.events()
+        self.assertEqual([event['number'] for event in events], [0, 4, 8])
+        self.assertEqual({event['sampled'] for event in events}, {4})
+
+
+class StubApiTests(unittest.TestCase):
+    """
+    Tests oriented to verify the request classes end to end against the
+    local API stub of the benchmarks (no network needed).
+
+    """
+    def test_stub_routes(self):
+        """
+        Every route family answers pages of the configured size, and
+        unknown paths answer 404.
+
+        :return: nothing as is a test case.
+
+        """
+        with ApiStubServer(items=3) as server:
+            transport = BluelivTransport(coalesce=False)
+            clients = {}
+            for request_class in (SparksRequest, IocsRequest, TagsRequest,
+                                  UsersRequest, MalwaresRequest,
+                                  CrawlerRequest):
+                client = request_class(token='testing-token',
+                                       transport=transport)
+                client._url = server.api_url  # pylint: disable=W0212
+                clients[request_class] = client
+
+            sparks = clients[SparksRequest]
+            pages = [sparks.timeline(limit=3, as_json=True),
+                     sparks.iocs(1, as_json=True),
+                     sparks.search('emotet'),
+                     clients[IocsRequest].discover(as_json=True),
+                     clients[TagsRequest].list_sparks('mafia', as_json=True),
+                     clients[UsersRequest].list_iocs('analyst',
+                                                     as_json=True),
+                     clients[MalwaresRequest].list(as_json=True)['data'],
+                     clients[CrawlerRequest].crawl('https://example.com/',
+                                                   as_json=True)['data']]
+            self.assertEqual([len(page) for page in pages], [3] * 8)
+            self.assertEqual(sparks.get('7'), sparks.get('8'))
+            self.assertRaises(Exception, sparks.request, resource='/nothing')
+            self.assertEqual(server.api.stats()['requests'], 11)
+            transport.close()
+
+    def test_async_session_per_loop(self):
+        """
+        The asyncio transport opens a session per event loop and closes it
+        when its loop shuts down.
+
+        :return: nothing as is a test case.
+
+        """
+        if aio.aiohttp is None:
+            self.skipTest('aiohttp is not installed')
+
+        transport = AsyncBluelivTransport()
+        sessions = []
+
+        async def fetch(url):
+            response = await transport.request('GET', url)
+            sessions.append(transport.session)
+            return response.status_code
+
+        with ApiStubServer(items=3) as server:
+            url = server.api_url + '/tags'
+            self.assertEqual([asyncio.run(fetch(url)) for _ in range(2)],
+                             [200, 200])
+        self.assertIsNot(sessions[0], sessions[1])
+        self.assertTrue(all(session.closed for session in sessions))
+
 
 class RemoteEndpointTests(unittest.TestCase):
     """